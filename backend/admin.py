@@ -1,12 +1,29 @@
-from sqladmin import Admin, ModelView
+from html import escape
+from typing import List, Optional
+import asyncio
+import os
+
+from sqladmin import Admin, ModelView, action
 from sqladmin.authentication import AuthenticationBackend
+from sqladmin.pagination import Pagination
 from starlette.requests import Request
-from starlette.responses import RedirectResponse
+from starlette.responses import HTMLResponse, RedirectResponse
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import column, func, select, table
+from sqlalchemy.orm import Session, joinedload
 from database import engine, SessionLocal
-from models import User, Plant, Record, PlantRecord
-import os
+from models import User, Plant, Record, PlantRecord, Diary
+import data_version  # noqa: F401  (admin edits bump the shared data version)
+import delta_sync  # noqa: F401  (admin edits are stamped for delta sync)
+import events
+
+# Above this many rows (by the optimizer's estimate) list pages show an
+# estimated total instead of running COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", "10000"))
+
+_information_schema_tables = table(
+    "TABLES", column("TABLE_SCHEMA"), column("TABLE_NAME"), column("TABLE_ROWS"), schema="information_schema"
+)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -39,6 +56,89 @@ class AdminAuth(AuthenticationBackend):
 # Authentication backend
 authentication_backend = AdminAuth(secret_key=os.getenv("JWT_SECRET_KEY", "your-secret-key"))
 
+class LargeTableAdmin(ModelView):
+    """List view for tables that keep growing
+
+    * Pages are cut on the primary key alone (an index-only scan), then only
+      the rows of the page are loaded, with their relationships joined in
+      the same query (a "deferred join" instead of OFFSET over full rows).
+    * The unfiltered total comes from the table statistics once the table
+      is large; an exact COUNT(*) only runs for small tables and searches.
+    """
+    page_size = 50
+    page_size_options = [25, 50, 100]
+
+    def _estimated_rows(self) -> Optional[int]:
+        if engine.dialect.name != "mysql":
+            return None
+        with engine.connect() as conn:
+            return conn.execute(
+                select(_information_schema_tables.c.TABLE_ROWS).where(
+                    _information_schema_tables.c.TABLE_SCHEMA == func.database(),
+                    _information_schema_tables.c.TABLE_NAME == self.model.__tablename__,
+                )
+            ).scalar()
+
+    async def count(self, request: Request, stmt=None) -> int:
+        if stmt is None:
+            estimate = await asyncio.to_thread(self._estimated_rows)
+            if estimate is not None and estimate > ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return await super().count(request, stmt)
+
+    async def list(self, request: Request) -> Pagination:
+        page = int(request.query_params.get("page", 1))
+        page_size = int(request.query_params.get("pageSize", 0))
+        page_size = min(page_size or self.page_size, max(self.page_size_options))
+        search = request.query_params.get("search", None)
+
+        stmt = self.sort_query(self.list_query(request), request)
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+            count = await self.count(request, select(func.count()).select_from(stmt))
+        else:
+            count = await self.count(request)
+
+        # Two queries: MySQL does not allow LIMIT in an IN subquery
+        pk = self.pk_columns[0]
+        page_ids = await self._run_query(
+            stmt.with_only_columns(pk).limit(page_size).offset((page - 1) * page_size)
+        )
+        rows = []
+        if page_ids:
+            rows_stmt = self.sort_query(select(self.model).where(pk.in_(page_ids)), request)
+            for relation in self._list_relations:
+                rows_stmt = rows_stmt.options(joinedload(relation))
+            rows = await self._run_query(rows_stmt)
+        return Pagination(rows=rows, page=page, page_size=page_size, count=count)
+
+
+def selected_ids(request: Request) -> List[int]:
+    """Primary keys ticked on a list page (``pks`` query parameter of an action)"""
+    return [int(pk) for pk in request.query_params.get("pks", "").split(",") if pk.isdigit()]
+
+
+def bulk_result_redirect(request: Request, view: ModelView) -> RedirectResponse:
+    return RedirectResponse(request.url_for("admin:list", identity=view.identity), status_code=302)
+
+
+def bump_record_versions(db: Session, record_ids):
+    """Invalidate the ETags of records whose plant records were changed in bulk
+
+    Bulk statements bypass the ``version_id_col`` increment of a flush.
+    """
+    if record_ids:
+        db.query(Record).filter(Record.id.in_(record_ids)).update(
+            {Record.version: Record.version + 1}, synchronize_session=False
+        )
+
+
+def notify_bulk_change(db: Session, diary_ids):
+    """Tell live clients of each diary to reload (one event per diary, not per row)"""
+    for diary_id in diary_ids:
+        events.emit(db, "resync", diary_id)
+
+
 # Admin views
 class UserAdmin(ModelView, model=User):
     column_list = [User.id, User.username, User.created_at]
@@ -51,7 +151,7 @@ class UserAdmin(ModelView, model=User):
     name_plural = "ユーザー管理"
 
 class PlantAdmin(ModelView, model=Plant):
-    column_list = [Plant.id, Plant.name, Plant.display_order, Plant.is_active, Plant.created_at]
+    column_list = [Plant.id, Plant.diary_id, Plant.name, Plant.display_order, Plant.is_active, Plant.created_at]
     column_searchable_list = [Plant.name]
     column_sortable_list = [Plant.id, Plant.name, Plant.display_order, Plant.created_at]
     can_create = True
@@ -60,26 +160,181 @@ class PlantAdmin(ModelView, model=Plant):
     name = "植物種類"
     name_plural = "植物種類管理"
 
-class RecordAdmin(ModelView, model=Record):
-    column_list = [Record.id, Record.record_date, Record.weather, Record.temperature, Record.created_at]
+class DiaryAdmin(ModelView, model=Diary):
+    column_list = [Diary.id, Diary.name, Diary.is_active, Diary.created_at]
+    column_sortable_list = [Diary.id, Diary.name]
+    form_excluded_columns = [Diary.created_at, Diary.updated_at]
+    can_create = True
+    can_edit = True
+    can_delete = False
+    name = "日記"
+    name_plural = "日記管理"
+    
+    async def after_model_change(self, data, model, is_created, request):
+        import asyncio
+        from diaries import deactivated
+        from init_data import init_diary
+        
+        if is_created:
+            def setup():
+                db = SessionLocal()
+                try:
+                    init_diary(db, model.id)
+                finally:
+                    db.close()
+            await asyncio.to_thread(setup)
+        if not model.is_active:
+            await asyncio.to_thread(deactivated, model.id)
+
+class RecordAdmin(LargeTableAdmin, model=Record):
+    column_list = [Record.id, Record.diary_id, Record.record_date, Record.weather, Record.temperature, Record.created_at]
     column_searchable_list = [Record.record_date]
-    column_sortable_list = [Record.id, Record.record_date, Record.created_at]
+    # Primary key / (diary_id, record_date) order only
+    column_sortable_list = [Record.id, Record.diary_id]
+    column_default_sort = (Record.id, True)
     column_filters = [Record.weather, Record.record_date]
+    # Maintained by optimistic locking
+    form_excluded_columns = [Record.version]
     can_create = True
     can_edit = True
     can_delete = True
     name = "記録"
     name_plural = "記録管理"
+    
+    @action(
+        name="bulk_delete",
+        label="まとめて削除",
+        confirmation_message="選択した記録と植物記録を削除しますか？",
+    )
+    async def bulk_delete(self, request: Request):
+        record_ids = selected_ids(request)
+        
+        def delete_records():
+            db = SessionLocal()
+            try:
+                diary_ids = {row.diary_id for row in db.query(Record.diary_id).filter(Record.id.in_(record_ids)).distinct()}
+                # Two statements for the whole selection (children first)
+                db.query(PlantRecord).filter(PlantRecord.record_id.in_(record_ids)).delete(synchronize_session=False)
+                db.query(Record).filter(Record.id.in_(record_ids)).delete(synchronize_session=False)
+                notify_bulk_change(db, diary_ids)
+                db.commit()
+            finally:
+                db.close()
+        
+        if record_ids:
+            await asyncio.to_thread(delete_records)
+        return bulk_result_redirect(request, self)
 
-class PlantRecordAdmin(ModelView, model=PlantRecord):
-    column_list = [PlantRecord.id, PlantRecord.record_id, PlantRecord.plant_id, 
+class PlantRecordAdmin(LargeTableAdmin, model=PlantRecord):
+    column_list = [PlantRecord.id, PlantRecord.diary_id, PlantRecord.record, PlantRecord.plant,
                    PlantRecord.height, PlantRecord.comment, PlantRecord.created_at]
-    column_sortable_list = [PlantRecord.id, PlantRecord.record_id, PlantRecord.created_at]
+    # Record and plant of each row come from the same query (joined in LargeTableAdmin.list)
+    column_formatters = {
+        PlantRecord.record: lambda m, a: m.record.record_date.isoformat() if m.record else "",
+        PlantRecord.plant: lambda m, a: m.plant.name if m.plant else "",
+    }
+    column_labels = {PlantRecord.record: "record_date", PlantRecord.plant: "plant"}
+    # Primary key order only
+    column_sortable_list = [PlantRecord.id]
+    column_default_sort = (PlantRecord.id, True)
     can_create = True
     can_edit = True
     can_delete = True
     name = "植物記録"
     name_plural = "植物記録管理"
+    
+    @action(
+        name="bulk_delete",
+        label="まとめて削除",
+        confirmation_message="選択した植物記録を削除しますか？",
+    )
+    async def bulk_delete(self, request: Request):
+        plant_record_ids = selected_ids(request)
+        
+        def delete_plant_records():
+            db = SessionLocal()
+            try:
+                affected = (
+                    db.query(PlantRecord.diary_id, PlantRecord.record_id)
+                    .filter(PlantRecord.id.in_(plant_record_ids))
+                    .distinct()
+                    .all()
+                )
+                db.query(PlantRecord).filter(PlantRecord.id.in_(plant_record_ids)).delete(synchronize_session=False)
+                bump_record_versions(db, {row.record_id for row in affected})
+                notify_bulk_change(db, {row.diary_id for row in affected})
+                db.commit()
+            finally:
+                db.close()
+        
+        if plant_record_ids:
+            await asyncio.to_thread(delete_plant_records)
+        return bulk_result_redirect(request, self)
+    
+    @action(name="reassign_plant", label="植物を付け替え")
+    async def reassign_plant(self, request: Request):
+        """Move the selected plant records to another plant of the same diary"""
+        plant_record_ids = selected_ids(request)
+        target = request.query_params.get("plant_id", "")
+        if not plant_record_ids:
+            return bulk_result_redirect(request, self)
+        
+        if not target.isdigit():
+            # Ask for the target plant, then come back with ?plant_id=
+            def load_plants():
+                db = SessionLocal()
+                try:
+                    return db.query(Plant.id, Plant.name, Plant.diary_id).order_by(Plant.diary_id, Plant.display_order).all()
+                finally:
+                    db.close()
+            options = "".join(
+                f'<option value="{plant.id}">[{plant.diary_id}] {escape(plant.name)}</option>'
+                for plant in await asyncio.to_thread(load_plants)
+            )
+            return HTMLResponse(
+                '<!DOCTYPE html><html lang="ja"><meta charset="utf-8"><title>植物を付け替え</title><body>'
+                f'<form method="get"><p>選択した {len(plant_record_ids)} 件の植物記録の付け替え先：</p>'
+                f'<input type="hidden" name="pks" value="{",".join(map(str, plant_record_ids))}">'
+                f'<select name="plant_id">{options}</select> <button type="submit">付け替える</button>'
+                '</form></body></html>'
+            )
+        
+        def reassign():
+            db = SessionLocal()
+            try:
+                plant = db.get(Plant, int(target))
+                if plant is None:
+                    return
+                selected = (
+                    db.query(PlantRecord.id, PlantRecord.record_id)
+                    .filter(PlantRecord.id.in_(plant_record_ids), PlantRecord.diary_id == plant.diary_id)
+                    .all()
+                )
+                # A record keeps at most one entry per plant: skip records
+                # that already have one for the target plant
+                taken = {
+                    record_id for (record_id,) in db.query(PlantRecord.record_id).filter(
+                        PlantRecord.plant_id == plant.id,
+                        PlantRecord.record_id.in_({row.record_id for row in selected}),
+                    )
+                }
+                movable = []
+                for row in selected:
+                    if row.record_id not in taken:
+                        taken.add(row.record_id)
+                        movable.append(row)
+                if movable:
+                    db.query(PlantRecord).filter(PlantRecord.id.in_([row.id for row in movable])).update(
+                        {PlantRecord.plant_id: plant.id}, synchronize_session=False
+                    )
+                    bump_record_versions(db, {row.record_id for row in movable})
+                    notify_bulk_change(db, {plant.diary_id})
+                    db.commit()
+            finally:
+                db.close()
+        
+        await asyncio.to_thread(reassign)
+        return bulk_result_redirect(request, self)
 
 def setup_admin(app):
     """Setup SQLAdmin"""
@@ -93,6 +348,7 @@ def setup_admin(app):
     
     # Add views
     admin.add_view(UserAdmin)
+    admin.add_view(DiaryAdmin)
     admin.add_view(PlantAdmin)
     admin.add_view(RecordAdmin)
     admin.add_view(PlantRecordAdmin)
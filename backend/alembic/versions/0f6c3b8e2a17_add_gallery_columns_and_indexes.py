@@ -0,0 +1,37 @@
+"""Add image dimensions and gallery indexes to plant_records
+
+Revision ID: 0f6c3b8e2a17
+Revises: e41a7d0c9f85
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0f6c3b8e2a17'
+down_revision = 'e41a7d0c9f85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('plant_records', sa.Column('image_width', sa.Integer(), nullable=True))
+    op.add_column('plant_records', sa.Column('image_height', sa.Integer(), nullable=True))
+    # Virtual generated column; indexing it emulates a partial index on
+    # image-bearing rows
+    op.add_column('plant_records', sa.Column('has_image', sa.Boolean(),
+                                             sa.Computed('image_filename IS NOT NULL'), nullable=True))
+    op.create_index('ix_plant_records_gallery', 'plant_records',
+                    ['plant_id', 'has_image', 'record_id'], unique=False)
+    op.create_index('ix_plant_records_gallery_all', 'plant_records',
+                    ['has_image', 'record_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_plant_records_gallery_all', table_name='plant_records')
+    op.drop_index('ix_plant_records_gallery', table_name='plant_records')
+    op.drop_column('plant_records', 'has_image')
+    op.drop_column('plant_records', 'image_height')
+    op.drop_column('plant_records', 'image_width')
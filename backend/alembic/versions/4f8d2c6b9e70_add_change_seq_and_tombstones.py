@@ -0,0 +1,42 @@
+"""Add change_seq columns and tombstones table for delta sync
+
+Revision ID: 4f8d2c6b9e70
+Revises: e2b9f47a0c15
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8d2c6b9e70'
+down_revision = 'e2b9f47a0c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('records', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_records_change_seq'), 'records', ['change_seq'], unique=False)
+    op.add_column('plant_records', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_plant_records_change_seq'), 'plant_records', ['change_seq'], unique=False)
+    op.create_table('tombstones',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=True),
+    sa.Column('change_seq', sa.BigInteger(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tombstones_change_seq'), 'tombstones', ['change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_tombstones_change_seq'), table_name='tombstones')
+    op.drop_table('tombstones')
+    op.drop_index(op.f('ix_plant_records_change_seq'), table_name='plant_records')
+    op.drop_column('plant_records', 'change_seq')
+    op.drop_index(op.f('ix_records_change_seq'), table_name='records')
+    op.drop_column('records', 'change_seq')
@@ -0,0 +1,30 @@
+"""Add data_versions table
+
+Revision ID: 7c1d2e9a4b30
+Revises: 406ee135d0b9
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d2e9a4b30'
+down_revision = '406ee135d0b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    data_versions = op.create_table('data_versions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_versions, [{'id': 1, 'version': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('data_versions')
@@ -0,0 +1,83 @@
+"""Add diaries and scope records, plants and their indexes by diary
+
+Revision ID: 8b3e6f1a2d94
+Revises: 4f8d2c6b9e70
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3e6f1a2d94'
+down_revision = '4f8d2c6b9e70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    diaries = op.create_table('diaries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Existing data becomes the default diary
+    op.bulk_insert(diaries, [{'id': 1, 'name': '観察日記', 'is_active': True}])
+
+    for table in ('plants', 'records', 'plant_records'):
+        op.add_column(table, sa.Column('diary_id', sa.Integer(), server_default='1', nullable=False))
+        op.create_foreign_key(f'fk_{table}_diary_id', table, 'diaries', ['diary_id'], ['id'])
+    for table in ('change_events', 'tombstones'):
+        op.add_column(table, sa.Column('diary_id', sa.Integer(), server_default='1', nullable=False))
+
+    op.create_index('ix_plants_diary_id_display_order', 'plants', ['diary_id', 'display_order'], unique=False)
+
+    op.drop_index(op.f('ix_records_record_date'), table_name='records')
+    op.create_unique_constraint('uq_records_diary_id_record_date', 'records', ['diary_id', 'record_date'])
+    op.drop_index('ix_records_weather_record_date', table_name='records')
+    op.create_index('ix_records_diary_id_weather_record_date', 'records',
+                    ['diary_id', 'weather', 'record_date'], unique=False)
+    op.drop_index(op.f('ix_records_change_seq'), table_name='records')
+    op.create_index('ix_records_diary_id_change_seq', 'records', ['diary_id', 'change_seq'], unique=False)
+
+    op.drop_index('ix_plant_records_gallery_all', table_name='plant_records')
+    op.create_index('ix_plant_records_gallery_diary', 'plant_records',
+                    ['diary_id', 'has_image', 'record_id'], unique=False)
+    op.drop_index(op.f('ix_plant_records_change_seq'), table_name='plant_records')
+    op.create_index('ix_plant_records_diary_id_change_seq', 'plant_records',
+                    ['diary_id', 'change_seq'], unique=False)
+
+    op.drop_index(op.f('ix_tombstones_change_seq'), table_name='tombstones')
+    op.create_index('ix_tombstones_diary_id_change_seq', 'tombstones', ['diary_id', 'change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    # Foreign keys first: MySQL refuses to drop the indexes backing them
+    for table in ('plant_records', 'records', 'plants'):
+        op.drop_constraint(f'fk_{table}_diary_id', table, type_='foreignkey')
+
+    op.drop_index('ix_tombstones_diary_id_change_seq', table_name='tombstones')
+    op.create_index(op.f('ix_tombstones_change_seq'), 'tombstones', ['change_seq'], unique=False)
+
+    op.drop_index('ix_plant_records_diary_id_change_seq', table_name='plant_records')
+    op.create_index(op.f('ix_plant_records_change_seq'), 'plant_records', ['change_seq'], unique=False)
+    op.drop_index('ix_plant_records_gallery_diary', table_name='plant_records')
+    op.create_index('ix_plant_records_gallery_all', 'plant_records', ['has_image', 'record_id'], unique=False)
+
+    op.drop_index('ix_records_diary_id_change_seq', table_name='records')
+    op.create_index(op.f('ix_records_change_seq'), 'records', ['change_seq'], unique=False)
+    op.drop_index('ix_records_diary_id_weather_record_date', table_name='records')
+    op.create_index('ix_records_weather_record_date', 'records', ['weather', 'record_date'], unique=False)
+    # Fails if two diaries have a record on the same date
+    op.drop_constraint('uq_records_diary_id_record_date', 'records', type_='unique')
+    op.create_index(op.f('ix_records_record_date'), 'records', ['record_date'], unique=True)
+
+    op.drop_index('ix_plants_diary_id_display_order', table_name='plants')
+
+    for table in ('change_events', 'tombstones', 'plant_records', 'records', 'plants'):
+        op.drop_column(table, 'diary_id')
+    op.drop_table('diaries')
@@ -0,0 +1,37 @@
+"""Add archived_seasons table
+
+Revision ID: a5c0d7e3f912
+Revises: 8b3e6f1a2d94
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c0d7e3f912'
+down_revision = '8b3e6f1a2d94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('archived_seasons',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('diary_id', sa.Integer(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('object_name', sa.String(length=255), nullable=False),
+    sa.Column('record_count', sa.Integer(), nullable=False),
+    sa.Column('plant_record_count', sa.Integer(), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['diary_id'], ['diaries.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('diary_id', 'year', name='uq_archived_seasons_diary_id_year')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('archived_seasons')
@@ -0,0 +1,29 @@
+"""Add FULLTEXT index on plant_records.comment
+
+Revision ID: b3f8a15c6d21
+Revises: 7c1d2e9a4b30
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f8a15c6d21'
+down_revision = '7c1d2e9a4b30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The ngram parser splits Japanese text (no word boundaries) into
+    # ngram_token_size-character tokens (default 2)
+    if op.get_bind().dialect.name == 'mysql':
+        op.create_index('ft_plant_records_comment', 'plant_records', ['comment'], unique=False,
+                        mysql_prefix='FULLTEXT', mysql_with_parser='ngram')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'mysql':
+        op.drop_index('ft_plant_records_comment', table_name='plant_records')
@@ -0,0 +1,24 @@
+"""Add records.version for optimistic locking
+
+Revision ID: c7a1e5d93b42
+Revises: 9d4e2b7f1c63
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a1e5d93b42'
+down_revision = '9d4e2b7f1c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('records', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('records', 'version')
@@ -0,0 +1,26 @@
+"""Add change_seq to change_events for commit-ordered polling
+
+Revision ID: d6b1f8c3e527
+Revises: a5c0d7e3f912
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6b1f8c3e527'
+down_revision = 'a5c0d7e3f912'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('change_events', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index('ix_change_events_diary_id_change_seq', 'change_events', ['diary_id', 'change_seq'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_change_events_diary_id_change_seq', table_name='change_events')
+    op.drop_column('change_events', 'change_seq')
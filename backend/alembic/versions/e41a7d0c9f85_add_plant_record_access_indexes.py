@@ -0,0 +1,35 @@
+"""Add composite indexes for per-plant and date-range queries
+
+The indexes locate the rows; they do not cover the selected columns (height
+and comment are read from the table). image_filename is included so the
+has-image filter is checked in the index before the row lookup.
+
+Revision ID: e41a7d0c9f85
+Revises: b3f8a15c6d21
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a7d0c9f85'
+down_revision = 'b3f8a15c6d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_plant_records_plant_id_record_id', 'plant_records',
+                    ['plant_id', 'record_id', 'image_filename'], unique=False)
+    op.create_index('ix_plant_records_record_id_plant_id', 'plant_records',
+                    ['record_id', 'plant_id'], unique=False)
+    op.create_index('ix_records_weather_record_date', 'records',
+                    ['weather', 'record_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_records_weather_record_date', table_name='records')
+    op.drop_index('ix_plant_records_record_id_plant_id', table_name='plant_records')
+    op.drop_index('ix_plant_records_plant_id_record_id', table_name='plant_records')
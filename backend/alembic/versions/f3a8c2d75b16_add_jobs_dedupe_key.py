@@ -0,0 +1,26 @@
+"""Add dedupe_key to jobs
+
+Revision ID: f3a8c2d75b16
+Revises: d6b1f8c3e527
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8c2d75b16'
+down_revision = 'd6b1f8c3e527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('dedupe_key', sa.String(length=255), nullable=True))
+    op.create_index('ix_jobs_kind_dedupe_key', 'jobs', ['kind', 'dedupe_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_kind_dedupe_key', table_name='jobs')
+    op.drop_column('jobs', 'dedupe_key')
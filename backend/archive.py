@@ -0,0 +1,178 @@
+"""Archival of closed seasons to cold storage.
+
+A season (calendar year) that has ended is exported to a zstd-compressed
+Parquet file in object storage (see ``columnar``) and its rows are then
+deleted from ``records`` / ``plant_records``, so list, calendar and search
+queries only ever scan the seasons still in use. ``archived_seasons`` keeps
+one manifest row per file; ``GET /api/archive/seasons/{year}`` reads an
+archived season back from its file. Photos stay where they are: archived
+rows keep pointing at them.
+
+The file is written and read back (checksum) before anything is deleted,
+and the delete runs in one transaction that holds the diary's data version
+row, so no edit can slip in between export and delete.
+
+    python archive.py --diary 1 list
+    python archive.py --diary 1 season 2024
+"""
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List
+import argparse
+import hashlib
+import logging
+
+from sqlalchemy.orm import Session
+
+import columnar
+import events
+from data_version import bump_data_version
+from minio_client import minio_client
+from models import DEFAULT_DIARY_ID, ArchivedSeason, PlantRecord, Record, get_jst_now
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "archive/"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_object_name(diary_id: int, year: int) -> str:
+    return f"{ARCHIVE_PREFIX}diary-{diary_id}/{year}.parquet"
+
+
+def season_closed(year: int) -> bool:
+    return year < get_jst_now().year
+
+
+def archive_season(db: Session, diary_id: int, year: int) -> ArchivedSeason:
+    """Export a closed season to object storage and remove it from the hot tables"""
+    if not season_closed(year):
+        raise ArchiveError(f"{year}年のシーズンはまだ終わっていません")
+    if db.query(ArchivedSeason).filter(ArchivedSeason.diary_id == diary_id, ArchivedSeason.year == year).first():
+        raise ArchiveError(f"{year}年のシーズンはアーカイブ済みです")
+
+    # Writers of the diary wait on its version row until this commits
+    bump_data_version(db, diary_id)
+
+    statement = columnar.growth_query(diary_id, date(year, 1, 1), date(year, 12, 31))
+    data = columnar.write_parquet(columnar.iter_batches(db, statement))
+    table = columnar.read_parquet(data)
+    record_ids = sorted(set(table.column("record_id").to_pylist()))
+    plant_record_ids = [pid for pid in table.column("plant_record_id").to_pylist() if pid is not None]
+    if not record_ids:
+        raise ArchiveError(f"{year}年の記録がありません")
+
+    object_name = archive_object_name(diary_id, year)
+    digest = hashlib.sha256(data).hexdigest()
+    minio_client.put_image(object_name, data, PARQUET_CONTENT_TYPE, {"sha256": digest})
+    if hashlib.sha256(minio_client.get_image(object_name)).hexdigest() != digest:
+        minio_client.delete_image(object_name)
+        raise ArchiveError(f"アーカイブファイルの検証に失敗しました: {object_name}")
+
+    try:
+        # Exactly the exported rows (the tombstones tell sync clients to drop them)
+        db.query(PlantRecord).filter(
+            PlantRecord.diary_id == diary_id, PlantRecord.record_id.in_(record_ids)
+        ).delete(synchronize_session=False)
+        db.query(Record).filter(
+            Record.diary_id == diary_id, Record.id.in_(record_ids)
+        ).delete(synchronize_session=False)
+        archived = ArchivedSeason(
+            diary_id=diary_id,
+            year=year,
+            object_name=object_name,
+            record_count=len(record_ids),
+            plant_record_count=len(plant_record_ids),
+            size_bytes=len(data),
+            sha256=digest,
+        )
+        db.add(archived)
+        events.emit(db, "season.archived", diary_id, year=year)
+        db.commit()
+    except Exception:
+        db.rollback()
+        minio_client.delete_image(object_name)
+        raise
+
+    logger.info(
+        "Archived season %d of diary %d: %d records, %d plant records, %d bytes",
+        year, diary_id, len(record_ids), len(plant_record_ids), len(data)
+    )
+    return archived
+
+
+def archived_seasons(db: Session, diary_id: int) -> List[ArchivedSeason]:
+    return (
+        db.query(ArchivedSeason)
+        .filter(ArchivedSeason.diary_id == diary_id)
+        .order_by(ArchivedSeason.year.desc())
+        .all()
+    )
+
+
+def season_to_dict(archived: ArchivedSeason) -> Dict[str, Any]:
+    return {
+        "year": archived.year,
+        "records": archived.record_count,
+        "plantRecords": archived.plant_record_count,
+        "sizeBytes": archived.size_bytes,
+        "archivedAt": archived.archived_at.isoformat() if archived.archived_at else None,
+    }
+
+
+def load_season_records(archived: ArchivedSeason) -> List[Dict[str, Any]]:
+    """Records of an archived season, shaped like ``GET /api/records`` (newest first)"""
+    table = columnar.read_parquet(minio_client.get_image(archived.object_name))
+    records: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+    for row in table.to_pylist():
+        record = records.get(row["record_id"])
+        if record is None:
+            record = records[row["record_id"]] = {
+                "id": row["record_id"],
+                "date": row["record_date"].isoformat(),
+                "weather": row["weather"],
+                "temperature": row["temperature"],
+                "plants": [],
+            }
+        if row["plant_record_id"] is not None:
+            record["plants"].append({
+                "type": row["plant_name"],
+                "height": row["height"],
+                "comment": row["comment"] or "",
+                "image": f"/api/images/{row['image_filename']}" if row["image_filename"] else None,
+            })
+    return list(reversed(records.values()))
+
+
+def main():
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Archive closed seasons to object storage")
+    parser.add_argument("--diary", type=int, default=DEFAULT_DIARY_ID, help="diary id")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list archived seasons")
+    season = commands.add_parser("season", help="archive one closed season")
+    season.add_argument("year", type=int)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            for archived in archived_seasons(db, args.diary):
+                print(season_to_dict(archived))
+        else:
+            try:
+                print(season_to_dict(archive_season(db, args.diary, args.year)))
+            except ArchiveError as e:
+                parser.exit(1, f"{e}\n")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""Consistent, incremental backups of the database and the photos.
+
+A backup is a directory under ``BACKUP_DIR`` named after its UTC start time:
+
+- ``db.jsonl.gz``: the rows of ``BACKUP_TABLES``, read in a single
+  consistent-snapshot transaction, one ``{"table": ..., "row": ...}`` line
+  each.
+- ``objects.tar.gz``: the objects that are new or changed (by ETag) since
+  the previous backup, streamed from MinIO into the archive together with
+  their content type and metadata.
+- ``manifest.json``: the row counts and every object with its ETag, size
+  and the backup whose archive holds its bytes. Unchanged objects point at
+  an earlier backup, so a restore needs the chain of backups back to the
+  last full one.
+
+Both files are written under ``<name>.partial`` and the directory is renamed
+once the manifest is written, so an interrupted run never looks complete.
+Derived objects (thumbnails, exports, time-lapses, reports) are skipped;
+they are rebuilt on demand. So are raw uploads still waiting under
+``incoming/``, and objects deleted between listing and copying.
+
+Restore replaces the backed-up tables in one transaction. Restored rows are
+re-stamped with a new data version, record versions move past their
+pre-restore values and rows that disappear get tombstones, so caches,
+delta-sync clients and stale ETags all pick up the change. Objects are uploaded
+by a pool of workers, skipping those already present with the same ETag.
+
+    python backup.py create [--full]
+    python backup.py list
+    python backup.py restore 20261019T120000Z [--workers 8] [--skip-db] [--skip-objects]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Set, Tuple
+import argparse
+import enum
+import gzip
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+
+from sqlalchemy import Date, DateTime, Numeric, insert, select, update
+from sqlalchemy.orm import Session
+
+import events
+from data_version import bump_data_version
+from database import engine
+from delta_sync import _tombstone_values
+from minio.error import S3Error
+
+from minio_client import INCOMING_PREFIX, minio_client
+from models import ArchivedSeason, Diary, Plant, PlantRecord, Record, Tombstone
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "/backups")
+BACKUP_GZIP_LEVEL = int(os.getenv("BACKUP_GZIP_LEVEL", "6"))
+BACKUP_RESTORE_WORKERS = int(os.getenv("BACKUP_RESTORE_WORKERS", "8"))
+BACKUP_BATCH_ROWS = 1000
+
+# Parents first; restored in this order and cleared in reverse
+BACKUP_MODELS = (Diary, Plant, Record, PlantRecord, ArchivedSeason)
+BACKUP_TABLES = tuple(model.__table__ for model in BACKUP_MODELS)
+# Regenerated on demand, not worth backing up; raw uploads are transient
+# (and still carry their EXIF/GPS data)
+SKIPPED_PREFIXES = ("thumbs/", "exports/", "media-", "report-", INCOMING_PREFIX)
+
+MANIFEST = "manifest.json"
+DB_FILE = "db.jsonl.gz"
+OBJECTS_FILE = "objects.tar.gz"
+PARTIAL_SUFFIX = ".partial"
+_PAX_CONTENT_TYPE = "KANSATSU.content_type"
+_PAX_METADATA = "KANSATSU.metadata"
+
+
+class BackupError(Exception):
+    pass
+
+
+# -- helpers ------------------------------------------------------------------
+
+def _columns(table) -> List:
+    # Generated columns (plant_records.has_image) cannot be inserted
+    return [column for column in table.columns if column.computed is None]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def _decoders(table) -> Dict[str, Any]:
+    decoders = {}
+    for column in _columns(table):
+        if isinstance(column.type, DateTime):
+            decoders[column.name] = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            decoders[column.name] = date.fromisoformat
+        elif isinstance(column.type, Numeric):
+            decoders[column.name] = Decimal
+    return decoders
+
+
+def backup_names(root: str = BACKUP_DIR) -> List[str]:
+    """Completed backups, oldest first"""
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.endswith(PARTIAL_SUFFIX) and os.path.isfile(os.path.join(root, name, MANIFEST))
+    )
+
+
+def read_manifest(name: str, root: str = BACKUP_DIR) -> Dict[str, Any]:
+    path = os.path.join(root, name, MANIFEST)
+    if not os.path.isfile(path):
+        raise BackupError(f"バックアップ {name} が見つかりません")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _backed_up(name: str) -> bool:
+    return not name.startswith(SKIPPED_PREFIXES)
+
+
+def _list_objects() -> Iterator[Tuple[str, str, int]]:
+    """(name, etag, size) of the bucket's objects worth backing up"""
+    for obj in minio_client.client.list_objects(minio_client.bucket_name, recursive=True):
+        if _backed_up(obj.object_name):
+            yield obj.object_name, obj.etag, obj.size
+
+
+# -- create -------------------------------------------------------------------
+
+def _dump_tables(path: str) -> Tuple[Dict[str, int], Set[str]]:
+    """Write the tables from one snapshot; row counts and the object names the rows refer to"""
+    counts: Dict[str, int] = {}
+    referenced: Set[str] = set()
+    with engine.connect() as conn, gzip.open(path, "wt", encoding="utf-8", compresslevel=BACKUP_GZIP_LEVEL) as out:
+        if engine.dialect.name == "mysql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            conn.exec_driver_sql("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+        else:
+            conn.begin()
+        for table in BACKUP_TABLES:
+            columns = _columns(table)
+            result = conn.execute(
+                select(*columns).order_by(*table.primary_key.columns).execution_options(yield_per=BACKUP_BATCH_ROWS)
+            )
+            count = 0
+            for row in result.mappings():
+                out.write(json.dumps({"table": table.name, "row": dict(row)}, default=_encode, ensure_ascii=False))
+                out.write("\n")
+                count += 1
+                if table is PlantRecord.__table__ and row["image_filename"]:
+                    referenced.add(row["image_filename"])
+                elif table is ArchivedSeason.__table__:
+                    referenced.add(row["object_name"])
+            counts[table.name] = count
+        conn.rollback()
+    return counts, referenced
+
+
+def _add_object(tar: tarfile.TarFile, name: str, size: int) -> bool:
+    """Append one object to the archive; False if it was deleted since listing"""
+    try:
+        response = minio_client.client.get_object(minio_client.bucket_name, name)
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        logger.info("Skipping %s: deleted since the bucket was listed", name)
+        return False
+    try:
+        headers = response.headers
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(datetime.now(timezone.utc).timestamp())
+        info.pax_headers = {
+            _PAX_CONTENT_TYPE: headers.get("Content-Type") or "application/octet-stream",
+            _PAX_METADATA: json.dumps({
+                key[len("x-amz-meta-"):]: value for key, value in headers.items()
+                if key.lower().startswith("x-amz-meta-")
+            }),
+        }
+        tar.addfile(info, response)
+    finally:
+        response.close()
+        response.release_conn()
+    return True
+
+
+def create_backup(root: str = BACKUP_DIR, full: bool = False) -> Dict[str, Any]:
+    """Take a backup; incremental against the latest one unless ``full``"""
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    if name in backup_names(root):
+        raise BackupError(f"バックアップ {name} は既に存在します")
+    previous = None if full else next(reversed(backup_names(root)), None)
+    previous_objects = read_manifest(previous, root)["objects"] if previous else {}
+
+    work_dir = os.path.join(root, name + PARTIAL_SUFFIX)
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+
+    # Database first: every object its rows refer to was stored before the
+    # snapshot, so listing the bucket afterwards finds it
+    counts, referenced = _dump_tables(os.path.join(work_dir, DB_FILE))
+
+    objects: Dict[str, Dict[str, Any]] = {}
+    copied = copied_bytes = 0
+    with gzip.open(os.path.join(work_dir, OBJECTS_FILE), "wb", compresslevel=BACKUP_GZIP_LEVEL) as gz, \
+            tarfile.open(fileobj=gz, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for object_name, etag, size in _list_objects():
+            earlier = previous_objects.get(object_name)
+            if earlier and earlier["etag"] == etag:
+                objects[object_name] = earlier
+                continue
+            if not _add_object(tar, object_name, size):
+                continue
+            objects[object_name] = {"etag": etag, "size": size, "backup": name}
+            copied += 1
+            copied_bytes += size
+
+    missing = sorted(referenced - objects.keys())
+    if missing:
+        logger.warning("%d objects referenced by the database are missing from the bucket: %s",
+                       len(missing), ", ".join(missing[:10]))
+    manifest = {
+        "name": name,
+        "createdAt": datetime.now(timezone.utc).isoformat(),
+        "previous": previous,
+        "tables": counts,
+        "objects": objects,
+        "copiedObjects": copied,
+        "copiedBytes": copied_bytes,
+        "missingObjects": missing,
+    }
+    with open(os.path.join(work_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.rename(work_dir, os.path.join(root, name))
+    logger.info("Backup %s: %s rows, %d objects (%d copied, %d bytes)",
+                name, sum(counts.values()), len(objects), copied, copied_bytes)
+    return manifest
+
+
+# -- restore ------------------------------------------------------------------
+
+def _read_rows(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            yield item["table"], item["row"]
+
+
+def restore_database(path: str) -> Dict[str, int]:
+    """Replace the backed-up tables with the rows in ``path`` (one transaction)"""
+    tables = {table.name: table for table in BACKUP_TABLES}
+    decoders = {table.name: _decoders(table) for table in BACKUP_TABLES}
+    counts = {name: 0 for name in tables}
+
+    with engine.begin() as conn:
+        # Rows that exist now; those not restored get tombstones below
+        before = {
+            model: set(conn.execute(select(model.diary_id, model.id, record_id)).all())
+            for model, record_id in ((Record, Record.id), (PlantRecord, PlantRecord.record_id))
+        }
+        versions = dict(conn.execute(select(Record.id, Record.version)).all())
+        for table in reversed(BACKUP_TABLES):
+            conn.execute(table.delete())
+
+        batch: List[Dict[str, Any]] = []
+        batch_table = None
+        for table_name, row in _read_rows(path):
+            if table_name != batch_table and batch:
+                conn.execute(insert(tables[batch_table]), batch)
+                batch = []
+            batch_table = table_name
+            for column, decode in decoders[table_name].items():
+                if row.get(column) is not None:
+                    row[column] = decode(row[column])
+            batch.append(row)
+            counts[table_name] += 1
+            if len(batch) >= BACKUP_BATCH_ROWS:
+                conn.execute(insert(tables[batch_table]), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(tables[batch_table]), batch)
+
+        # Re-stamp every restored row with a new version of its diary so that
+        # caches and delta-sync cursors see the restore as one change. Record
+        # versions (the ETags) are moved past their pre-restore values, so a
+        # client holding an ETag from before the restore gets a conflict
+        # instead of overwriting the restored record
+        after = {
+            model: set(conn.execute(select(model.diary_id, model.id, record_id)).all())
+            for model, record_id in ((Record, Record.id), (PlantRecord, PlantRecord.record_id))
+        }
+        diaries = {row[0] for rows in (*before.values(), *after.values()) for row in rows}
+        with Session(bind=conn) as db:
+            for diary_id in sorted(diaries):
+                seq = bump_data_version(db, diary_id)
+                offset = max(
+                    (versions.get(record_id, 0) for row_diary, record_id, _ in after[Record] if row_diary == diary_id),
+                    default=0,
+                )
+                conn.execute(
+                    update(Record.__table__).where(Record.diary_id == diary_id)
+                    .values(change_seq=seq, version=Record.__table__.c.version + offset)
+                )
+                conn.execute(
+                    update(PlantRecord.__table__).where(PlantRecord.diary_id == diary_id).values(change_seq=seq)
+                )
+                gone = [
+                    _tombstone_values(model, diary_id, entity_id, record_id, seq)
+                    for model in (Record, PlantRecord)
+                    for row_diary, entity_id, record_id in before[model] - after[model] if row_diary == diary_id
+                ]
+                if gone:
+                    conn.execute(insert(Tombstone.__table__), gone)
+                events.emit(db, "resync", diary_id)
+            db.flush()
+    return counts
+
+
+def _restore_archive(path: str, wanted: Dict[str, str], pool: ThreadPoolExecutor,
+                     slots: threading.Semaphore, failures: List[str]) -> int:
+    """Upload the members of one objects archive named in ``wanted`` (name -> etag)"""
+    submitted = 0
+
+    def upload(name: str, data: bytes, content_type: str, metadata: Dict[str, str]):
+        try:
+            minio_client.put_image(name, data, content_type, metadata or None)
+        except Exception as e:
+            logger.error("Restoring %s failed: %s", name, e)
+            failures.append(name)
+        finally:
+            slots.release()
+
+    with tarfile.open(path, mode="r|gz") as tar:
+        for member in tar:
+            if member.name not in wanted:
+                continue
+            data = tar.extractfile(member).read()
+            # Bounded number of objects held in memory while uploads run
+            slots.acquire()
+            pool.submit(
+                upload, member.name, data,
+                member.pax_headers.get(_PAX_CONTENT_TYPE, "application/octet-stream"),
+                json.loads(member.pax_headers.get(_PAX_METADATA, "{}")),
+            )
+            submitted += 1
+    return submitted
+
+
+def restore_objects(manifest: Dict[str, Any], root: str = BACKUP_DIR,
+                    workers: int = BACKUP_RESTORE_WORKERS) -> Dict[str, int]:
+    """Upload the manifest's objects that are missing or differ in the bucket"""
+    current = {name: etag for name, etag, _ in _list_objects()}
+    by_backup: Dict[str, Dict[str, str]] = {}
+    for name, entry in manifest["objects"].items():
+        if current.get(name) != entry["etag"]:
+            by_backup.setdefault(entry["backup"], {})[name] = entry["etag"]
+    for backup in by_backup:
+        if not os.path.isfile(os.path.join(root, backup, OBJECTS_FILE)):
+            raise BackupError(f"差分の元になったバックアップ {backup} がありません")
+
+    failures: List[str] = []
+    slots = threading.Semaphore(workers * 2)
+    with ThreadPoolExecutor(max_workers=workers) as uploads, \
+            ThreadPoolExecutor(max_workers=max(1, min(len(by_backup), workers))) as readers:
+        # Archives are read concurrently, each as one sequential gzip stream
+        submitted = sum(
+            future.result() for future in [
+                readers.submit(_restore_archive, os.path.join(root, backup, OBJECTS_FILE),
+                               wanted, uploads, slots, failures)
+                for backup, wanted in by_backup.items()
+            ]
+        )
+    if failures:
+        raise BackupError(f"{len(failures)} 件のオブジェクトを復元できませんでした: {', '.join(failures[:10])}")
+    return {"uploaded": submitted, "unchanged": len(manifest["objects"]) - submitted}
+
+
+def restore_backup(name: str, root: str = BACKUP_DIR, workers: int = BACKUP_RESTORE_WORKERS,
+                   objects: bool = True, database: bool = True) -> Dict[str, Any]:
+    manifest = read_manifest(name, root)
+    result: Dict[str, Any] = {"name": name}
+    # Objects first: restored rows never point at photos that are not there yet
+    if objects:
+        result["objects"] = restore_objects(manifest, root, workers)
+    if database:
+        result["tables"] = restore_database(os.path.join(root, name, DB_FILE))
+    logger.info("Restored backup %s: %s", name, result)
+    return result
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Back up and restore the database and photos")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="take a backup (incremental unless --full)")
+    create.add_argument("--full", action="store_true", help="copy every object")
+    commands.add_parser("list", help="list completed backups")
+    restore = commands.add_parser("restore", help="restore a backup")
+    restore.add_argument("name")
+    restore.add_argument("--workers", type=int, default=BACKUP_RESTORE_WORKERS, help="parallel uploads")
+    restore.add_argument("--skip-db", action="store_true", help="restore objects only")
+    restore.add_argument("--skip-objects", action="store_true", help="restore the database only")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "create":
+            manifest = create_backup(args.dir, args.full)
+            print(json.dumps({key: value for key, value in manifest.items() if key != "objects"}, ensure_ascii=False))
+        elif args.command == "list":
+            for name in backup_names(args.dir):
+                manifest = read_manifest(name, args.dir)
+                print(name, manifest["previous"] or "(full)", len(manifest["objects"]), "objects",
+                      manifest["copiedObjects"], "copied")
+        else:
+            print(json.dumps(restore_backup(
+                args.name, args.dir, args.workers, objects=not args.skip_objects, database=not args.skip_db
+            ), ensure_ascii=False))
+    except BackupError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
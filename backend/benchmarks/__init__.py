@@ -0,0 +1 @@
+"""Benchmarks for the backend (run from the backend directory with ``python -m``)"""
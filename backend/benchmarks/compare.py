@@ -0,0 +1,40 @@
+"""Compare two load test result files.
+
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two load test runs")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before['meta']['git_revision']}  after: {after['meta']['git_revision']}")
+    for name in sorted(set(before["scenarios"]) & set(after["scenarios"])):
+        print(name)
+        for metric in METRICS:
+            b = before["scenarios"][name][metric]
+            a = after["scenarios"][name][metric]
+            print(f"  {metric:<15} {b:10.2f} -> {a:10.2f}  {change(b, a)}")
+    b, a = before["memory"]["rss_peak_kb"], after["memory"]["rss_peak_kb"]
+    print(f"rss_peak_kb       {b:10d} -> {a:10d}  {change(b, a)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Local stand-ins for MinIO used by the benchmarks.
+
+``FakeMinio`` implements the subset of the ``minio.Minio`` SDK client that
+``MinIOClient`` uses, backed by a dict or a directory. Installing it replaces
+``minio.Minio`` before ``minio_client`` is imported, so the real
+``MinIOClient`` code path is still exercised.
+"""
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import threading
+
+import minio
+from minio.datatypes import Object
+from minio.error import S3Error
+
+
+class _Response:
+    """Mimics the urllib3 response returned by ``Minio.get_object``"""
+
+    def __init__(self, data: bytes, headers: Dict[str, str]):
+        self._buffer = BytesIO(data)
+        self.headers = headers
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self._buffer.read(amt)
+
+    def stream(self, amt: int = 64 * 1024):
+        while True:
+            chunk = self._buffer.read(amt)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class FakeMinio:
+    """In-memory (``root=None``) or filesystem-backed object store"""
+
+    root: Optional[str] = None
+    _objects: Dict[str, Dict[str, tuple]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, endpoint: str = "fake", *args, **kwargs):
+        self.endpoint = endpoint
+
+    # -- helpers ---------------------------------------------------------
+    def _path(self, bucket_name: str, object_name: str) -> str:
+        return os.path.join(self.root, bucket_name, object_name)
+
+    def _meta_path(self, bucket_name: str, object_name: str) -> str:
+        return os.path.join(self.root, ".meta", bucket_name, object_name + ".json")
+
+    def _not_found(self, bucket_name: str, object_name: str) -> S3Error:
+        return S3Error("NoSuchKey", "Object does not exist", object_name, "fake", "fake", None,
+                       bucket_name=bucket_name, object_name=object_name)
+
+    def _load(self, bucket_name: str, object_name: str) -> tuple:
+        if self.root:
+            path = self._path(bucket_name, object_name)
+            if not os.path.isfile(path):
+                raise self._not_found(bucket_name, object_name)
+            with open(path, "rb") as f:
+                data = f.read()
+            content_type, headers = "application/octet-stream", {}
+            meta_path = self._meta_path(bucket_name, object_name)
+            if os.path.isfile(meta_path):
+                with open(meta_path) as f:
+                    content_type, headers = json.load(f)
+            return data, content_type, headers, os.path.getmtime(path)
+        try:
+            return self._objects[bucket_name][object_name]
+        except KeyError:
+            raise self._not_found(bucket_name, object_name)
+
+    # -- SDK surface -----------------------------------------------------
+    def bucket_exists(self, bucket_name: str) -> bool:
+        if self.root:
+            return os.path.isdir(os.path.join(self.root, bucket_name))
+        return bucket_name in self._objects
+
+    def make_bucket(self, bucket_name: str, *args, **kwargs):
+        if self.root:
+            os.makedirs(os.path.join(self.root, bucket_name), exist_ok=True)
+        else:
+            with self._lock:
+                self._objects.setdefault(bucket_name, {})
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int,
+                   content_type: str = "application/octet-stream", metadata: dict = None, **kwargs):
+        body = data.read(length) if length >= 0 else data.read()
+        # User metadata comes back as x-amz-meta-* headers, like S3
+        headers = {
+            key if key.lower().startswith("x-amz-meta-") else f"x-amz-meta-{key}": str(value)
+            for key, value in (metadata or {}).items()
+        }
+        if self.root:
+            path = self._path(bucket_name, object_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(body)
+            meta_path = self._meta_path(bucket_name, object_name)
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump([content_type, headers], f)
+        else:
+            with self._lock:
+                self._objects.setdefault(bucket_name, {})[object_name] = (
+                    body, content_type, headers, datetime.now(timezone.utc).timestamp()
+                )
+        return None
+
+    def get_object(self, bucket_name: str, object_name: str, *args, **kwargs) -> _Response:
+        data, content_type, metadata, _ = self._load(bucket_name, object_name)
+        return _Response(data, {"Content-Type": content_type, **metadata})
+
+    def stat_object(self, bucket_name: str, object_name: str, *args, **kwargs) -> Object:
+        data, content_type, metadata, mtime = self._load(bucket_name, object_name)
+        return Object(bucket_name, object_name,
+                      last_modified=datetime.fromtimestamp(mtime, timezone.utc),
+                      etag=hashlib.md5(data).hexdigest(), size=len(data),
+                      metadata=metadata, content_type=content_type)
+
+    def remove_object(self, bucket_name: str, object_name: str, *args, **kwargs):
+        if self.root:
+            path = self._path(bucket_name, object_name)
+            for file_path in (path, self._meta_path(bucket_name, object_name)):
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+        else:
+            with self._lock:
+                self._objects.get(bucket_name, {}).pop(object_name, None)
+
+    def list_objects(self, bucket_name: str, prefix: str = None, recursive: bool = False, **kwargs):
+        if self.root:
+            base = os.path.join(self.root, bucket_name)
+            names = [
+                os.path.relpath(os.path.join(dirpath, name), base).replace(os.sep, "/")
+                for dirpath, _, files in os.walk(base) for name in files
+            ]
+        else:
+            names = list(self._objects.get(bucket_name, {}))
+        for name in sorted(names):
+            if prefix and not name.startswith(prefix):
+                continue
+            yield self.stat_object(bucket_name, name)
+
+
+def install_fake_storage(kind: str = "memory", root: str = None):
+    """Replace ``minio.Minio`` with ``FakeMinio`` (call before importing main)"""
+    if kind == "filesystem":
+        if not root:
+            raise ValueError("filesystem storage requires a root directory")
+        os.makedirs(root, exist_ok=True)
+        FakeMinio.root = root
+    elif kind == "memory":
+        FakeMinio.root = None
+    else:
+        raise ValueError(f"unknown storage kind: {kind}")
+    minio.Minio = FakeMinio
@@ -0,0 +1,196 @@
+"""Reproducible load test against the real FastAPI app.
+
+Seeds a local database (SQLite by default, or MySQL via ``--database-url``),
+replaces MinIO with an in-memory or filesystem fake and drives the app
+in-process with concurrent clients. Results are written as JSON so runs can
+be compared with ``benchmarks.compare``.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load_test --seasons 3 --concurrency 8 --requests 500
+"""
+from datetime import datetime, timedelta, timezone
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(values) / count * 1000, 2) if count else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if count else 0.0,
+    }
+
+
+async def run_scenario(client, make_request, requests: int, concurrency: int) -> dict:
+    """Issue ``requests`` calls from ``concurrency`` concurrent clients"""
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            response = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def max_rss_kb() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+async def benchmark(args, workdir: str) -> dict:
+    import httpx
+    from benchmarks.fakes import install_fake_storage
+    from benchmarks.seed import seed, make_jpeg
+
+    install_fake_storage(args.storage, os.path.join(workdir, "objects"))
+
+    from database import SessionLocal
+    from init_data import main as init_database
+    from minio_client import minio_client
+    import main
+
+    init_database()
+    today = datetime.now(timezone(timedelta(hours=9))).date()
+    db = SessionLocal()
+    try:
+        seeded = seed(db, minio_client, args.seasons, today, seed_value=args.seed)
+    finally:
+        db.close()
+
+    rng = random.Random(args.seed)
+    upload_body = make_jpeg(seed=args.seed)
+    images = seeded.pop("images")
+
+    scenarios = {
+        "records_list": lambda c, i: c.get("/api/records"),
+        "records_today": lambda c, i: c.get("/api/records/today"),
+        "image_upload": lambda c, i: c.post(
+            "/api/upload/image", files={"file": (f"photo{i}.jpg", upload_body, "image/jpeg")}
+        ),
+        "image_fetch": lambda c, i: c.get(f"/api/images/{rng.choice(images)}"),
+    }
+    selected = args.scenarios or list(scenarios)
+
+    if args.trace_memory:
+        tracemalloc.start()
+    rss_start = max_rss_kb()
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in selected:
+            # Warm up caches and connection pools before measuring
+            for i in range(min(args.warmup, args.requests)):
+                await scenarios[name](client, i)
+            results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency)
+            print(f"{name:<14} p50={results[name]['p50_ms']:8.2f}ms p95={results[name]['p95_ms']:8.2f}ms "
+                  f"p99={results[name]['p99_ms']:8.2f}ms {results[name]['throughput_rps']:8.1f} req/s")
+    traced_peak = None
+    if args.trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "database": args.database_url.split("://")[0],
+            "storage": args.storage,
+            "seasons": args.seasons,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "seed": args.seed,
+            **seeded,
+        },
+        "scenarios": results,
+        "memory": {
+            "rss_start_kb": rss_start,
+            "rss_peak_kb": max_rss_kb(),
+            "traced_peak_kb": traced_peak,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the plant tracker API")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--storage", choices=["memory", "filesystem"], default="memory")
+    parser.add_argument("--seasons", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenario", dest="scenarios", action="append",
+                        choices=["records_list", "records_today", "image_upload", "image_fetch"])
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record Python allocation peak with tracemalloc (slows the run)")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["DATABASE_URL"] = args.database_url
+        # Keep the measurement free of per-request log noise
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ.setdefault("QUERY_BUDGET_MODE", "off")
+        result = asyncio.run(benchmark(args, workdir))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['meta']['git_revision']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
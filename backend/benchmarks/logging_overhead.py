@@ -0,0 +1,99 @@
+"""Measure logging overhead per request.
+
+Compares the previous setup (synchronous ``StreamHandler``, eagerly formatted
+f-strings, every trace at INFO) with the queue-based setup from
+``logging_config`` (lazy formatting, debug traces sampled).
+
+    python -m benchmarks.logging_overhead --requests 20000
+"""
+from datetime import date, datetime
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging_config  # noqa: E402
+
+RECORD_DATA = {
+    "weather": "sunny",
+    "temperature": "28.5",
+    "plantRecords": {
+        str(i): {"height": "12.5", "comment": "つぼみが大きくなってきた" * 3, "imageFilename": f"{i:032x}.jpg"}
+        for i in range(1, 4)
+    },
+}
+
+
+def eager_request(logger: logging.Logger):
+    """Log lines emitted by one create/today request before the change"""
+    today = date.today()
+    logger.info("=== 記録作成API開始 ===")
+    logger.info(f"受信データ: {RECORD_DATA}")
+    logger.info(f"使用する日付（JST）: {today}")
+    logger.info(f"=== 今日の記録チェック開始 ===")
+    logger.info(f"サーバー時刻: {datetime.now()}")
+    logger.info(f"検索対象日付: {today}")
+    for i in range(10):
+        logger.info(f"  ID={i}, 日付={today}, 作成日時={datetime.now()}")
+    logger.info(f"メインレコード作成: 日付={today}, 天気=sunny, 気温=28.5")
+
+
+def lazy_request(logger: logging.Logger):
+    """Log lines emitted by the same request with the queue-based setup"""
+    today = date.today()
+    logging_config.debug_sampled(logger, "受信データ: %s", RECORD_DATA)
+    logging_config.debug_sampled(logger, "JST時刻から計算された日付: %s", today)
+    logger.info("メインレコード作成: 日付=%s, 天気=%s, 気温=%s", today, "sunny", 28.5)
+
+
+def run(name: str, request_func, logger: logging.Logger, requests: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(requests):
+        request_func(logger)
+    elapsed = time.perf_counter() - start
+    return {"name": name, "requests": requests, "us_per_request": elapsed / requests * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before: synchronous file handler, formatted on the request thread
+        sync_stream = open(os.path.join(tmp, "sync.log"), "w")
+        sync_logger = logging.getLogger("bench.sync")
+        sync_logger.propagate = False
+        sync_handler = logging.StreamHandler(sync_stream)
+        sync_handler.setFormatter(logging.Formatter(logging_config.TEXT_FORMAT))
+        sync_logger.addHandler(sync_handler)
+        sync_logger.setLevel(logging.INFO)
+        results.append(run("sync_eager", eager_request, sync_logger, args.requests))
+        sync_stream.close()
+
+        # After: queue handler + JSON listener thread, lazy and sampled
+        queue_stream = open(os.path.join(tmp, "queue.log"), "w")
+        logging_config.setup_logging(stream=queue_stream)
+        queue_logger = logging.getLogger("bench.queue")
+        results.append(run("queue_lazy", lazy_request, queue_logger, args.requests))
+        # Same eager workload through the queue, to isolate the handler cost
+        results.append(run("queue_eager", eager_request, queue_logger, args.requests))
+        logging_config.stop_logging()
+        queue_stream.close()
+
+    for result in results:
+        print(f"{result['name']:<12} {result['us_per_request']:8.1f} us/request")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
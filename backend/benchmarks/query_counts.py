@@ -0,0 +1,87 @@
+"""Check that list endpoints run a constant number of SQL statements.
+
+Seeds one diary with ``--seasons`` seasons and another with ten times as
+many, requests each endpoint for both diaries and fails if the statement
+count differs, a statement shape repeats (N+1) or the count exceeds the
+route's declared ``@query_budget``. Uses a throwaway SQLite database unless
+``DATABASE_URL`` is set; use a scratch database then.
+
+    python -m benchmarks.query_counts --seasons 1
+"""
+from datetime import date
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENDPOINTS = ["/api/records", "/api/plants", "/api/gallery"]
+
+
+def declared_budget(app, path: str) -> int:
+    """``@query_budget`` of the GET route serving ``path`` (0 = none declared)"""
+    for route in app.routes:
+        if getattr(route, "path", None) == path and "GET" in getattr(route, "methods", ()):
+            return getattr(route.endpoint, "__query_budget__", 0)
+    raise ValueError(f"No GET route for {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify constant query counts of list endpoints")
+    parser.add_argument("--seasons", type=int, default=1, help="seasons in the small diary (the large one gets 10x)")
+    args = parser.parse_args()
+
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/query_counts.db"
+    # Re-read data versions on every request so both runs do the same work
+    os.environ["DATA_VERSION_CHECK_INTERVAL"] = "0"
+
+    from benchmarks.fakes import install_fake_storage
+    install_fake_storage("memory")
+
+    from fastapi.testclient import TestClient
+    from benchmarks.seed import seed
+    from database import SessionLocal
+    from init_data import init_diary
+    from minio_client import minio_client
+    from models import Diary
+    from query_budget import QueryBudgetExceeded, assert_max_queries, count_queries
+    import main as app_module
+
+    failures = 0
+    with TestClient(app_module.app) as client:
+        db = SessionLocal()
+        try:
+            sizes = {}
+            for diary_id, seasons in ((101, args.seasons), (102, args.seasons * 10)):
+                db.add(Diary(id=diary_id, name=f"query counts {seasons}"))
+                db.commit()
+                init_diary(db, diary_id)
+                sizes[diary_id] = seed(db, minio_client, seasons, date.today(), image_pool=2, diary_id=diary_id)["records"]
+        finally:
+            db.close()
+
+        for path in ENDPOINTS:
+            small, large = sizes
+            budget = declared_budget(app_module.app, path)
+            with count_queries() as baseline:
+                response = client.get(path, headers={"X-Diary-Id": str(small)})
+                response.raise_for_status()
+            try:
+                # Same statements for ten times the records, and no N+1 shapes
+                with assert_max_queries(baseline.count, label=path):
+                    client.get(path, headers={"X-Diary-Id": str(large)}).raise_for_status()
+                if budget and baseline.count > budget:
+                    raise QueryBudgetExceeded(path, baseline, budget)
+                ok = True
+            except QueryBudgetExceeded as e:
+                ok, note = False, str(e)
+            failures += not ok
+            print(f"{'OK ' if ok else 'NG '} {path:<16} {baseline.count} queries, budget {budget or '-'} "
+                  f"({sizes[small]} vs {sizes[large]} records)" + ("" if ok else f": {note}"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
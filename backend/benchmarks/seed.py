@@ -0,0 +1,72 @@
+"""Seed benchmark data: N seasons of records with plant records and images."""
+from datetime import date, timedelta
+from io import BytesIO
+from typing import List
+import random
+
+from PIL import Image
+
+# A season is the summer observation period (7/1 - 8/31)
+SEASON_START = (7, 1)
+SEASON_DAYS = 62
+
+
+def make_jpeg(width: int = 1280, height: int = 960, seed: int = 0) -> bytes:
+    """Generate a noisy JPEG so encoded sizes resemble photos"""
+    rng = random.Random(seed)
+    small = Image.new("RGB", (32, 24))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(32 * 24)])
+    buffer = BytesIO()
+    small.resize((width, height), Image.BILINEAR).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def season_dates(seasons: int, today: date) -> List[date]:
+    """Dates of the last ``seasons`` seasons; the current one runs up to today"""
+    dates = []
+    for year in range(today.year - seasons + 1, today.year + 1):
+        start = date(year, *SEASON_START)
+        dates.extend(start + timedelta(days=i) for i in range(SEASON_DAYS))
+    dates = [d for d in dates if d < today]
+    dates.append(today)
+    return dates
+
+
+def seed(db, storage, seasons: int, today: date, image_ratio: float = 0.3,
+         image_pool: int = 20, seed_value: int = 42, diary_id: int = None) -> dict:
+    """Insert records for ``seasons`` seasons into a diary and upload a pool of images"""
+    from models import Record, PlantRecord, Plant, WeatherEnum, DEFAULT_DIARY_ID
+
+    diary_id = DEFAULT_DIARY_ID if diary_id is None else diary_id
+
+    rng = random.Random(seed_value)
+    plants = db.query(Plant).filter(Plant.diary_id == diary_id).order_by(Plant.display_order).all()
+    weathers = list(WeatherEnum)
+
+    filenames = [storage.upload_image(make_jpeg(seed=i), "jpg") for i in range(image_pool)]
+
+    records = plant_records = 0
+    for day_index, record_date in enumerate(season_dates(seasons, today)):
+        record = Record(
+            diary_id=diary_id,
+            record_date=record_date,
+            weather=rng.choice(weathers),
+            temperature=round(rng.uniform(22, 36), 1),
+        )
+        db.add(record)
+        db.flush()
+        records += 1
+        for plant in plants:
+            db.add(PlantRecord(
+                diary_id=diary_id,
+                record_id=record.id,
+                plant_id=plant.id,
+                height=round(5 + day_index % SEASON_DAYS * rng.uniform(1.5, 3.0), 1),
+                comment=rng.choice(["芽が出た", "つぼみができた", "花が咲いた", "葉っぱが増えた", ""]) or None,
+                image_filename=rng.choice(filenames) if rng.random() < image_ratio else None,
+            ))
+            plant_records += 1
+        if records % 200 == 0:
+            db.commit()
+    db.commit()
+    return {"records": records, "plant_records": plant_records, "images": filenames}
@@ -0,0 +1,63 @@
+"""Packed per-day calendar summaries.
+
+A month is summarized as two bitmaps (bit ``d - 1`` set when day ``d`` has
+an entry / at least one photo) and one weather code per day, all built from
+a single aggregate query over ``records`` and ``plant_records``.
+"""
+from calendar import monthrange
+from datetime import date
+from typing import Dict, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import PlantRecord, Record, WeatherEnum
+
+# Index in this list is the weather code (0 = no entry)
+WEATHER_CODES = [None, WeatherEnum.sunny, WeatherEnum.cloudy, WeatherEnum.rainy, WeatherEnum.thunder]
+_CODE_BY_WEATHER = {weather: code for code, weather in enumerate(WEATHER_CODES) if weather}
+
+
+def day_rows(db: Session, diary_id: int, date_from: date, date_to: date):
+    """One row per record date of the diary: weather and number of photos"""
+    return (
+        db.query(
+            Record.record_date,
+            Record.weather,
+            func.count(PlantRecord.image_filename).label("photos"),
+        )
+        .outerjoin(PlantRecord, PlantRecord.record_id == Record.id)
+        .filter(Record.diary_id == diary_id, Record.record_date >= date_from, Record.record_date <= date_to)
+        .group_by(Record.id, Record.record_date, Record.weather)
+        .all()
+    )
+
+
+def pack_month(year: int, month: int, rows) -> Dict:
+    days = monthrange(year, month)[1]
+    entries = photos = 0
+    weather = [0] * days
+    for row in rows:
+        bit = 1 << (row.record_date.day - 1)
+        entries |= bit
+        if row.photos:
+            photos |= bit
+        weather[row.record_date.day - 1] = _CODE_BY_WEATHER[row.weather]
+    return {"year": year, "month": month, "days": days, "entries": entries, "photos": photos, "weather": weather}
+
+
+def month_summary(db: Session, diary_id: int, year: int, month: int) -> Dict:
+    rows = day_rows(db, diary_id, date(year, month, 1), date(year, month, monthrange(year, month)[1]))
+    return pack_month(year, month, rows)
+
+
+def season_summary(db: Session, diary_id: int, year: int) -> List[Dict]:
+    """All months of a season (calendar year) from one query"""
+    by_month: Dict[int, list] = {month: [] for month in range(1, 13)}
+    for row in day_rows(db, diary_id, date(year, 1, 1), date(year, 12, 31)):
+        by_month[row.record_date.month].append(row)
+    return [pack_month(year, month, rows) for month, rows in by_month.items()]
+
+
+def weather_legend() -> List:
+    return [weather.value if weather else None for weather in WEATHER_CODES]
@@ -0,0 +1,111 @@
+"""Columnar (Arrow / Parquet) form of the growth data set.
+
+One row per plant record, joined with its record (date, weather,
+temperature) and plant; a record without plant records still gets one row
+with the plant columns null, so the set round-trips to the tables. Rows are
+read through a streaming cursor and converted ``COLUMNAR_BATCH_ROWS`` at a
+time, so building a file never holds the whole result set as Python objects.
+"""
+from datetime import date
+from typing import Iterable, Iterator, Optional
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Plant, PlantRecord, Record
+
+COLUMNAR_BATCH_ROWS = int(os.getenv("COLUMNAR_BATCH_ROWS", "5000"))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+_LABELS = pa.dictionary(pa.int8(), pa.string())
+
+GROWTH_SCHEMA = pa.schema([
+    ("record_id", pa.int32()),
+    ("record_date", pa.date32()),
+    ("weather", _LABELS),
+    ("temperature", pa.float64()),
+    ("plant_record_id", pa.int32()),
+    ("plant_id", pa.int32()),
+    ("plant_name", _LABELS),
+    ("height", pa.float64()),
+    ("comment", pa.string()),
+    ("image_filename", pa.string()),
+    ("image_width", pa.int32()),
+    ("image_height", pa.int32()),
+])
+
+
+def growth_query(diary_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """SELECT of the diary's growth rows in ``GROWTH_SCHEMA`` column order"""
+    statement = (
+        select(
+            Record.id.label("record_id"),
+            Record.record_date,
+            Record.weather,
+            Record.temperature,
+            PlantRecord.id.label("plant_record_id"),
+            PlantRecord.plant_id,
+            Plant.name.label("plant_name"),
+            PlantRecord.height,
+            PlantRecord.comment,
+            PlantRecord.image_filename,
+            PlantRecord.image_width,
+            PlantRecord.image_height,
+        )
+        .outerjoin(PlantRecord, PlantRecord.record_id == Record.id)
+        .outerjoin(Plant, Plant.id == PlantRecord.plant_id)
+        .where(Record.diary_id == diary_id)
+        .order_by(Record.record_date, Plant.display_order, PlantRecord.id)
+    )
+    if date_from:
+        statement = statement.where(Record.record_date >= date_from)
+    if date_to:
+        statement = statement.where(Record.record_date <= date_to)
+    return statement
+
+
+def _to_batch(rows) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    # DECIMAL columns arrive as Decimal, the enum as WeatherEnum
+    columns[2] = [weather.value for weather in columns[2]]
+    columns[3] = [float(value) for value in columns[3]]
+    columns[7] = [float(value) if value is not None else None for value in columns[7]]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, GROWTH_SCHEMA)],
+        schema=GROWTH_SCHEMA,
+    )
+
+
+def iter_batches(db: Session, statement, batch_size: int = COLUMNAR_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Record batches of ``statement`` read through a server-side cursor"""
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for rows in result.partitions():
+            yield _to_batch(rows)
+    finally:
+        result.close()
+
+
+def write_parquet(batches: Iterable[pa.RecordBatch], compression: str = PARQUET_COMPRESSION) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pq.ParquetWriter(sink, GROWTH_SCHEMA, compression=compression) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def write_arrow_ipc(batches: Iterable[pa.RecordBatch], compression: str = PARQUET_COMPRESSION) -> bytes:
+    """Arrow IPC file (Feather v2) with compressed buffers"""
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_file(sink, GROWTH_SCHEMA, options=options) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def read_parquet(data: bytes) -> pa.Table:
+    return pq.read_table(pa.BufferReader(data))
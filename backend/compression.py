@@ -0,0 +1,177 @@
+"""Negotiated response compression.
+
+``CompressionMiddleware`` gzip/brotli-encodes text and JSON responses above
+``COMPRESSION_MIN_SIZE`` according to the client's ``Accept-Encoding``.
+Cacheable endpoints go through ``cached_json`` instead: the serialized body,
+its ETag and each compressed variant are kept in a ``VersionedCache`` entry,
+so repeated hits are served (or answered with 304) without re-serializing or
+re-compressing. The middleware leaves responses that already carry a
+``Content-Encoding`` alone.
+"""
+from typing import Any, Callable, Dict, Hashable, Optional
+import gzip
+import hashlib
+import json
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+from data_version import VersionedCache
+from database import replica_engine, wants_primary
+from models import DEFAULT_DIARY_ID
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip only without it
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Levels for compressing on the fly / once for cached bodies
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "image/svg+xml", "text/")
+# Streamed responses that must reach the client chunk by chunk
+UNBUFFERED_TYPES = ("text/event-stream",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header (``None`` = identity)"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    def weight(encoding: str) -> float:
+        return weights.get(encoding, weights.get("*", 0.0))
+
+    candidates = (["br"] if brotli else []) + ["gzip"]
+    best = max(candidates, key=weight)  # ties keep the order above: br first
+    return best if weight(best) > 0 else None
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = (content_type or "").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(UNBUFFERED_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing buffered text/JSON responses"""
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        start_message = None
+        chunks = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start_message["headers"])
+            if "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if encoding and len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class CachedBody:
+    """A serialized JSON body with its ETag and lazily built compressed variants"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        # Weak: the same tag covers every Content-Encoding of the body
+        self.etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        self._encoded: Dict[str, bytes] = {}
+
+    @classmethod
+    def from_data(cls, data: Any) -> "CachedBody":
+        # Same serialization as Starlette's JSONResponse
+        return cls(json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8"))
+
+    def encoded(self, encoding: str) -> bytes:
+        body = self._encoded.get(encoding)
+        if body is None:
+            # Racing requests may both compress once; either result is fine
+            body = self._encoded[encoding] = compress(self.body, encoding, cached=True)
+        return body
+
+    def response(self, request: Request, minimum_size: int = None) -> Response:
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+
+        minimum_size = COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding and len(self.body) >= minimum_size:
+            headers["Content-Encoding"] = encoding
+            return Response(self.encoded(encoding), media_type="application/json", headers=headers)
+        return Response(self.body, media_type="application/json", headers=headers)
+
+
+def cached_json(request: Request, cache: VersionedCache, key: Hashable, builder: Callable[[], Any],
+                diary_id: int = DEFAULT_DIARY_ID) -> Response:
+    """JSON response for ``builder()``, cached per diary version with its compressed forms
+
+    Clients in their read-your-writes window bypass the cache: with a replica
+    the versions are read from it, so an entry can predate the client's own
+    write until the replica has replayed it.
+    """
+    if replica_engine is not None and wants_primary(request):
+        return CachedBody.from_data(builder()).response(request)
+    entry = cache.get_or_set(key, lambda: CachedBody.from_data(builder()), diary_id)
+    return entry.response(request)
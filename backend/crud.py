@@ -1,33 +1,120 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc
-from models import Record, PlantRecord, Plant, User
+from sqlalchemy import and_, or_, desc
+from models import Record, PlantRecord, Plant, User, WeatherEnum, DEFAULT_DIARY_ID
 from schemas import RecordCreate, RecordUpdate, PlantRecordCreate, PlantRecordUpdate
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import date
 
 # Record CRUD operations
 def get_record(db: Session, record_id: int) -> Optional[Record]:
     return db.query(Record).filter(Record.id == record_id).first()
 
-def get_record_by_date(db: Session, record_date: date) -> Optional[Record]:
-    return db.query(Record).filter(Record.record_date == record_date).first()
+def get_record_by_date(db: Session, record_date: date, diary_id: int = DEFAULT_DIARY_ID) -> Optional[Record]:
+    return db.query(Record).filter(Record.diary_id == diary_id, Record.record_date == record_date).first()
 
-def get_records(db: Session, skip: int = 0, limit: int = 100, plant_id: Optional[int] = None) -> List[Record]:
-    query = db.query(Record).order_by(desc(Record.record_date))
+def get_records(db: Session, skip: int = 0, limit: int = 100, plant_id: Optional[int] = None,
+                diary_id: int = DEFAULT_DIARY_ID) -> List[Record]:
+    query = db.query(Record).filter(Record.diary_id == diary_id).order_by(desc(Record.record_date))
     
     if plant_id:
         query = query.join(PlantRecord).filter(PlantRecord.plant_id == plant_id)
     
     return query.offset(skip).limit(limit).all()
 
-def create_record(db: Session, record: RecordCreate) -> Record:
+def plant_records_query(
+    db: Session,
+    diary_id: int = DEFAULT_DIARY_ID,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    plant_id: Optional[int] = None,
+    weather: Optional[WeatherEnum] = None,
+    has_image: Optional[bool] = None,
+):
+    """A diary's plant records joined with their record and plant, newest first
+
+    Each filter maps to an index: plant_id (+ has_image) to
+    ix_plant_records_plant_id_record_id, date range to
+    uq_records_diary_id_record_date, weather to
+    ix_records_diary_id_weather_record_date. The indexes only narrow the
+    rows; height, comment etc. are then read from the table rows.
+    """
+    query = (
+        db.query(
+            PlantRecord.id,
+            PlantRecord.record_id,
+            PlantRecord.plant_id,
+            PlantRecord.height,
+            PlantRecord.comment,
+            PlantRecord.image_filename,
+            Record.record_date,
+            Record.weather,
+            Record.temperature,
+            Plant.name.label("plant_name"),
+        )
+        .join(Record, Record.id == PlantRecord.record_id)
+        .join(Plant, Plant.id == PlantRecord.plant_id)
+        .filter(Record.diary_id == diary_id)
+    )
+    if date_from:
+        query = query.filter(Record.record_date >= date_from)
+    if date_to:
+        query = query.filter(Record.record_date <= date_to)
+    if plant_id:
+        query = query.filter(PlantRecord.plant_id == plant_id)
+    if weather:
+        query = query.filter(Record.weather == weather)
+    if has_image is not None:
+        query = query.filter(PlantRecord.image_filename.isnot(None) if has_image else PlantRecord.image_filename.is_(None))
+    
+    return query.order_by(desc(Record.record_date), PlantRecord.plant_id)
+
+def query_plant_records(db: Session, skip: int = 0, limit: int = 100, **filters):
+    """Run ``plant_records_query`` for one page"""
+    return plant_records_query(db, **filters).offset(skip).limit(limit).all()
+
+def gallery_page(db: Session, diary_id: int = DEFAULT_DIARY_ID, plant_id: Optional[int] = None,
+                 after: Optional[Tuple[int, int]] = None, limit: int = 30):
+    """A diary's image-bearing plant records after the ``(record_id, id)`` keyset cursor
+
+    Scans ix_plant_records_gallery (plant_id, has_image, record_id) or
+    ix_plant_records_gallery_diary (diary_id, has_image, record_id) in
+    descending order.
+    """
+    query = (
+        db.query(
+            PlantRecord.id,
+            PlantRecord.record_id,
+            PlantRecord.plant_id,
+            PlantRecord.image_filename,
+            PlantRecord.image_width,
+            PlantRecord.image_height,
+            Record.record_date,
+            Plant.name.label("plant_name"),
+        )
+        .join(Record, Record.id == PlantRecord.record_id)
+        .join(Plant, Plant.id == PlantRecord.plant_id)
+        .filter(PlantRecord.diary_id == diary_id, PlantRecord.has_image == True)
+    )
+    if plant_id:
+        query = query.filter(PlantRecord.plant_id == plant_id)
+    if after:
+        record_id, plant_record_id = after
+        query = query.filter(or_(
+            PlantRecord.record_id < record_id,
+            and_(PlantRecord.record_id == record_id, PlantRecord.id < plant_record_id),
+        ))
+    
+    return query.order_by(desc(PlantRecord.record_id), desc(PlantRecord.id)).limit(limit).all()
+
+def create_record(db: Session, record: RecordCreate, diary_id: int = DEFAULT_DIARY_ID) -> Record:
     # Check if record already exists for this date
-    existing_record = get_record_by_date(db, record.record_date)
+    existing_record = get_record_by_date(db, record.record_date, diary_id)
     if existing_record:
         raise ValueError(f"Record already exists for date {record.record_date}")
     
     # Create main record
     db_record = Record(
+        diary_id=diary_id,
         record_date=record.record_date,
         weather=record.weather,
         temperature=record.temperature
@@ -89,8 +176,8 @@ def delete_record(db: Session, record_id: int) -> bool:
     return True
 
 # Plant CRUD operations
-def get_plants(db: Session, active_only: bool = True) -> List[Plant]:
-    query = db.query(Plant).order_by(Plant.display_order)
+def get_plants(db: Session, active_only: bool = True, diary_id: int = DEFAULT_DIARY_ID) -> List[Plant]:
+    query = db.query(Plant).filter(Plant.diary_id == diary_id).order_by(Plant.display_order)
     if active_only:
         query = query.filter(Plant.is_active == True)
     return query.all()
@@ -0,0 +1,222 @@
+"""Per-diary data versions for cross-worker cache invalidation.
+
+Every transaction that inserts, updates or deletes records, plant records or
+plants bumps the diary's row in ``data_versions`` before it commits, whether
+it comes from the API or from SQLAdmin (the hooks are registered on the
+``Session`` class). Each worker polls the counters at most once per
+``DATA_VERSION_CHECK_INTERVAL`` and ``VersionedCache`` entries built from an
+older version of their diary are dropped, so in-process caches stay coherent
+without a cache server and a write to one diary leaves the others cached.
+
+When a read replica is configured the counters are read from the replica, so
+the version a cache entry is stored under never runs ahead of the data the
+replica served. The cache can then lag behind the primary by the
+replication delay; clients that must see their own writes (see
+``database.wants_primary``) skip it and read the primary directly.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database import engine, replica_engine
+from models import DEFAULT_DIARY_ID, DataVersion, Plant, PlantRecord, Record
+from query_budget import uncounted
+
+logger = logging.getLogger(__name__)
+
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv("DATA_VERSION_CHECK_INTERVAL", "1"))
+
+# Models whose changes invalidate cached diary data
+VERSIONED_MODELS = (Record, PlantRecord, Plant)
+VERSIONED_TABLES = frozenset(model.__table__ for model in VERSIONED_MODELS)
+
+_BUMPED_KEY = "data_version"
+_BULK_DIARIES_KEY = "data_version_bulk_diaries"
+
+
+def diary_of(session: Session, obj) -> int:
+    """Diary of a versioned object; fills in ``PlantRecord.diary_id`` from its record"""
+    if obj.diary_id is None:
+        if isinstance(obj, PlantRecord):
+            record = obj.record if "record" in obj.__dict__ else session.get(Record, obj.record_id)
+            obj.diary_id = record.diary_id if record is not None else DEFAULT_DIARY_ID
+        else:
+            obj.diary_id = DEFAULT_DIARY_ID
+    return obj.diary_id
+
+
+def bump_data_version(session: Session, diary_id: int = DEFAULT_DIARY_ID) -> int:
+    """Increment the diary's version inside the session's transaction
+
+    Only the first call per diary and transaction touches the database; the
+    new value is kept in ``session.info`` and returned by later calls. The
+    row lock also serializes writers of the same diary until they commit.
+    """
+    bumped = session.info.setdefault(_BUMPED_KEY, {})
+    if diary_id in bumped:
+        return bumped[diary_id]
+
+    table = DataVersion.__table__
+    conn = session.connection()
+    result = conn.execute(
+        update(table).where(table.c.id == diary_id).values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(id=diary_id, version=1))
+    version = conn.execute(select(table.c.version).where(table.c.id == diary_id)).scalar_one()
+    bumped[diary_id] = version
+    return version
+
+
+def bulk_statement_diaries(orm_execute_state) -> Set[int]:
+    """Diaries touched by a bulk UPDATE / DELETE / INSERT on a versioned table
+
+    Looked up once per statement and shared by every hook that needs it.
+    """
+    session = orm_execute_state.session
+    cached = session.info.get(_BULK_DIARIES_KEY)
+    if cached and cached[0] is orm_execute_state.statement:
+        return cached[1]
+
+    statement = orm_execute_state.statement
+    model = orm_execute_state.bind_mapper.class_
+    if orm_execute_state.is_insert:
+        params = orm_execute_state.parameters or {}
+        rows: Iterable[dict] = params if isinstance(params, list) else [params]
+        diaries = {row.get("diary_id", DEFAULT_DIARY_ID) for row in rows}
+    else:
+        query = select(model.diary_id).distinct()
+        if statement.whereclause is not None:
+            query = query.where(statement.whereclause)
+        diaries = set(session.execute(query).scalars())
+    session.info[_BULK_DIARIES_KEY] = (statement, diaries)
+    return diaries
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_on_flush(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, VERSIONED_MODELS):
+            bump_data_version(session, diary_of(session, obj))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_on_bulk_statement(orm_execute_state):
+    # query(...).delete() / update() bypass the flush
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.local_table in VERSIONED_TABLES:
+        for diary_id in bulk_statement_diaries(orm_execute_state):
+            bump_data_version(orm_execute_state.session, diary_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_local_version(session):
+    bumped = session.info.pop(_BUMPED_KEY, None)
+    session.info.pop(_BULK_DIARIES_KEY, None)
+    if bumped and replica_engine is None:
+        # This worker sees its own writes immediately. Not with a replica:
+        # entries built from it would be stored under a version it lacks
+        for diary_id, version in bumped.items():
+            data_version.observe(diary_id, version)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_version(session):
+    session.info.pop(_BUMPED_KEY, None)
+    session.info.pop(_BULK_DIARIES_KEY, None)
+
+
+class DataVersionWatcher:
+    """Caches the diaries' versions, re-reading them at most once per interval"""
+
+    def __init__(self, interval: float = DATA_VERSION_CHECK_INTERVAL):
+        self.interval = interval
+        self.versions: Optional[Dict[int, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, diary_id: int, version: int):
+        with self._lock:
+            if self.versions is not None and version > self.versions.get(diary_id, 0):
+                self.versions[diary_id] = version
+
+    def current(self, diary_id: int = DEFAULT_DIARY_ID) -> Optional[int]:
+        """Latest known version of the diary (``None`` if it could not be read)"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.interval:
+            self._checked_at = now
+            try:
+                # One small query for all diaries, on behalf of every request
+                # of the interval, so not charged to the one that triggers it
+                table = DataVersion.__table__
+                with uncounted(), (replica_engine or engine).connect() as conn:
+                    rows = conn.execute(select(table.c.id, table.c.version)).all()
+                with self._lock:
+                    self.versions = {row.id: row.version for row in rows}
+            except SQLAlchemyError as e:
+                logger.warning("Could not read data version: %s", e)
+                with self._lock:
+                    self.versions = None
+        versions = self.versions
+        return None if versions is None else versions.get(diary_id, 0)
+
+
+data_version = DataVersionWatcher()
+
+
+class VersionedCache:
+    """Small in-process LRU cache whose entries expire when their diary's version changes"""
+
+    def __init__(self, name: str, maxsize: int = 128, watcher: DataVersionWatcher = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.watcher = watcher or data_version
+        # (diary_id, key) -> (version, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None, diary_id: int = DEFAULT_DIARY_ID) -> Any:
+        version = self.watcher.current(diary_id)
+        with self._lock:
+            entry = self._entries.get((diary_id, key))
+            if entry is None or version is None:
+                return default
+            if entry[0] != version:
+                logger.debug("Cache %s entry %s expired (version %s -> %s)", self.name, key, entry[0], version)
+                del self._entries[(diary_id, key)]
+                return default
+            self._entries.move_to_end((diary_id, key))
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, version: int = None, diary_id: int = DEFAULT_DIARY_ID):
+        """Store ``value`` built at ``version``; skipped if the diary moved past it"""
+        current = self.watcher.current(diary_id)
+        if current is None or (version is not None and version != current):
+            return  # Version unknown or value built from older data
+        with self._lock:
+            self._entries[(diary_id, key)] = (current, value)
+            self._entries.move_to_end((diary_id, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, builder: Callable[[], Any], diary_id: int = DEFAULT_DIARY_ID) -> Any:
+        sentinel = object()
+        value = self.get(key, sentinel, diary_id)
+        if value is sentinel:
+            version = self.watcher.current(diary_id)
+            value = builder()
+            self.set(key, value, version, diary_id)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
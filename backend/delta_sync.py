@@ -0,0 +1,161 @@
+"""Delta sync for offline-capable clients (``GET /api/records/changes``).
+
+Every flush that inserts or updates a record or plant record stamps the row's
+``change_seq`` with its diary's data version for the transaction (see
+``data_version``), and every delete leaves a row in ``tombstones`` with the
+same sequence number. Writers of a diary serialize on its ``data_versions``
+row, so sequence numbers become visible in increasing order. A client
+holding cursor ``N`` therefore only needs the diary's rows with
+``change_seq > N``, an index range scan on ``(diary_id, change_seq)`` whose
+cost follows the number of changes rather than the size of the diary.
+
+Bulk ``query(...).update()`` / ``delete()`` statements on these tables are
+handled too: updates get ``change_seq`` added to their SET clause and deletes
+write tombstones for the matched rows first.
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, event, insert, select
+from sqlalchemy.orm import Session
+
+from data_version import bulk_statement_diaries, bump_data_version, diary_of
+from models import DataVersion, PlantRecord, Record, Tombstone
+
+SYNCED_MODELS = (Record, PlantRecord)
+_ENTITY_NAMES = {Record.__table__: "record", PlantRecord.__table__: "plant_record"}
+
+CHANGES_PAGE_SIZE = 500
+
+
+def _tombstone_values(model, diary_id: int, entity_id: int, record_id: Optional[int], seq: int) -> Dict[str, Any]:
+    return {
+        "diary_id": diary_id,
+        "entity": _ENTITY_NAMES[model.__table__],
+        "entity_id": entity_id,
+        "record_id": record_id,
+        "change_seq": seq,
+    }
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, SYNCED_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, SYNCED_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, SYNCED_MODELS)]
+    if not changed and not deleted:
+        return
+
+    for obj in changed:
+        obj.change_seq = bump_data_version(session, diary_of(session, obj))
+    for obj in deleted:
+        diary_id = diary_of(session, obj)
+        record_id = obj.id if isinstance(obj, Record) else obj.record_id
+        seq = bump_data_version(session, diary_id)
+        session.add(Tombstone(**_tombstone_values(type(obj), diary_id, obj.id, record_id, seq)))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _stamp_bulk_statement(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in SYNCED_MODELS:
+        return
+
+    session = orm_execute_state.session
+    statement = orm_execute_state.statement
+    model = mapper.class_
+    seqs = {diary_id: bump_data_version(session, diary_id) for diary_id in bulk_statement_diaries(orm_execute_state)}
+    if not seqs:
+        return  # Matches no rows
+    if orm_execute_state.is_update:
+        orm_execute_state.statement = statement.values(change_seq=case(seqs, value=model.diary_id))
+        return
+
+    record_id_column = Record.id if model is Record else PlantRecord.record_id
+    query = select(model.diary_id, model.id, record_id_column)
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    matched = session.execute(query).all()
+    if matched:
+        session.execute(
+            insert(Tombstone),
+            [_tombstone_values(model, diary_id, entity_id, record_id, seqs[diary_id])
+             for diary_id, entity_id, record_id in matched],
+        )
+
+
+def record_to_dict(record: Record) -> Dict[str, Any]:
+    return {
+        "id": record.id,
+        "date": record.record_date.isoformat(),
+        "createdAt": record.created_at.isoformat() if record.created_at else None,
+        "updatedAt": record.updated_at.isoformat() if record.updated_at else None,
+        "weather": record.weather.value,
+        "temperature": float(record.temperature),
+        "version": record.version,
+    }
+
+
+def plant_record_to_dict(plant_record: PlantRecord) -> Dict[str, Any]:
+    return {
+        "id": plant_record.id,
+        "recordId": plant_record.record_id,
+        "plantId": plant_record.plant_id,
+        "height": float(plant_record.height) if plant_record.height is not None else None,
+        "comment": plant_record.comment or "",
+        "image": f"/api/images/{plant_record.image_filename}" if plant_record.image_filename else None,
+        "imageWidth": plant_record.image_width,
+        "imageHeight": plant_record.image_height,
+    }
+
+
+def _fetch(db: Session, model, diary_id: int, since: int, until: int, limit: Optional[int]) -> List:
+    query = (
+        db.query(model)
+        .filter(model.diary_id == diary_id, model.change_seq > since, model.change_seq <= until)
+        .order_by(model.change_seq, model.id)
+    )
+    return query.limit(limit).all() if limit is not None else query.all()
+
+
+def changes_since(db: Session, diary_id: int, since: Optional[int], limit: int = CHANGES_PAGE_SIZE) -> Dict[str, Any]:
+    """The diary's rows changed after cursor ``since`` (``None`` = full sync), at most ~``limit`` per table"""
+    full_sync = since is None
+    since = -1 if full_sync else since
+    # Read first: the rows below come from the same snapshot, so nothing at
+    # or below this version can still appear later
+    until = db.query(DataVersion.version).filter(DataVersion.id == diary_id).scalar() or 0
+
+    models = [Record, PlantRecord] + ([] if full_sync else [Tombstone])
+    batches = {model: _fetch(db, model, diary_id, since, until, limit + 1) for model in models}
+
+    # Cut the page at a transaction boundary so a cursor never splits one
+    overflow = [rows[limit].change_seq for rows in batches.values() if len(rows) > limit]
+    has_more = bool(overflow)
+    if overflow:
+        until = min(overflow) - 1
+        if until <= since:
+            # A single transaction larger than a page: send all of it
+            until = min(overflow)
+            batches = {model: _fetch(db, model, diary_id, since, until, None) for model in models}
+        else:
+            batches = {model: [row for row in rows if row.change_seq <= until] for model, rows in batches.items()}
+
+    # Rows in the page exist now, so a tombstone for the same id (the id was
+    # reused after a delete, e.g. on SQLite) is already superseded
+    live = {"record": {row.id for row in batches[Record]}, "plant_record": {row.id for row in batches[PlantRecord]}}
+    deleted = {"record": [], "plant_record": []}
+    for tombstone in batches.get(Tombstone, []):
+        if tombstone.entity_id not in live[tombstone.entity]:
+            deleted[tombstone.entity].append(tombstone.entity_id)
+    return {
+        "records": [record_to_dict(row) for row in batches[Record]],
+        "plantRecords": [plant_record_to_dict(row) for row in batches[PlantRecord]],
+        "deleted": {"records": deleted["record"], "plantRecords": deleted["plant_record"]},
+        "cursor": str(until),
+        "hasMore": has_more,
+    }
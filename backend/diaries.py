@@ -0,0 +1,76 @@
+"""Diary (tenant) selection for API requests.
+
+Every diary endpoint works on one diary, named by the ``X-Diary-Id`` header
+or the ``diary`` query parameter (EventSource and ``<img>`` URLs cannot set
+headers) and defaulting to the original diary. Active diary ids are cached
+per worker together with the diary's data version, so resolving the diary
+costs no query after the first request. Deactivating a diary bumps its
+version (see ``deactivated``), which every worker notices with its next
+data version poll and re-checks the diary.
+"""
+from typing import Dict
+import threading
+
+from fastapi import HTTPException, Request
+
+from data_version import bump_data_version, data_version
+from database import SessionLocal
+from models import DEFAULT_DIARY_ID, Diary
+from query_budget import uncounted
+
+DIARY_HEADER = "X-Diary-Id"
+DIARY_QUERY_PARAM = "diary"
+
+# diary id -> data version at which the diary was found active
+_known_diaries: Dict[int, int] = {}
+_lock = threading.Lock()
+
+
+def _diary_exists(diary_id: int) -> bool:
+    version = data_version.current(diary_id)
+    with _lock:
+        if version is not None and _known_diaries.get(diary_id) == version:
+            return True
+    db = SessionLocal()
+    try:
+        # Shared lookup, cached for later requests: not charged to this route
+        with uncounted():
+            exists = db.query(Diary.id).filter(Diary.id == diary_id, Diary.is_active == True).first() is not None
+    finally:
+        db.close()
+    with _lock:
+        if exists and version is not None:
+            _known_diaries[diary_id] = version
+        else:
+            _known_diaries.pop(diary_id, None)
+    return exists
+
+
+def deactivated(diary_id: int):
+    """Make every worker stop serving a deactivated diary
+
+    Bumps the diary's data version (picked up by each worker's poll) and
+    drops it from this worker's cache at once.
+    """
+    db = SessionLocal()
+    try:
+        bump_data_version(db, diary_id)
+        db.commit()
+    finally:
+        db.close()
+    with _lock:
+        _known_diaries.pop(diary_id, None)
+
+
+def get_diary_id(request: Request) -> int:
+    """FastAPI dependency: id of the diary the request is about"""
+    raw = request.headers.get(DIARY_HEADER) or request.query_params.get(DIARY_QUERY_PARAM)
+    if raw is None:
+        return DEFAULT_DIARY_ID
+    try:
+        diary_id = int(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="無効な日記IDです")
+    if not _diary_exists(diary_id):
+        raise HTTPException(status_code=404, detail="日記が見つかりません")
+    return diary_id
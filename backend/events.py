@@ -0,0 +1,305 @@
+"""Live change notifications for ``GET /api/events`` (server-sent events).
+
+Write paths call ``emit`` to add a row to the ``change_events`` outbox inside
+their own transaction, so a notification exists exactly when its change was
+committed. That alone does not order them: auto-increment ids are handed out
+at insert time, so a transaction holding a lower id can commit after one
+holding a higher id, and a reader that remembers "the highest id seen" would
+skip it. ``emit`` therefore also stamps the event with its diary's data
+version (``change_seq``, as delta sync does). Writers of a diary serialize on
+its ``data_versions`` row until they commit, so within a diary the events
+become visible in ``(change_seq, id)`` order and that pair is a safe cursor.
+
+In each worker one poller task reads, for every diary with a subscriber, the
+events after that diary's cursor (an index range scan per diary) while at
+least one client is subscribed, and ``Broadcaster`` fans them out to the
+diary's streams, so an edit made through any worker reaches clients
+connected to every worker. Commits in this worker wake the poller at once
+instead of waiting for the next poll.
+
+Each subscriber has a bounded queue. One that falls ``EVENTS_QUEUE_SIZE``
+events behind gets its backlog replaced by a single ``resync`` event and
+reloads, instead of the server buffering for it without bound.
+"""
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import json
+import logging
+import os
+
+from sqlalchemy import and_, event, or_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from data_version import bump_data_version
+from database import SessionLocal
+from models import ChangeEvent, get_jst_now
+
+logger = logging.getLogger(__name__)
+
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_RETENTION_HOURS = int(os.getenv("EVENTS_RETENTION_HOURS", "24"))
+# Missed events replayed to a reconnecting client before asking it to resync
+EVENTS_REPLAY_LIMIT = 200
+# Client reconnect delay (EventSource "retry" field)
+RECONNECT_MS = 3000
+
+RESYNC = {"type": "resync"}
+_CLOSE = object()
+_POLL_BATCH = 500
+_EMITTED_KEY = "change_events_emitted"
+
+
+# (change_seq, id) of the last event a reader has seen of a diary
+Cursor = Tuple[int, int]
+
+
+def emit(db: Session, kind: str, diary_id: int, **payload):
+    """Stage a change notification in the caller's transaction"""
+    seq = bump_data_version(db, diary_id)
+    db.add(ChangeEvent(diary_id=diary_id, kind=kind, payload=payload, change_seq=seq))
+    db.info[_EMITTED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_after_commit(session):
+    if session.info.pop(_EMITTED_KEY, False):
+        broadcaster.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_emitted(session):
+    session.info.pop(_EMITTED_KEY, None)
+
+
+def event_to_dict(change: ChangeEvent) -> Dict[str, Any]:
+    return {
+        "id": change.id,
+        "seq": change.change_seq,
+        "type": change.kind,
+        "diaryId": change.diary_id,
+        **(change.payload or {}),
+    }
+
+
+def cursor_of(message: Dict[str, Any]) -> Cursor:
+    return message["seq"], message["id"]
+
+
+def format_sse(message: Dict[str, Any]) -> str:
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    if message.get("id"):
+        return f"id: {message['id']}\ndata: {data}\n\n"
+    return f"data: {data}\n\n"
+
+
+# -- outbox queries --------------------------------------------------------
+def latest_cursor(diary_id: int) -> Cursor:
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(ChangeEvent.change_seq, ChangeEvent.id)
+            .filter(ChangeEvent.diary_id == diary_id)
+            .order_by(ChangeEvent.change_seq.desc(), ChangeEvent.id.desc())
+            .first()
+        )
+        return (row.change_seq, row.id) if row else (0, 0)
+    finally:
+        db.close()
+
+
+def _after(diary_id: int, cursor: Cursor):
+    seq, last_id = cursor
+    return and_(
+        ChangeEvent.diary_id == diary_id,
+        or_(ChangeEvent.change_seq > seq, and_(ChangeEvent.change_seq == seq, ChangeEvent.id > last_id)),
+    )
+
+
+def events_after(cursors: Dict[int, Cursor], limit: int) -> List[Dict[str, Any]]:
+    """Events after each diary's cursor, in ``(diary, change_seq, id)`` order"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(ChangeEvent)
+            .filter(or_(*(_after(diary_id, cursor) for diary_id, cursor in cursors.items())))
+            .order_by(ChangeEvent.diary_id, ChangeEvent.change_seq, ChangeEvent.id)
+            .limit(limit)
+            .all()
+        )
+        return [event_to_dict(row) for row in rows]
+    finally:
+        db.close()
+
+
+def event_cursor(diary_id: int, event_id: int) -> Optional[Cursor]:
+    """Cursor of one of the diary's events, ``None`` if there is no such event (any more)"""
+    db = SessionLocal()
+    try:
+        seq = (
+            db.query(ChangeEvent.change_seq)
+            .filter(ChangeEvent.id == event_id, ChangeEvent.diary_id == diary_id)
+            .scalar()
+        )
+        return None if seq is None else (seq, event_id)
+    finally:
+        db.close()
+
+
+def missed_events(diary_id: int, last_id: int) -> Optional[List[Dict[str, Any]]]:
+    """The diary's events after event ``last_id`` for a reconnecting client, ``None`` if it must resync"""
+    cursor = event_cursor(diary_id, last_id)
+    if cursor is None:
+        return None  # Purged (and possibly what followed it), or not this diary's
+    backlog = events_after({diary_id: cursor}, EVENTS_REPLAY_LIMIT + 1)
+    return None if len(backlog) > EVENTS_REPLAY_LIMIT else backlog
+
+
+def purge_expired(db: Session) -> int:
+    expires_before = (get_jst_now() - timedelta(hours=EVENTS_RETENTION_HOURS)).replace(tzinfo=None)
+    deleted = (
+        db.query(ChangeEvent)
+        .filter(ChangeEvent.created_at < expires_before)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+# -- fan-out ---------------------------------------------------------------
+class Subscriber:
+    def __init__(self, maxsize: int, diary_id: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.diary_id = diary_id
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop the backlog, the client reloads instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class Broadcaster:
+    def __init__(self, poll_interval: float = EVENTS_POLL_INTERVAL, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers = set()
+        # Per diary with subscribers: the last event published
+        self._cursors: Dict[int, Cursor] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self, diary_id: int) -> AsyncIterator[Subscriber]:
+        subscriber = Subscriber(self.queue_size, diary_id)
+        if diary_id not in self._cursors:
+            # Before the caller replays missed events, so nothing falls in between
+            await self._start_cursor(diary_id)
+        self._subscribers.add(subscriber)
+        self._ensure_poller()
+        try:
+            yield subscriber
+        finally:
+            self._subscribers.discard(subscriber)
+            if not any(other.diary_id == diary_id for other in self._subscribers):
+                self._cursors.pop(diary_id, None)
+
+    def publish(self, message, diary_id: Optional[int] = None):
+        """Queue ``message`` for the diary's subscribers (all of them if ``None``)"""
+        for subscriber in list(self._subscribers):
+            if diary_id is None or subscriber.diary_id == diary_id:
+                subscriber.offer(message)
+
+    def wake(self):
+        """Poll now (callable from any thread)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def close(self):
+        """End all streams (server shutdown)"""
+        self.publish(_CLOSE)
+
+    def _ensure_poller(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            # Empty context: the poller's queries must not be counted against
+            # the request that happened to start it
+            self._task = asyncio.create_task(self._poll(), context=contextvars.Context())
+
+    async def _start_cursor(self, diary_id: int):
+        try:
+            cursor = await asyncio.to_thread(latest_cursor, diary_id)
+        except SQLAlchemyError as e:
+            logger.warning("Reading change events failed: %s", e)
+            return  # The poller tries again
+        self._cursors.setdefault(diary_id, cursor)
+
+    async def _poll(self):
+        # Runs only while somebody listens
+        while self._subscribers:
+            self._wakeup.clear()
+            for diary_id in {subscriber.diary_id for subscriber in self._subscribers} - set(self._cursors):
+                await self._start_cursor(diary_id)
+            rows = []
+            if self._cursors:
+                try:
+                    rows = await asyncio.to_thread(events_after, dict(self._cursors), _POLL_BATCH)
+                except SQLAlchemyError as e:
+                    logger.warning("Reading change events failed: %s", e)
+            for row in rows:
+                if row["diaryId"] in self._cursors:
+                    self._cursors[row["diaryId"]] = cursor_of(row)
+                    self.publish(row, row["diaryId"])
+            if len(rows) == _POLL_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+broadcaster = Broadcaster()
+
+
+async def stream(diary_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """SSE body for one diary: missed events (``Last-Event-ID``), then live events and heartbeats"""
+    async with broadcaster.subscribe(diary_id) as subscriber:
+        yield f"retry: {RECONNECT_MS}\n\n"
+
+        replayed_up_to: Cursor = (0, 0)
+        if last_event_id and last_event_id.isdigit():
+            backlog = await asyncio.to_thread(missed_events, diary_id, int(last_event_id))
+            if backlog is None:
+                yield format_sse(RESYNC)
+            else:
+                for message in backlog:
+                    replayed_up_to = cursor_of(message)
+                    yield format_sse(message)
+
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            if message is _CLOSE:
+                break
+            if message.get("id") and cursor_of(message) <= replayed_up_to:
+                continue  # Already sent from the backlog
+            yield format_sse(message)
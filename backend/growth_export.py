@@ -0,0 +1,62 @@
+"""Columnar export of a diary's growth data for notebooks.
+
+``GET /api/export/growth`` serves the joined records x plant records x
+plants set (see ``columnar``) as Parquet or an Arrow IPC file. A file is
+built once per diary data version, batch by batch from a streaming cursor,
+and kept in object storage under that version; later downloads of the same
+version are a single object fetch, and files of older versions are removed
+when a newer one is built.
+"""
+from typing import Optional, Tuple
+import logging
+
+from minio.error import S3Error
+from sqlalchemy.orm import Session
+
+import columnar
+from minio_client import minio_client
+from models import DataVersion
+
+logger = logging.getLogger(__name__)
+
+EXPORT_PREFIX = "exports/"
+# format -> (file extension, content type, writer)
+EXPORT_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet", columnar.write_parquet),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file", columnar.write_arrow_ipc),
+}
+
+
+def export_object_name(diary_id: int, version: int, fmt: str) -> str:
+    return f"{EXPORT_PREFIX}diary-{diary_id}/growth-v{version}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def current_version(db: Session, diary_id: int) -> int:
+    return db.query(DataVersion.version).filter(DataVersion.id == diary_id).scalar() or 0
+
+
+def growth_file(db: Session, diary_id: int, fmt: str, version: Optional[int] = None) -> Tuple[bytes, int]:
+    """The diary's growth file in ``fmt`` and the data version it reflects
+
+    ``version`` must have been read with ``current_version`` in the same
+    session (callers that check the ETag first pass it in).
+    """
+    if version is None:
+        # Read first: the rows below come from the same snapshot as the version
+        version = current_version(db, diary_id)
+    object_name = export_object_name(diary_id, version, fmt)
+    try:
+        return minio_client.get_image(object_name), version
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+
+    _, content_type, write = EXPORT_FORMATS[fmt]
+    data = write(columnar.iter_batches(db, columnar.growth_query(diary_id)))
+    minio_client.put_image(object_name, data, content_type)
+    logger.info("Built growth export %s (%d bytes)", object_name, len(data))
+
+    for name in minio_client.list_object_names(f"{EXPORT_PREFIX}diary-{diary_id}/"):
+        if name.endswith(f".{EXPORT_FORMATS[fmt][0]}") and name != object_name:
+            minio_client.delete_image(name)
+    return data, version
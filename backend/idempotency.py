@@ -0,0 +1,84 @@
+"""Idempotency-Key support for write endpoints.
+
+A client retrying a request (double tap, timeout on a flaky network) sends
+the same ``Idempotency-Key`` header. The first successful response is stored
+in ``idempotency_keys`` in the same transaction as the write itself, so a
+key is only ever recorded together with the data it produced; retries get
+the stored response back without running the write again.
+"""
+from datetime import timedelta
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey, get_jst_now
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(method: str, path: str, payload: Any) -> str:
+    body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{method} {path}\n{body}".encode("utf-8")).hexdigest()
+
+
+def validate_key(key: Optional[str]) -> Optional[str]:
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} は1〜{MAX_KEY_LENGTH}文字で指定してください")
+    return key
+
+
+def replay(db: Session, key: str, fingerprint: str) -> Optional[JSONResponse]:
+    """Stored response for ``key``, or ``None`` if the key is new (or expired)"""
+    stored = db.get(IdempotencyKey, key)
+    if stored is None:
+        return None
+    if stored.created_at and stored.created_at < _expires_before():
+        return None
+    if stored.request_hash != fingerprint:
+        exc = HTTPException(status_code=422, detail=f"この {IDEMPOTENCY_HEADER} は別の内容のリクエストで使用済みです")
+        exc.error_code = "IDEMPOTENCY_KEY_REUSED"
+        raise exc
+    logger.info("Replaying stored response for idempotency key %s", key)
+    return JSONResponse(
+        status_code=stored.status_code,
+        content=stored.response,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def remember(db: Session, key: str, fingerprint: str, status_code: int, response: Dict[str, Any]):
+    """Stage the response in the caller's transaction (committed with the write)"""
+    stored = db.get(IdempotencyKey, key)
+    if stored is not None:
+        # Expired entry being reused
+        db.delete(stored)
+        db.flush()
+    db.add(IdempotencyKey(key=key, request_hash=fingerprint, status_code=status_code, response=response))
+
+
+def purge_expired(db: Session) -> int:
+    deleted = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.created_at < _expires_before())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
+
+
+def _expires_before():
+    # Stored timestamps are naive JST
+    return (get_jst_now() - timedelta(hours=IDEMPOTENCY_TTL_HOURS)).replace(tzinfo=None)
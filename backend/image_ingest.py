@@ -0,0 +1,147 @@
+"""Post-upload image processing.
+
+``POST /api/upload/image`` stores the raw upload under ``incoming/`` and
+returns the final filename right away; the ``image_ingest`` job then
+normalizes the photo in the process pool (see ``images.process_upload``),
+stores it under that filename and removes the raw upload. Transient
+failures (MinIO or the database unavailable) are retried with backoff and
+keep the raw upload; a file Pillow rejects, or a permanent storage error,
+fails the job and removes it. The raw upload is never served: until the
+processed image exists ``GET /api/images`` answers with a placeholder.
+"""
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from minio.error import S3Error
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy import update
+
+from database import SessionLocal
+import events
+from images import process_upload
+from jobs import job_runner
+from minio_client import minio_client
+from models import DEFAULT_DIARY_ID, PlantRecord
+from resilience import is_transient
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1920"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_INGEST_CONCURRENCY = int(os.getenv("IMAGE_INGEST_CONCURRENCY", "2"))
+IMAGE_INGEST_RETRIES = int(os.getenv("IMAGE_INGEST_RETRIES", "8"))
+
+# Raised by process_upload for files that are not (usable) images
+REJECTED_IMAGE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, ValueError)
+
+OUTPUT_EXTENSION = "webp" if IMAGE_OUTPUT_FORMAT == "WEBP" else "jpg"
+OUTPUT_CONTENT_TYPE = "image/webp" if IMAGE_OUTPUT_FORMAT == "WEBP" else "image/jpeg"
+
+
+def _update_dimensions(diary_id: int, filename: str, width: int, height: int):
+    """Fill in dimensions of plant records saved before processing finished"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(PlantRecord)
+            .where(PlantRecord.diary_id == diary_id, PlantRecord.image_filename == filename)
+            .values(image_width=width, image_height=height)
+        )
+        events.emit(db, "image.processed", diary_id, filename=filename, width=width, height=height)
+        db.commit()
+    finally:
+        db.close()
+
+
+def read_dimensions(filenames: Iterable[str]) -> Dict[str, Tuple[Optional[int], Optional[int]]]:
+    """Stored dimensions of each processed image ((None, None) while pending)"""
+    return {filename: minio_client.get_image_dimensions(filename) for filename in set(filenames)}
+
+
+def fill_missing_dimensions(diary_id: int, filenames: Iterable[str]):
+    """Re-read dimensions for plant records just saved without them.
+
+    The ingest job may finish between a handler's metadata read and its
+    commit; its ``_update_dimensions`` then matched no rows, so the handler
+    fills them in itself after committing.
+    """
+    found = {f: dims for f, dims in read_dimensions(filenames).items() if dims[0] is not None}
+    if not found:
+        return
+    db = SessionLocal()
+    try:
+        for filename, (width, height) in found.items():
+            db.execute(
+                update(PlantRecord)
+                .where(
+                    PlantRecord.diary_id == diary_id,
+                    PlantRecord.image_filename == filename,
+                    PlantRecord.image_width.is_(None),
+                )
+                .values(image_width=width, image_height=height)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _discard_source(source: str):
+    try:
+        await asyncio.to_thread(minio_client.delete_image, source)
+    except Exception as e:
+        logger.warning("Could not remove raw upload %s: %s", source, e)
+
+
+async def ingest_image(job_id: str, params: Dict[str, Any], report_progress: Callable) -> Dict[str, Any]:
+    source, filename = params["source"], params["filename"]
+    # Jobs queued before diaries existed carry no diary id
+    diary_id = params.get("diaryId", DEFAULT_DIARY_ID)
+
+    try:
+        original = await asyncio.to_thread(minio_client.get_image, source)
+    except S3Error as e:
+        if e.code != "NoSuchKey" or not await asyncio.to_thread(minio_client.object_exists, filename):
+            raise
+        # Retry of a run that stored the result but failed afterwards
+        width, height = await asyncio.to_thread(minio_client.get_image_dimensions, filename)
+        await asyncio.to_thread(_update_dimensions, diary_id, filename, width, height)
+        return {"filename": filename, "width": width, "height": height}
+    await report_progress(20)
+
+    try:
+        processed, width, height = await job_runner.run_in_process(
+            process_upload, original, IMAGE_MAX_EDGE, IMAGE_OUTPUT_FORMAT, IMAGE_QUALITY
+        )
+    except REJECTED_IMAGE_ERRORS:
+        # The file itself cannot be processed: retrying will not help, and
+        # the raw upload (with its EXIF/GPS) must not stay around
+        await _discard_source(source)
+        raise
+    await report_progress(70)
+
+    try:
+        await asyncio.to_thread(
+            minio_client.put_image, filename, processed, OUTPUT_CONTENT_TYPE,
+            {"width": str(width), "height": str(height)}
+        )
+    except Exception as e:
+        if not is_transient(e):
+            await _discard_source(source)
+        raise  # Transient: the job is retried
+    await asyncio.to_thread(minio_client.delete_image, source)
+    await asyncio.to_thread(_update_dimensions, diary_id, filename, width, height)
+
+    logger.info("Processed image %s: %d -> %d bytes (%dx%d)", filename, len(original), len(processed), width, height)
+    return {
+        "filename": filename,
+        "width": width,
+        "height": height,
+        "bytesIn": len(original),
+        "bytesOut": len(processed),
+    }
+
+
+job_runner.register("image_ingest", ingest_image, concurrency=IMAGE_INGEST_CONCURRENCY, retries=IMAGE_INGEST_RETRIES)
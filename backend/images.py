@@ -0,0 +1,160 @@
+"""Pillow helpers for uploaded photos."""
+from io import BytesIO
+from typing import List, Optional, Tuple
+import logging
+import math
+
+from PIL import Image, ImageDraw, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# HEIC/HEIF (iPhone photos) needs the optional pillow-heif plugin
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    logger.info("pillow-heif not installed; HEIC uploads cannot be processed")
+
+# Widths served as /api/images/{filename}?w=
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_QUALITY = 80
+# Intermediate frames of time-lapses / contact sheets (re-encoded once more)
+FRAME_QUALITY = 90
+
+# Served in place of a photo while the object store is unavailable
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="640" height="480" viewBox="0 0 640 480">'
+    '<rect width="640" height="480" fill="#eeeeee"/>'
+    '<path d="M250 300l60-80 45 55 30-35 55 60z" fill="#c8c8c8"/>'
+    '<circle cx="400" cy="190" r="22" fill="#c8c8c8"/>'
+    '</svg>'
+)
+
+
+def read_dimensions(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """Width/height from the image header (pixel data is not decoded)"""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            width, height = image.size
+            # Phones store portrait photos rotated + an EXIF orientation tag
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Could not read image dimensions: %s", e)
+        return None, None
+
+
+def make_thumbnail(data: bytes, width: int) -> bytes:
+    """JPEG thumbnail ``width`` pixels wide (never upscaled)"""
+    with Image.open(BytesIO(data)) as image:
+        # Let the JPEG decoder downscale while decoding
+        image.draft("RGB", (width, width * 4))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+def process_upload(data: bytes, max_edge: int, output_format: str, quality: int) -> Tuple[bytes, int, int]:
+    """Normalize an uploaded photo for storage
+
+    Applies the EXIF orientation, fits the image within ``max_edge``,
+    drops all metadata except the ICC colour profile (EXIF/GPS are not
+    written) and re-encodes as JPEG or WebP. Runs in a worker process.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image.draft("RGB", (max_edge, max_edge))
+        icc_profile = image.info.get("icc_profile")
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        save_options = {"quality": quality}
+        if icc_profile:
+            save_options["icc_profile"] = icc_profile
+        if output_format == "JPEG":
+            save_options.update(optimize=True, progressive=True)
+        else:
+            save_options["method"] = 4
+
+        output = BytesIO()
+        image.save(output, output_format, **save_options)
+        return output.getvalue(), image.width, image.height
+
+
+def _decode_fitted(data: bytes, edge: int) -> Optional[Image.Image]:
+    """RGB image fitted within ``edge`` (``None`` if it cannot be decoded)"""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # Decode at 1/2..1/8 scale when the source is much larger
+            image.draft("RGB", (edge, edge))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            return image
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Skipping undecodable frame: %s", e)
+        return None
+
+
+def downscale_frame(data: bytes, edge: int) -> Optional[bytes]:
+    """JPEG of a photo fitted within ``edge`` (``None`` if it cannot be decoded)
+
+    Runs in a worker process.
+    """
+    image = _decode_fitted(data, edge)
+    if image is None:
+        return None
+    output = BytesIO()
+    image.save(output, "JPEG", quality=FRAME_QUALITY)
+    return output.getvalue()
+
+
+def _centered(image: Image.Image, width: int, height: int, background=(255, 255, 255)) -> Image.Image:
+    canvas = Image.new("RGB", (width, height), background)
+    canvas.paste(image, ((width - image.width) // 2, (height - image.height) // 2))
+    return canvas
+
+
+def make_timelapse(frames: List[bytes], edge: int, output_format: str, frame_ms: int, quality: int) -> bytes:
+    """Animated WebP or GIF of ``frames`` in order, each fitted within ``edge``
+
+    Runs in a worker process.
+    """
+    images = [image for image in (_decode_fitted(data, edge) for data in frames) if image]
+    if not images:
+        raise ValueError("no decodable frames")
+    # Every frame on a canvas of the same size (portrait and landscape mixed)
+    width, height = max(image.width for image in images), max(image.height for image in images)
+    images = [_centered(image, width, height, (0, 0, 0)) for image in images]
+
+    save_options = {"save_all": True, "append_images": images[1:], "duration": frame_ms, "loop": 0}
+    if output_format == "WEBP":
+        save_options.update(quality=quality, method=4)
+    else:
+        save_options["optimize"] = True
+    output = BytesIO()
+    images[0].save(output, output_format, **save_options)
+    return output.getvalue()
+
+
+def make_contact_sheet(frames: List[bytes], labels: List[str], columns: int, cell: int, quality: int) -> bytes:
+    """Printable JPEG grid of ``frames`` with a label (the date) under each
+
+    Runs in a worker process.
+    """
+    label_height = max(16, cell // 10)
+    rows = math.ceil(len(frames) / columns) or 1
+    sheet = Image.new("RGB", (columns * cell, rows * (cell + label_height)), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    for index, (data, label) in enumerate(zip(frames, labels)):
+        x, y = (index % columns) * cell, (index // columns) * (cell + label_height)
+        image = _decode_fitted(data, cell - 8)
+        if image:
+            sheet.paste(image, (x + (cell - image.width) // 2, y + (cell - image.height) // 2))
+        draw.text((x + 4, y + cell), label, fill=(0, 0, 0))
+    output = BytesIO()
+    sheet.save(output, "JPEG", quality=quality, optimize=True)
+    return output.getvalue()
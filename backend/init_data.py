@@ -1,6 +1,6 @@
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine
-from models import Base, User, Plant
+from models import Base, User, Plant, DataVersion, Diary, DEFAULT_DIARY_ID
 from passlib.context import CryptContext
 import logging
 
@@ -16,8 +16,15 @@ def create_tables():
     Base.metadata.create_all(bind=engine)
     logger.info("Tables created successfully")
 
-def init_plants(db: Session):
-    """Initialize default plants"""
+def init_diaries(db: Session):
+    """Ensure the default diary exists"""
+    if not db.query(Diary).filter(Diary.id == DEFAULT_DIARY_ID).first():
+        db.add(Diary(id=DEFAULT_DIARY_ID, name="観察日記"))
+        db.commit()
+        logger.info("Default diary created")
+
+def init_plants(db: Session, diary_id: int = DEFAULT_DIARY_ID):
+    """Initialize default plants of a diary"""
     plants_data = [
         {"name": "向日葵（ひまわり）", "display_order": 1},
         {"name": "秋桜（コスモス）", "display_order": 2},
@@ -25,9 +32,11 @@ def init_plants(db: Session):
     ]
     
     for plant_data in plants_data:
-        existing_plant = db.query(Plant).filter(Plant.name == plant_data["name"]).first()
+        existing_plant = (
+            db.query(Plant).filter(Plant.diary_id == diary_id, Plant.name == plant_data["name"]).first()
+        )
         if not existing_plant:
-            plant = Plant(**plant_data)
+            plant = Plant(diary_id=diary_id, **plant_data)
             db.add(plant)
             logger.info(f"Added plant: {plant_data['name']}")
     
@@ -51,6 +60,32 @@ def init_admin_user(db: Session):
     else:
         logger.info("Admin user already exists")
 
+def init_data_version(db: Session, diary_id: int = DEFAULT_DIARY_ID):
+    """Ensure the diary's data version row exists"""
+    if not db.query(DataVersion).filter(DataVersion.id == diary_id).first():
+        db.add(DataVersion(id=diary_id, version=0))
+        db.commit()
+        logger.info(f"Data version row created for diary {diary_id}")
+
+def init_diary(db: Session, diary_id: int):
+    """Set up a newly created diary (version row and default plants)"""
+    init_data_version(db, diary_id)
+    init_plants(db, diary_id)
+
+def purge_idempotency_keys(db: Session):
+    """Drop stored idempotent responses past their retention"""
+    from idempotency import purge_expired
+    deleted = purge_expired(db)
+    if deleted:
+        logger.info(f"Purged {deleted} expired idempotency keys")
+
+def purge_change_events(db: Session):
+    """Drop change notifications past their retention"""
+    from events import purge_expired
+    deleted = purge_expired(db)
+    if deleted:
+        logger.info(f"Purged {deleted} old change events")
+
 def main():
     """Main initialization function"""
     logger.info("Starting database initialization...")
@@ -61,8 +96,12 @@ def main():
     # Initialize data
     db = SessionLocal()
     try:
+        init_diaries(db)
+        init_data_version(db)
         init_plants(db)
         init_admin_user(db)
+        purge_idempotency_keys(db)
+        purge_change_events(db)
         logger.info("Database initialization completed successfully")
     except Exception as e:
         logger.error(f"Error during initialization: {e}")
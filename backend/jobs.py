@@ -0,0 +1,221 @@
+"""Background job runner.
+
+Jobs are rows in the ``jobs`` table so their status can be queried from any
+worker. Each job kind has an async handler registered with ``job_runner``;
+handlers run as asyncio tasks off the request path, with a per-kind
+concurrency limit, and hand CPU-heavy work to a shared process pool through
+``run_in_process``. Jobs left queued or running by a crashed worker are
+picked up again on startup. Kinds registered with ``retries`` are queued
+again, with exponential backoff, when they fail transiently (MinIO or the
+database unavailable, see ``resilience.is_transient``, or a crashed process
+pool); any other error fails the job at once. A job submitted with a ``dedupe_key`` while one
+of the same kind and key is still queued or running is not created again;
+the pending job's id is returned instead (best effort across workers: two
+racing submits may both create one, which only costs duplicate work).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+
+from sqlalchemy import update
+
+from database import SessionLocal
+from models import Job, get_jst_now
+from resilience import is_transient
+
+logger = logging.getLogger(__name__)
+
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", "2"))
+# Running jobs not updated for this long are considered abandoned
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# handler(job_id, params, report_progress) -> result dict
+Handler = Callable[[str, Dict[str, Any], Callable[[int], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "createdAt": job.created_at.isoformat() if job.created_at else None,
+        "updatedAt": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+class JobRunner:
+    def __init__(self, process_workers: int = JOB_PROCESS_WORKERS):
+        self.process_workers = process_workers
+        self._handlers: Dict[str, Handler] = {}
+        self._concurrency: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks = set()
+
+    def register(self, kind: str, handler: Handler, concurrency: int = 2, retries: int = 0):
+        self._handlers[kind] = handler
+        self._concurrency[kind] = concurrency
+        self._retries[kind] = retries
+
+    # -- process pool ----------------------------------------------------
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process with logging/DB threads can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.process_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def run_in_process(self, func: Callable, *args):
+        """Run a picklable, module-level function in the process pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # -- job rows --------------------------------------------------------
+    _create_lock = threading.Lock()
+
+    @classmethod
+    def _create(cls, kind: str, params: Dict[str, Any], dedupe_key: Optional[str] = None) -> Tuple[str, bool]:
+        """Insert a queued job; ``(job id, created)``, an existing pending job's id if deduplicated"""
+        with cls._create_lock:
+            db = SessionLocal()
+            try:
+                if dedupe_key is not None:
+                    pending = (
+                        db.query(Job.id)
+                        .filter(Job.kind == kind, Job.dedupe_key == dedupe_key, Job.status.in_(("queued", "running")))
+                        .first()
+                    )
+                    if pending:
+                        return pending.id, False
+                job = Job(
+                    id=str(uuid.uuid4()), kind=kind, status="queued", progress=0, params=params, dedupe_key=dedupe_key
+                )
+                db.add(job)
+                db.commit()
+                return job.id, True
+            finally:
+                db.close()
+
+    @staticmethod
+    def _update(job_id: str, only_if_status: str = None, **values) -> bool:
+        db = SessionLocal()
+        try:
+            stmt = update(Job).where(Job.id == job_id).values(updated_at=get_jst_now(), **values)
+            if only_if_status:
+                stmt = stmt.where(Job.status == only_if_status)
+            updated = db.execute(stmt).rowcount
+            db.commit()
+            return updated == 1
+        finally:
+            db.close()
+
+    @staticmethod
+    def get(job_id: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            return job_to_dict(job) if job else None
+        finally:
+            db.close()
+
+    # -- execution -------------------------------------------------------
+    async def submit(self, kind: str, params: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+        """Record a job and start it in the background; returns the job id"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id, created = await asyncio.to_thread(self._create, kind, params, dedupe_key)
+        if created:
+            self._start(job_id, kind, params)
+        else:
+            logger.info("Job %s (%s) already pending for %s", job_id, kind, dedupe_key)
+        return job_id
+
+    def _start(self, job_id: str, kind: str, params: Dict[str, Any], attempt: int = 0, delay: float = 0):
+        task = asyncio.create_task(self._run(job_id, kind, params, attempt, delay))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _retryable(self, exc: BaseException) -> bool:
+        if isinstance(exc, BrokenProcessPool):
+            self._pool = None  # A worker process died; start a fresh pool
+            return True
+        return is_transient(exc)
+
+    async def _run(self, job_id: str, kind: str, params: Dict[str, Any], attempt: int = 0, delay: float = 0):
+        if delay:
+            await asyncio.sleep(delay)
+        semaphore = self._semaphores.setdefault(kind, asyncio.Semaphore(self._concurrency[kind]))
+        async with semaphore:
+            # Conditional update: only one worker gets to run a job
+            claimed = await asyncio.to_thread(self._update, job_id, "queued", status="running")
+            if not claimed:
+                return
+
+            async def report_progress(progress: int):
+                await asyncio.to_thread(self._update, job_id, progress=max(0, min(100, int(progress))))
+
+            try:
+                result = await self._handlers[kind](job_id, params, report_progress)
+                await asyncio.to_thread(self._update, job_id, status="done", progress=100, result=result)
+                logger.info("Job %s (%s) done", job_id, kind)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._retryable(e) and attempt < self._retries[kind]:
+                    delay = min(JOB_RETRY_MAX_DELAY, JOB_RETRY_DELAY * 2 ** attempt)
+                    logger.warning("Job %s (%s) failed transiently, retry %d in %.0f s: %s",
+                                   job_id, kind, attempt + 1, delay, e)
+                    # Queued while waiting, so a restart resumes it too
+                    await asyncio.to_thread(self._update, job_id, status="queued", error=str(e))
+                    self._start(job_id, kind, params, attempt + 1, delay)
+                    return
+                logger.error("Job %s (%s) failed: %s", job_id, kind, e, exc_info=True)
+                await asyncio.to_thread(self._update, job_id, status="failed", error=str(e))
+
+    async def resume_pending(self):
+        """Restart jobs that were queued, or abandoned while running"""
+        def load_pending():
+            db = SessionLocal()
+            try:
+                stale_before = get_jst_now() - timedelta(seconds=JOB_STALE_SECONDS)
+                stale = (
+                    update(Job)
+                    .where(Job.status == "running", Job.updated_at < stale_before)
+                    .values(status="queued")
+                )
+                db.execute(stale)
+                db.commit()
+                jobs = db.query(Job).filter(Job.status == "queued", Job.kind.in_(list(self._handlers))).all()
+                return [(job.id, job.kind, job.params or {}) for job in jobs]
+            finally:
+                db.close()
+
+        pending = await asyncio.to_thread(load_pending)
+        for job_id, kind, params in pending:
+            self._start(job_id, kind, params)
+        if pending:
+            logger.info("Resumed %d pending jobs", len(pending))
+
+
+job_runner = JobRunner()
@@ -0,0 +1,130 @@
+"""Application logging setup.
+
+Log records are handed to a ``QueueHandler`` on the request path and written
+by a ``QueueListener`` thread, so output I/O never blocks a request.
+Everything is configured through environment variables:
+
+- ``LOG_LEVEL``: root log level (default ``INFO``)
+- ``LOG_FORMAT``: ``json`` (default) or ``text``
+- ``SQL_ECHO``: log every SQL statement through ``sqlalchemy.engine``
+- ``DEBUG_TRACE``: enable the verbose diagnostic traces in the endpoints
+- ``DEBUG_SAMPLE_RATE``: fraction of hot-path debug logs that are emitted
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+SQL_ECHO = _env_flag("SQL_ECHO")
+DEBUG_TRACE = _env_flag("DEBUG_TRACE")
+DEBUG_SAMPLE_RATE = float(os.getenv("DEBUG_SAMPLE_RATE", "0.01"))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes present on every LogRecord; anything else came from ``extra=``
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_exception_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that resolves the message on the calling thread
+
+    Like the stock ``QueueHandler.prepare``, ``%``-style arguments are merged
+    and the traceback is rendered before the record is enqueued: arguments
+    may be mutated (or their objects closed) once the call returns, and the
+    listener thread should only do output I/O. Unlike the stock handler, the
+    final formatter (JSON or text) is left to the listener, so ``extra=``
+    fields and the traceback still end up in their own keys.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            # Tracebacks keep frames (and their locals) alive; drop them here
+            record.exc_info = None
+        return record
+
+
+def setup_logging(stream=None) -> QueueListener:
+    """Route all logging through a background queue listener"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    # SQL echo is opt-in; it goes through the same queue instead of
+    # SQLAlchemy's synchronous default handler
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if SQL_ECHO else logging.WARNING)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def debug_sampled(logger: logging.Logger, msg: str, *args, rate: float = None, **kwargs):
+    """Emit a hot-path debug log for only a sample of calls"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() < (DEBUG_SAMPLE_RATE if rate is None else rate):
+        logger.debug(msg, *args, **kwargs)
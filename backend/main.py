@@ -1,23 +1,40 @@
-from fastapi import FastAPI, Depends, File, UploadFile, HTTPException, Request
+from fastapi import FastAPI, Depends, File, UploadFile, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 import os
 import logging
-import traceback
-from typing import List, Dict, Any
+import uuid
+from typing import List, Dict, Any, Optional
+from datetime import date
 
-from database import get_db
+import schemas
+from database import get_read_db, get_write_db, ReadYourWritesMiddleware
 from init_data import main as init_database
 from admin import setup_admin
 from minio_client import minio_client
+from query_budget import QueryBudgetMiddleware, query_budget
+from logging_config import setup_logging, debug_sampled, DEBUG_TRACE
+from data_version import VersionedCache
+from compression import CompressionMiddleware, cached_json
+import events
+import delta_sync
+from diaries import get_diary_id
+from images import PLACEHOLDER_SVG, THUMBNAIL_WIDTHS
+from jobs import job_runner
+from image_ingest import OUTPUT_EXTENSION, fill_missing_dimensions, read_dimensions
+import plant_media  # registers the plant_media job
+import reports  # registers the plant_report job
+from readiness import readiness
+import profiling
+from minio_client import INCOMING_PREFIX
+from minio.error import S3Error
+from resilience import DeadlineMiddleware, ServiceUnavailable, is_transient, retry_after_for
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Setup logging (JSON lines written by a background queue listener)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Custom exception handler
@@ -40,6 +57,29 @@ def create_error_response(status_code: int, message: str, error_code: str = None
         response["error"]["details"] = details
     return response
 
+def record_etag(record) -> str:
+    """ETag of a record: its optimistic-locking version"""
+    return f'"{record.version}"'
+
+def etag_matches(if_match: str, etag: str) -> bool:
+    """If-Match check (weak prefixes ignored: proxies may weaken compressed responses)"""
+    if if_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in (strip(tag) for tag in if_match.split(","))
+
+async def _fill_missing_dimensions(diary_id: int, dimensions: Dict[str, tuple]):
+    """After commit: catch images processed while the request was running"""
+    import asyncio
+    pending = [filename for filename, (width, _) in dimensions.items() if width is None]
+    if not pending:
+        return
+    try:
+        await asyncio.to_thread(fill_missing_dimensions, diary_id, pending)
+    except Exception as e:
+        # The record is saved; the dimensions stay empty until the next edit
+        logger.warning("Could not fill in image dimensions for %s: %s", pending, e)
+
 def create_success_response(data: Any = None, message: str = None) -> Dict[str, Any]:
     """統一された成功レスポンス形式"""
     response = {
@@ -51,6 +91,12 @@ def create_success_response(data: Any = None, message: str = None) -> Dict[str,
         response["message"] = message
     return response
 
+# Per-worker caches; entries expire when their diary's data version changes
+plants_cache = VersionedCache("plants", maxsize=512)
+records_cache = VersionedCache("records", maxsize=64)
+calendar_cache = VersionedCache("calendar", maxsize=1024)
+archive_cache = VersionedCache("archive", maxsize=16)
+
 # Create FastAPI app
 app = FastAPI(
     title="Plant Growth Tracker API",
@@ -61,20 +107,38 @@ app = FastAPI(
 # Global exception handler
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    logger.error(f"HTTP Exception: {exc.status_code} - {exc.detail}")
+    logger.error("HTTP Exception: %s - %s", exc.status_code, exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
         content=create_error_response(
             status_code=exc.status_code,
             message=exc.detail,
             error_code=getattr(exc, 'error_code', None)
-        )
+        ),
+        headers=getattr(exc, 'headers', None)
+    )
+
+@app.exception_handler(ServiceUnavailable)
+@app.exception_handler(PoolTimeoutError)
+@app.exception_handler(OperationalError)
+async def unavailable_exception_handler(request: Request, exc: Exception):
+    """MinIO circuit open, DB pool exhausted or DB unreachable: ask the client to retry"""
+    if not is_transient(exc):
+        return await general_exception_handler(request, exc)
+    logger.warning("Service unavailable: %s", exc)
+    return JSONResponse(
+        status_code=503,
+        content=create_error_response(
+            status_code=503,
+            message="サーバーが混み合っています。しばらくしてから再度お試しください",
+            error_code="SERVICE_UNAVAILABLE"
+        ),
+        headers={"Retry-After": str(retry_after_for(exc))}
     )
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception: {str(exc)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
+    logger.error("Unhandled exception: %s", exc, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content=create_error_response(
@@ -84,6 +148,12 @@ async def general_exception_handler(request: Request, exc: Exception):
         )
     )
 
+# 503 for requests that have not responded within REQUEST_DEADLINE_SECONDS
+app.add_middleware(DeadlineMiddleware)
+
+# X-Profile: 1 from a logged-in admin profiles that request (inside the session middleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+
 # Session middleware for admin authentication
 app.add_middleware(
     SessionMiddleware, 
@@ -106,6 +176,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Read-your-writes: pin writers to the primary while the replica catches up
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Per-request SQL statement budget / N+1 detection
+app.add_middleware(QueryBudgetMiddleware)
+
+# gzip / brotli for text and JSON responses (cached endpoints are precompressed)
+app.add_middleware(CompressionMiddleware)
+
 # Setup admin interface
 admin = setup_admin(app)
 
@@ -117,7 +196,21 @@ async def startup_event():
         init_database()
         logger.info("Database initialization completed")
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        logger.error("Database initialization failed: %s", e)
+    
+    # Pick up background jobs interrupted by a restart
+    try:
+        await job_runner.resume_pending()
+    except Exception as e:
+        logger.error("Resuming background jobs failed: %s", e)
+    
+    readiness.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    readiness.stop()
+    events.broadcaster.close()
+    job_runner.shutdown()
 
 @app.get("/")
 async def root():
@@ -127,46 +220,193 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Whether this worker can serve traffic (DB, pool, MinIO, migrations)
+
+    Served from the last background probe; 503 while any check fails.
+    """
+    status = readiness.status()
+    return JSONResponse(
+        status,
+        status_code=200 if status["ready"] else 503,
+        headers={"Cache-Control": "no-store"}
+    )
+
 @app.get("/api/plants")
-async def get_plants(db: Session = Depends(get_db)):
+@query_budget(2)
+async def get_plants(request: Request, db: Session = Depends(get_read_db), diary_id: int = Depends(get_diary_id)):
     """Get all active plants"""
     from models import Plant
-    plants = db.query(Plant).filter(Plant.is_active == True).order_by(Plant.display_order).all()
-    return [{"id": p.id, "name": p.name, "display_order": p.display_order} for p in plants]
+    
+    def load_plants():
+        plants = (
+            db.query(Plant)
+            .filter(Plant.diary_id == diary_id, Plant.is_active == True)
+            .order_by(Plant.display_order)
+            .all()
+        )
+        return [{"id": p.id, "name": p.name, "display_order": p.display_order} for p in plants]
+    
+    return cached_json(request, plants_cache, "active", load_plants, diary_id)
+
+@app.post("/api/plants/{plant_id}/media")
+async def create_plant_media(
+    plant_id: int,
+    media_request: dict,
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Time-lapse / contact sheet of a plant's photos: served from cache, or generated by a job"""
+    import asyncio
+    from models import Plant
+    
+    kind = media_request.get("kind")
+    if kind not in plant_media.MEDIA_FORMATS:
+        raise HTTPException(status_code=400, detail=f"種類は {', '.join(plant_media.MEDIA_FORMATS)} のいずれかです")
+    fmt = media_request.get("format") or plant_media.MEDIA_FORMATS[kind][0]
+    if fmt not in plant_media.MEDIA_FORMATS[kind]:
+        raise HTTPException(status_code=400, detail=f"形式は {', '.join(plant_media.MEDIA_FORMATS[kind])} のいずれかです")
+    year = media_request.get("year")
+    if year is not None and not isinstance(year, int):
+        raise HTTPException(status_code=400, detail="年は整数で指定してください")
+    
+    if not db.query(Plant.id).filter(Plant.id == plant_id, Plant.diary_id == diary_id).first():
+        raise HTTPException(status_code=404, detail="植物が見つかりません")
+    photos = plant_media.plant_photos(db, diary_id, plant_id, year)
+    if not photos:
+        raise HTTPException(status_code=404, detail="写真がありません")
+    
+    object_name = plant_media.media_object_name(kind, fmt, photos)
+    url = f"/api/images/{object_name}"
+    if await asyncio.to_thread(minio_client.object_exists, object_name):
+        return {"status": "done", "url": url, "photos": len(photos)}
+    
+    # A request repeated while the job runs gets the same job
+    job_id = await job_runner.submit("plant_media", {
+        "kind": kind,
+        "format": fmt,
+        "objectName": object_name,
+        "photos": [[d.isoformat(), filename] for d, filename in photos],
+    }, dedupe_key=object_name)
+    return {"status": "queued", "url": url, "jobId": job_id, "photos": len(photos)}
+
+@app.post("/api/plants/{plant_id}/report")
+async def create_plant_report(
+    plant_id: int,
+    report_request: dict,
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Printable season report of a plant (PDF or PNG pages): served from cache, or rendered by a job"""
+    import asyncio
+    from models import Plant
+    
+    fmt = report_request.get("format") or "pdf"
+    if fmt not in reports.REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"形式は {', '.join(reports.REPORT_FORMATS)} のいずれかです")
+    year = report_request.get("year")
+    if not isinstance(year, int):
+        raise HTTPException(status_code=400, detail="年を整数で指定してください")
+    
+    plant = db.query(Plant).filter(Plant.id == plant_id, Plant.diary_id == diary_id).first()
+    if not plant:
+        raise HTTPException(status_code=404, detail="植物が見つかりません")
+    report = reports.report_data(db, diary_id, plant, year)
+    if not report["entries"]:
+        raise HTTPException(status_code=404, detail="この年の記録がありません")
+    
+    key = reports.report_key(diary_id, plant_id, year, fmt, report)
+    urls = await asyncio.to_thread(reports.stored_report, key, fmt)
+    if urls:
+        return {"status": "done", "urls": urls, "entries": len(report["entries"])}
+    
+    job_id = await job_runner.submit("plant_report", {
+        "diaryId": diary_id,
+        "plantId": plant_id,
+        "year": year,
+        "format": fmt,
+        "key": key,
+        "report": report,
+    }, dedupe_key=key)
+    return {"status": "queued", "jobId": job_id, "entries": len(report["entries"])}
+
+@app.get("/api/reports/{filename}")
+async def get_report(filename: str):
+    """A rendered report file (PDF or PNG page)"""
+    import asyncio
+    
+    if not filename.startswith(reports.REPORT_PREFIX) or not filename.endswith((".pdf", ".png")):
+        raise HTTPException(status_code=404, detail="レポートが見つかりません")
+    try:
+        data = await asyncio.to_thread(minio_client.get_image, filename)
+    except ServiceUnavailable:
+        raise
+    except Exception as e:
+        logger.error("Error getting report: %s", e)
+        raise HTTPException(status_code=404, detail="レポートが見つかりません")
+    media_type = "application/pdf" if filename.endswith(".pdf") else "image/png"
+    # Content-addressed: a changed report gets a new name
+    return Response(data, media_type=media_type, headers={"Cache-Control": "public, max-age=86400, immutable"})
 
 @app.get("/api/records")
-async def get_records(db: Session = Depends(get_db)):
+@query_budget(3)
+async def get_records(request: Request, db: Session = Depends(get_read_db), diary_id: int = Depends(get_diary_id)):
     """Get all records with plant data"""
     from models import Record, PlantRecord, Plant
     
-    records = db.query(Record).order_by(Record.record_date.desc()).all()
-    result = []
-    
-    for record in records:
-        plants_data = []
-        for plant_record in record.plant_records:
-            plants_data.append({
-                "type": plant_record.plant.name,
-                "height": float(plant_record.height) if plant_record.height else None,
-                "comment": plant_record.comment or "",
-                "image": f"/api/images/{plant_record.image_filename}" if plant_record.image_filename else None
+    def load_records():
+        # Two statements however many records: selectinload would split its
+        # IN list into batches of 500 and add a query per batch
+        records = (
+            db.query(Record)
+            .filter(Record.diary_id == diary_id)
+            .order_by(Record.record_date.desc())
+            .all()
+        )
+        plant_rows = (
+            db.query(PlantRecord.record_id, PlantRecord.height, PlantRecord.comment, PlantRecord.image_filename, Plant.name)
+            .join(Plant, Plant.id == PlantRecord.plant_id)
+            .filter(PlantRecord.diary_id == diary_id)
+            .order_by(PlantRecord.id)
+            .all()
+        )
+        plants_by_record = {}
+        for row in plant_rows:
+            plants_by_record.setdefault(row.record_id, []).append({
+                "type": row.name,
+                "height": float(row.height) if row.height else None,
+                "comment": row.comment or "",
+                "image": f"/api/images/{row.image_filename}" if row.image_filename else None
             })
+        result = []
         
-        result.append({
-            "id": record.id,
-            "date": record.record_date.isoformat(),
-            "createdAt": record.created_at.isoformat(),
-            "weather": record.weather.value,
-            "temperature": float(record.temperature),
-            "plants": plants_data
-        })
+        for record in records:
+            plants_data = plants_by_record.get(record.id, [])
+            
+            result.append({
+                "id": record.id,
+                "date": record.record_date.isoformat(),
+                "createdAt": record.created_at.isoformat(),
+                "weather": record.weather.value,
+                "temperature": float(record.temperature),
+                "plants": plants_data
+            })
+        
+        return result
     
-    return result
+    return cached_json(request, records_cache, "all", load_records, diary_id)
 
 @app.get("/api/records/today")
-async def get_today_record(db: Session = Depends(get_db), force_date: str = None):
+@query_budget(3)
+async def get_today_record(
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id),
+    force_date: str = None
+):
     """Check if today's record exists"""
-    from models import Record
+    from models import Record, PlantRecord
+    from sqlalchemy.orm import selectinload, joinedload
     from datetime import date, datetime
     import os
     
@@ -176,9 +416,9 @@ async def get_today_record(db: Session = Depends(get_db), force_date: str = None
     if force_date:
         try:
             today = datetime.strptime(force_date, '%Y-%m-%d').date()
-            logger.info(f"強制指定された日付を使用: {today}")
+            logger.info("強制指定された日付を使用: %s", today)
         except ValueError:
-            logger.error(f"無効な日付形式: {force_date}")
+            logger.error("無効な日付形式: %s", force_date)
             # JST時刻を計算
             from datetime import timezone, timedelta
             jst = timezone(timedelta(hours=9))
@@ -188,36 +428,35 @@ async def get_today_record(db: Session = Depends(get_db), force_date: str = None
         from datetime import timezone, timedelta
         jst = timezone(timedelta(hours=9))
         today = datetime.now(jst).date()
-        logger.info(f"JST時刻から計算された日付: {today}")
-    
-    current_time = datetime.now()
-    logger.info(f"=== 今日の記録チェック開始 ===")
-    logger.info(f"サーバー時刻: {current_time}")
-    logger.info(f"サーバー日付: {date.today()}")
-    logger.info(f"検索対象日付: {today}")
-    logger.info(f"タイムゾーン: {timezone_info}")
-    logger.info(f"force_date パラメータ: {force_date}")
-    
-    # 全ての記録を確認（デバッグ用）
-    all_records = db.query(Record).order_by(Record.record_date.desc()).limit(10).all()
-    logger.info(f"データベース内の最新10件の記録:")
-    for record in all_records:
-        logger.info(f"  ID={record.id}, 日付={record.record_date}, 作成日時={record.created_at}")
+        debug_sampled(logger, "JST時刻から計算された日付: %s", today)
+    
+    # 詳細なトレースは DEBUG_TRACE 有効時のみ（最新記録の確認クエリも含む）
+    if DEBUG_TRACE:
+        logger.info(
+            "今日の記録チェック: サーバー時刻=%s, サーバー日付=%s, 検索対象日付=%s, タイムゾーン=%s, force_date=%s",
+            datetime.now(), date.today(), today, timezone_info, force_date
+        )
+        all_records = (
+            db.query(Record).filter(Record.diary_id == diary_id).order_by(Record.record_date.desc()).limit(10).all()
+        )
+        logger.info(
+            "データベース内の最新10件の記録: %s",
+            [(r.id, r.record_date, r.created_at) for r in all_records]
+        )
     
     # 今日の日付で検索
-    existing_record = db.query(Record).filter(Record.record_date == today).first()
-    logger.info(f"今日の日付({today})での検索結果: {'見つかった' if existing_record else '見つからない'}")
+    existing_record = (
+        db.query(Record)
+        .options(selectinload(Record.plant_records).joinedload(PlantRecord.plant))
+        .filter(Record.diary_id == diary_id, Record.record_date == today)
+        .first()
+    )
+    debug_sampled(logger, "今日の日付(%s)での検索結果: %s", today, existing_record is not None)
     
     if existing_record:
-        logger.info(f"!!! 警告: 今日の記録が見つかりました !!!")
-        logger.info(f"記録ID: {existing_record.id}")
-        logger.info(f"記録日付: {existing_record.record_date}")
-        logger.info(f"今日の日付: {today}")
-        logger.info(f"日付が一致: {existing_record.record_date == today}")
-        
         # 日付が本当に今日と一致するかを再確認
         if existing_record.record_date != today:
-            logger.error(f"!!! 重大なエラー: 記録の日付({existing_record.record_date})が今日({today})と一致しません !!!")
+            logger.error("!!! 重大なエラー: 記録の日付(%s)が今日(%s)と一致しません !!!", existing_record.record_date, today)
             return {"exists": False}
         
         plants_data = []
@@ -229,7 +468,6 @@ async def get_today_record(db: Session = Depends(get_db), force_date: str = None
                 "image": f"/api/images/{plant_record.image_filename}" if plant_record.image_filename else None
             })
         
-        logger.info(f"今日の記録を返します: 日付={existing_record.record_date.isoformat()}")
         return {
             "exists": True,
             "record": {
@@ -242,16 +480,40 @@ async def get_today_record(db: Session = Depends(get_db), force_date: str = None
             }
         }
     else:
-        logger.info(f"今日({today})の記録は存在しません - 新規入力可能")
         return {"exists": False}
 
+@app.get("/api/records/changes")
+@query_budget(7)
+async def get_record_changes(
+    since: Optional[str] = Query(None, description="cursor from the previous response (omit for a full sync)"),
+    limit: int = Query(delta_sync.CHANGES_PAGE_SIZE, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Records / plant records changed or deleted since the cursor"""
+    if since is not None and not since.lstrip("-").isdigit():
+        raise HTTPException(status_code=400, detail="無効なカーソルです")
+    return delta_sync.changes_since(db, diary_id, int(since) if since is not None else None, limit)
+
 @app.get("/api/records/{record_id}")
-async def get_record(record_id: int, db: Session = Depends(get_db)):
-    """Get a specific record by ID"""
+@query_budget(2)
+async def get_record(
+    record_id: int,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Get a specific record by ID (ETag = version, send it back as If-Match on PUT)"""
     from models import Record, PlantRecord, Plant
     from fastapi import HTTPException
+    from sqlalchemy.orm import selectinload, joinedload
     
-    record = db.query(Record).filter(Record.id == record_id).first()
+    record = (
+        db.query(Record)
+        .options(selectinload(Record.plant_records).joinedload(PlantRecord.plant))
+        .filter(Record.id == record_id, Record.diary_id == diary_id)
+        .first()
+    )
     if not record:
         raise HTTPException(status_code=404, detail="記録が見つかりません")
     
@@ -264,48 +526,280 @@ async def get_record(record_id: int, db: Session = Depends(get_db)):
             "image": f"/api/images/{plant_record.image_filename}" if plant_record.image_filename else None
         })
     
+    response.headers["ETag"] = record_etag(record)
     return {
         "id": record.id,
         "date": record.record_date.isoformat(),
         "createdAt": record.created_at.isoformat(),
         "weather": record.weather.value,
         "temperature": float(record.temperature),
+        "version": record.version,
         "plants": plants_data
     }
 
+@app.get("/api/plant-records")
+@query_budget(1)
+async def query_plant_records(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    plant_id: Optional[int] = None,
+    weather: Optional[schemas.WeatherEnum] = None,
+    has_image: Optional[bool] = None,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Query plant records by date range, plant, weather and image presence"""
+    import crud
+    from models import WeatherEnum
+    
+    rows = crud.query_plant_records(
+        db,
+        diary_id=diary_id,
+        date_from=date_from,
+        date_to=date_to,
+        plant_id=plant_id,
+        weather=WeatherEnum(weather.value) if weather else None,
+        has_image=has_image,
+        skip=(page - 1) * per_page,
+        limit=per_page + 1  # One extra row tells whether another page exists
+    )
+    items = [
+        {
+            "id": row.id,
+            "recordId": row.record_id,
+            "date": row.record_date.isoformat(),
+            "weather": row.weather.value,
+            "temperature": float(row.temperature),
+            "plant": {"id": row.plant_id, "name": row.plant_name},
+            "height": float(row.height) if row.height is not None else None,
+            "comment": row.comment or "",
+            "image": f"/api/images/{row.image_filename}" if row.image_filename else None
+        }
+        for row in rows[:per_page]
+    ]
+    return {"items": items, "page": page, "per_page": per_page, "has_more": len(rows) > per_page}
+
+@app.get("/api/calendar")
+@query_budget(2)
+async def get_calendar(
+    request: Request,
+    year: int = Query(..., ge=2000, le=2100),
+    month: int = Query(..., ge=1, le=12),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Packed per-day summary of one month (entries / photos bitmaps, weather codes)"""
+    import calendar_summary
+    
+    def load_month():
+        summary = calendar_summary.month_summary(db, diary_id, year, month)
+        return {**summary, "weatherCodes": calendar_summary.weather_legend()}
+    
+    return cached_json(request, calendar_cache, ("month", year, month), load_month, diary_id)
+
+@app.get("/api/calendar/season")
+@query_budget(2)
+async def get_season_calendar(
+    request: Request,
+    year: int = Query(..., ge=2000, le=2100),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Packed per-day summaries of every month in a season"""
+    import calendar_summary
+    
+    def load_season():
+        months = calendar_summary.season_summary(db, diary_id, year)
+        return {"year": year, "months": months, "weatherCodes": calendar_summary.weather_legend()}
+    
+    return cached_json(request, calendar_cache, ("season", year), load_season, diary_id)
+
+@app.get("/api/gallery")
+@query_budget(1)
+async def get_gallery(
+    plant_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(30, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Image-bearing plant records, newest first, with keyset pagination"""
+    import crud
+    
+    after = None
+    if cursor:
+        try:
+            record_id, plant_record_id = (int(part) for part in cursor.split(":"))
+            after = (record_id, plant_record_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="無効なカーソルです")
+    
+    rows = crud.gallery_page(db, diary_id=diary_id, plant_id=plant_id, after=after, limit=limit + 1)
+    items = []
+    for row in rows[:limit]:
+        image = f"/api/images/{row.image_filename}"
+        items.append({
+            "id": row.id,
+            "recordId": row.record_id,
+            "date": row.record_date.isoformat(),
+            "plant": {"id": row.plant_id, "name": row.plant_name},
+            "filename": row.image_filename,
+            "width": row.image_width,
+            "height": row.image_height,
+            "image": image,
+            "thumbnails": {str(width): f"{image}?w={width}" for width in THUMBNAIL_WIDTHS}
+        })
+    
+    next_cursor = f"{rows[limit - 1].record_id}:{rows[limit - 1].id}" if len(rows) > limit else None
+    return {"items": items, "nextCursor": next_cursor}
+
+@app.get("/api/search")
+@query_budget(2)
+async def search_records(
+    q: str = Query(..., min_length=1, max_length=100),
+    page: int = Query(1, ge=1),
+    per_page: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Full-text search over plant record comments"""
+    from search import search_comments, highlight_snippet
+    
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="検索キーワードを入力してください")
+    
+    rows, total = search_comments(db, q, skip=(page - 1) * per_page, limit=per_page, diary_id=diary_id)
+    hits = [
+        {
+            "id": row.id,
+            "recordId": row.record_id,
+            "date": row.record_date.isoformat(),
+            "plant": {"id": row.plant_id, "name": row.plant_name},
+            "comment": row.comment or "",
+            "snippet": highlight_snippet(row.comment, q),
+            "image": f"/api/images/{row.image_filename}" if row.image_filename else None,
+            "score": float(row.score)
+        }
+        for row in rows
+    ]
+    return {"hits": hits, "total": total, "page": page, "per_page": per_page}
+
+@app.get("/api/archive/seasons")
+@query_budget(1)
+async def get_archived_seasons(db: Session = Depends(get_read_db), diary_id: int = Depends(get_diary_id)):
+    """Seasons moved to cold storage"""
+    import archive
+    
+    return [archive.season_to_dict(archived) for archived in archive.archived_seasons(db, diary_id)]
+
+@app.get("/api/archive/seasons/{year}")
+@query_budget(1)
+async def get_archived_season(
+    request: Request,
+    year: int,
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Records of an archived season, read from its Parquet file (slower than /api/records)"""
+    import asyncio
+    import archive
+    from models import ArchivedSeason
+    
+    archived = (
+        db.query(ArchivedSeason)
+        .filter(ArchivedSeason.diary_id == diary_id, ArchivedSeason.year == year)
+        .first()
+    )
+    if not archived:
+        raise HTTPException(status_code=404, detail="アーカイブが見つかりません")
+    
+    # Object fetch and decode stay off the event loop; repeat hits come from the cache
+    return await asyncio.to_thread(
+        cached_json, request, archive_cache, ("season", year),
+        lambda: {"year": year, "archived": True, "records": archive.load_season_records(archived)},
+        diary_id
+    )
+
+@app.get("/api/export/growth")
+@query_budget(2)
+async def export_growth(
+    request: Request,
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    db: Session = Depends(get_read_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Growth data (records x plant records x plants) as Parquet or Arrow IPC, cached per data version"""
+    import asyncio
+    import growth_export
+    
+    extension, content_type, _ = growth_export.EXPORT_FORMATS[format]
+    # Revalidation needs only the version, not the file
+    version = await asyncio.to_thread(growth_export.current_version, db, diary_id)
+    etag = f'"{diary_id}-{version}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    data, version = await asyncio.to_thread(growth_export.growth_file, db, diary_id, format, version)
+    headers["Content-Disposition"] = f'attachment; filename="growth-diary{diary_id}-v{version}.{extension}"'
+    return Response(data, media_type=content_type, headers=headers)
+
 @app.post("/api/records")
-async def create_record(record_data: dict, db: Session = Depends(get_db)):
-    """Create a new record"""
+async def create_record(
+    request: Request,
+    record_data: dict,
+    db: Session = Depends(get_write_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Create a new record
+
+    Retries carrying the same ``Idempotency-Key`` header get the original
+    response back; a second record for the same day is rejected with 400.
+    """
     from models import Record, PlantRecord, Plant, WeatherEnum
     from datetime import date, datetime, timezone, timedelta
     from fastapi import HTTPException
+    from sqlalchemy.exc import IntegrityError
+    import asyncio
+    import idempotency
+    
+    idempotency_key = idempotency.validate_key(request.headers.get(idempotency.IDEMPOTENCY_HEADER))
+    fingerprint = idempotency.request_fingerprint("POST", f"/api/records?diary={diary_id}", record_data)
+    
+    def duplicate_error(record_date):
+        """400 for an existing record of the day (looked up only after a conflict)"""
+        existing_record = (
+            db.query(Record).filter(Record.diary_id == diary_id, Record.record_date == record_date).first()
+        )
+        if not existing_record:
+            return None
+        logger.warning("重複エラー: 日付 %s の記録が既に存在します (ID: %s)", record_date, existing_record.id)
+        
+        # より詳細なエラーメッセージを返す
+        error_detail = {
+            "error": "DUPLICATE_RECORD",
+            "message": "今日の記録は既に存在します",
+            "existing_record": {
+                "id": existing_record.id,
+                "date": existing_record.record_date.isoformat(),
+                "created_at": existing_record.created_at.isoformat()
+            }
+        }
+        return HTTPException(status_code=400, detail=error_detail)
     
     try:
-        logger.info("=== 記録作成API開始 ===")
-        logger.info(f"受信データ: {record_data}")
+        debug_sampled(logger, "受信データ: %s", record_data)
+        
+        if idempotency_key:
+            replayed = idempotency.replay(db, idempotency_key, fingerprint)
+            if replayed:
+                return replayed
         
         # JST時刻を使用
         jst = timezone(timedelta(hours=9))
         record_date = datetime.now(jst).date()
-        logger.info(f"使用する日付（JST）: {record_date}")
-        
-        # Check if record already exists for today
-        existing_record = db.query(Record).filter(Record.record_date == record_date).first()
-        if existing_record:
-            logger.error(f"重複エラー: 日付 {record_date} の記録が既に存在します (ID: {existing_record.id})")
-            logger.error(f"既存記録の詳細: 作成日時={existing_record.created_at}, 天気={existing_record.weather.value}")
-            
-            # より詳細なエラーメッセージを返す
-            error_detail = {
-                "error": "DUPLICATE_RECORD",
-                "message": "今日の記録は既に存在します",
-                "existing_record": {
-                    "id": existing_record.id,
-                    "date": existing_record.record_date.isoformat(),
-                    "created_at": existing_record.created_at.isoformat()
-                }
-            }
-            raise HTTPException(status_code=400, detail=error_detail)
         
         # Validate required fields
         if 'weather' not in record_data:
@@ -330,28 +824,36 @@ async def create_record(record_data: dict, db: Session = Depends(get_db)):
         
         weather_value = record_data['weather']
         if weather_value not in weather_map:
-            logger.error(f"無効な天気値: {weather_value}")
+            logger.error("無効な天気値: %s", weather_value)
             raise HTTPException(status_code=400, detail=f"無効な天気値: {weather_value}")
         
         try:
             temperature_value = float(record_data['temperature'])
         except (ValueError, TypeError):
-            logger.error(f"無効な気温値: {record_data['temperature']}")
+            logger.error("無効な気温値: %s", record_data['temperature'])
             raise HTTPException(status_code=400, detail=f"無効な気温値: {record_data['temperature']}")
         
-        logger.info(f"メインレコード作成: 日付={record_date}, 天気={weather_value}, 気温={temperature_value}")
+        logger.info("メインレコード作成: 日付=%s, 天気=%s, 気温=%s", record_date, weather_value, temperature_value)
         
         db_record = Record(
+            diary_id=diary_id,
             record_date=record_date,
             weather=weather_map[weather_value],
             temperature=temperature_value
         )
         db.add(db_record)
-        db.flush()  # Get the ID
+        # Get the ID; the unique (diary_id, record_date) index rejects a second
+        # record for the day here (no pre-check query, so concurrent creates can't race)
+        db.flush()
+        events.emit(db, "record.created", diary_id, recordId=db_record.id, date=record_date.isoformat())
         
         # Create plant records
-        plants = db.query(Plant).all()
+        plants = db.query(Plant).filter(Plant.diary_id == diary_id).all()
         plant_name_to_id = {p.name: p.id for p in plants}
+        # One thread hop for the stored dimensions of every attached image
+        dimensions = await asyncio.to_thread(read_dimensions, (
+            p['imageFilename'] for p in record_data['plantRecords'].values() if p.get('imageFilename')
+        ))
         
         for plant_name, plant_data in record_data['plantRecords'].items():
             # Check if there's any meaningful data for this plant
@@ -383,45 +885,94 @@ async def create_record(record_data: dict, db: Session = Depends(get_db)):
                         
                     # Get image filename if provided
                     image_filename = plant_data.get('imageFilename')
+                    image_width, image_height = dimensions.get(image_filename, (None, None))
                     
                     db_plant_record = PlantRecord(
+                        diary_id=diary_id,
                         record_id=db_record.id,
                         plant_id=plant_id,
                         height=height_float,
                         comment=comment_value,
-                        image_filename=image_filename
+                        image_filename=image_filename,
+                        image_width=image_width,
+                        image_height=image_height
                     )
                     db.add(db_plant_record)
         
+        response = {"message": "記録を保存しました", "id": db_record.id}
+        if idempotency_key:
+            # Stored in the same transaction as the record itself
+            idempotency.remember(db, idempotency_key, fingerprint, 200, response)
         db.commit()
-        db.refresh(db_record)
+        await _fill_missing_dimensions(diary_id, dimensions)
         
-        return {"message": "記録を保存しました", "id": db_record.id}
+        return response
         
     except HTTPException:
         # Re-raise HTTP exceptions (like duplicate record)
         db.rollback()
         raise
+    except IntegrityError as e:
+        db.rollback()
+        # A concurrent retry with the same key won: return its response
+        if idempotency_key:
+            replayed = idempotency.replay(db, idempotency_key, fingerprint)
+            if replayed:
+                return replayed
+        duplicate = duplicate_error(record_date)
+        if duplicate:
+            raise duplicate
+        logger.error("Error creating record: %s", e, exc_info=True, extra={"record_data": record_data})
+        raise HTTPException(status_code=500, detail=f"記録の保存に失敗しました: {str(e)}")
     except Exception as e:
         db.rollback()
-        import traceback
-        logger.error(f"Error creating record: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        logger.error(f"Record data: {record_data}")
+        if is_transient(e):
+            raise
+        logger.error("Error creating record: %s", e, exc_info=True, extra={"record_data": record_data})
         raise HTTPException(status_code=500, detail=f"記録の保存に失敗しました: {str(e)}")
 
 @app.put("/api/records/{record_id}")
-async def update_record(record_id: int, record_data: dict, db: Session = Depends(get_db)):
-    """Update an existing record"""
-    from models import Record, PlantRecord, Plant, WeatherEnum
+async def update_record(
+    record_id: int,
+    record_data: dict,
+    request: Request,
+    db: Session = Depends(get_write_db),
+    diary_id: int = Depends(get_diary_id)
+):
+    """Update an existing record
+
+    With ``If-Match`` (the ETag from GET) the edit only applies if nobody
+    changed the record since; otherwise 412. The version check is also part
+    of the UPDATE itself, so no row lock is needed.
+    """
+    from models import Record, PlantRecord, Plant, WeatherEnum, get_jst_now
     from fastapi import HTTPException
+    from sqlalchemy.orm.exc import StaleDataError
+    import asyncio
+    
+    def conflict(current_etag: str = None):
+        exc = HTTPException(
+            status_code=412,
+            detail="他の人がこの記録を更新しました。再読み込みしてから編集してください",
+            headers={"ETag": current_etag} if current_etag else None
+        )
+        exc.error_code = "RECORD_CONFLICT"
+        return exc
     
     try:
         # Get existing record
-        db_record = db.query(Record).filter(Record.id == record_id).first()
+        db_record = db.query(Record).filter(Record.id == record_id, Record.diary_id == diary_id).first()
         if not db_record:
             raise HTTPException(status_code=404, detail="記録が見つかりません")
         
+        if_match = request.headers.get("if-match")
+        if if_match and not etag_matches(if_match, record_etag(db_record)):
+            raise conflict(record_etag(db_record))
+        
+        # Always UPDATE the record row so the version moves even when only
+        # plant records change
+        db_record.updated_at = get_jst_now()
+        
         # Update main record fields
         if 'weather' in record_data:
             weather_map = {
@@ -445,10 +996,14 @@ async def update_record(record_id: int, record_data: dict, db: Session = Depends
         
         # Update plant records
         if 'plantRecords' in record_data:
-            # Get all plants for mapping
-            plants = db.query(Plant).all()
+            # Get the diary's plants for mapping
+            plants = db.query(Plant).filter(Plant.diary_id == diary_id).all()
             plant_id_to_name = {p.id: p.name for p in plants}
             
+            dimensions = await asyncio.to_thread(read_dimensions, (
+                p['imageFilename'] for p in record_data['plantRecords'].values() if p.get('imageFilename')
+            ))
+            
             # Delete existing plant records
             db.query(PlantRecord).filter(PlantRecord.record_id == record_id).delete()
             
@@ -463,39 +1018,52 @@ async def update_record(record_id: int, record_data: dict, db: Session = Depends
                 if height is not None or comment or image_filename:
                     # Check if plant exists
                     if plant_id in plant_id_to_name:
+                        image_width, image_height = dimensions.get(image_filename, (None, None))
                         db_plant_record = PlantRecord(
+                            diary_id=diary_id,
                             record_id=record_id,
                             plant_id=plant_id,
                             height=float(height) if height is not None and height != '' else None,
                             comment=comment,
-                            image_filename=image_filename
+                            image_filename=image_filename,
+                            image_width=image_width,
+                            image_height=image_height
                         )
                         db.add(db_plant_record)
         
+        events.emit(db, "record.updated", diary_id, recordId=db_record.id, date=db_record.record_date.isoformat())
         db.commit()
-        db.refresh(db_record)
+        if 'plantRecords' in record_data:
+            await _fill_missing_dimensions(diary_id, dimensions)
         
-        return {"message": "記録を更新しました", "id": db_record.id}
+        return JSONResponse(
+            content={"message": "記録を更新しました", "id": db_record.id, "version": db_record.version},
+            headers={"ETag": record_etag(db_record)}
+        )
         
     except HTTPException:
         db.rollback()
         raise
+    except StaleDataError:
+        # Changed concurrently between our read and the UPDATE
+        db.rollback()
+        raise conflict()
     except Exception as e:
         db.rollback()
-        import traceback
-        logger.error(f"Error updating record: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        if is_transient(e):
+            raise
+        logger.error("Error updating record: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"記録の更新に失敗しました: {str(e)}")
 
 @app.delete("/api/records/{record_id}")
-async def delete_record(record_id: int, db: Session = Depends(get_db)):
+async def delete_record(record_id: int, db: Session = Depends(get_write_db), diary_id: int = Depends(get_diary_id)):
     """Delete a record"""
     from models import Record, PlantRecord
     from fastapi import HTTPException
     
     try:
         # Get existing record
-        db_record = db.query(Record).filter(Record.id == record_id).first()
+        db_record = db.query(Record).filter(Record.id == record_id, Record.diary_id == diary_id).first()
         if not db_record:
             raise HTTPException(status_code=404, detail="記録が見つかりません")
         
@@ -503,6 +1071,7 @@ async def delete_record(record_id: int, db: Session = Depends(get_db)):
         db.query(PlantRecord).filter(PlantRecord.record_id == record_id).delete()
         
         # Delete main record
+        events.emit(db, "record.deleted", diary_id, recordId=db_record.id, date=db_record.record_date.isoformat())
         db.delete(db_record)
         db.commit()
         
@@ -513,14 +1082,16 @@ async def delete_record(record_id: int, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         db.rollback()
-        import traceback
-        logger.error(f"Error deleting record: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        if is_transient(e):
+            raise
+        logger.error("Error deleting record: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"記録の削除に失敗しました: {str(e)}")
 
 @app.post("/api/upload/image")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(file: UploadFile = File(...), diary_id: int = Depends(get_diary_id)):
     """Upload image to MinIO"""
+    import asyncio
+    
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
@@ -531,44 +1102,131 @@ async def upload_image(file: UploadFile = File(...)):
         if len(file_data) > 3 * 1024 * 1024:
             raise HTTPException(status_code=400, detail="ファイルサイズは3MB以下にしてください")
         
-        # Get file extension
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-        
-        # Upload to MinIO
-        filename = minio_client.upload_image(file_data, file_extension)
+        # Store the raw upload and return at once; the ingest job re-encodes
+        # it (orientation, metadata strip, size cap) under the final filename
+        filename = f"{uuid.uuid4()}.{OUTPUT_EXTENSION}"
+        source = INCOMING_PREFIX + filename
+        await asyncio.to_thread(minio_client.put_image, source, file_data, file.content_type)
+        job_id = await job_runner.submit(
+            "image_ingest", {"source": source, "filename": filename, "diaryId": diary_id}
+        )
         
         return {
             "filename": filename,
-            "url": minio_client.get_image_url(filename)
+            "url": minio_client.get_image_url(filename),
+            "jobId": job_id
         }
         
+    except (HTTPException, ServiceUnavailable):
+        raise
     except Exception as e:
-        logger.error(f"Error uploading image: {e}")
+        logger.error("Error uploading image: %s", e)
         raise HTTPException(status_code=500, detail="画像のアップロードに失敗しました")
 
+@app.get("/api/events")
+async def stream_events(request: Request, diary_id: int = Depends(get_diary_id)):
+    """Server-sent events for one diary: record created / updated / deleted, image processed"""
+    from fastapi.responses import StreamingResponse
+    
+    # EventSource sends Last-Event-ID when it reconnects
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("lastEventId")
+    return StreamingResponse(
+        events.stream(diary_id, last_event_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: let nginx pass events through immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a background job"""
+    import asyncio
+    
+    job = await asyncio.to_thread(job_runner.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
+@app.get("/api/profiles")
+async def list_profiles(request: Request):
+    """Stored request profiles, newest first (admin session required)"""
+    import asyncio
+    
+    if not request.session.get("user"):
+        raise HTTPException(status_code=403, detail="管理画面にログインしてください")
+    ids = await asyncio.to_thread(profiling.stored_profiles)
+    return {
+        "profiles": [
+            {"id": pid, "speedscope": f"/api/profiles/{pid}.speedscope.json", "sql": f"/api/profiles/{pid}.sql.json"}
+            for pid in ids
+        ]
+    }
+
+@app.get("/api/profiles/{filename}")
+async def get_profile(request: Request, filename: str):
+    """A stored profile: ``<id>.speedscope.json`` or ``<id>.sql.json`` (admin session required)"""
+    from fastapi.responses import FileResponse
+    
+    if not request.session.get("user"):
+        raise HTTPException(status_code=403, detail="管理画面にログインしてください")
+    pid, _, suffix = filename.partition(".")
+    path = profiling.profile_path(pid, f".{suffix}")
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="プロファイルが見つかりません")
+    return FileResponse(path, media_type="application/json", filename=filename)
+
 @app.get("/api/images/{filename}")
-async def get_image(filename: str):
-    """Get image directly from MinIO"""
+async def get_image(filename: str, w: Optional[int] = None):
+    """Get image directly from MinIO (``w`` selects a thumbnail width)
+    
+    While MinIO is unavailable, recently served images come from memory and
+    others are answered with an uncached placeholder. So are photos whose
+    upload is still being processed: the raw upload is never served.
+    """
     from fastapi.responses import StreamingResponse
     from io import BytesIO
+    import asyncio
     import mimetypes
     
+    if w is not None and w not in THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"サムネイル幅は {', '.join(map(str, THUMBNAIL_WIDTHS))} のいずれかです")
+    
     try:
-        # Get image data from MinIO
-        image_data = minio_client.get_image(filename)
-        
-        # Determine content type based on file extension
-        content_type, _ = mimetypes.guess_type(filename)
-        if not content_type or not content_type.startswith('image/'):
-            content_type = 'image/jpeg'  # Default fallback
+        if w is not None:
+            image_data = await asyncio.to_thread(minio_client.get_thumbnail, filename, w)
+            content_type = 'image/jpeg'
+        else:
+            # Get image data from MinIO
+            image_data = await asyncio.to_thread(minio_client.get_image, filename)
+            
+            # Determine content type based on file extension
+            content_type, _ = mimetypes.guess_type(filename)
+            if not content_type or not content_type.startswith('image/'):
+                content_type = 'image/jpeg'  # Default fallback
         
         # Return as streaming response
         return StreamingResponse(
             BytesIO(image_data),
             media_type=content_type
         )
+    except ServiceUnavailable as e:
+        return Response(
+            PLACEHOLDER_SVG,
+            media_type="image/svg+xml",
+            headers={"Cache-Control": "no-store", "Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
-        logger.error(f"Error getting image: {e}")
+        pending = (
+            isinstance(e, S3Error) and e.code == "NoSuchKey"
+            and await asyncio.to_thread(minio_client.is_pending, filename)
+        )
+        if pending:
+            return Response(
+                PLACEHOLDER_SVG,
+                media_type="image/svg+xml",
+                headers={"Cache-Control": "no-store", "Retry-After": "2"}
+            )
+        logger.error("Error getting image: %s", e)
         raise HTTPException(status_code=404, detail="画像が見つかりません")
 
 if __name__ == "__main__":
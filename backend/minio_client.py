@@ -1,12 +1,80 @@
 from minio import Minio
-from minio.error import S3Error
+from minio.error import MinioException, S3Error
 import os
 import uuid
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
+from typing import List, Optional, Tuple
+
+import urllib3
+
+from images import make_thumbnail
+from resilience import CircuitBreaker, ServiceUnavailable
 
 logger = logging.getLogger(__name__)
 
+# Raw uploads waiting for the ingest job (see image_ingest.py)
+INCOMING_PREFIX = "incoming/"
+
+# Per-operation limits (the minio default is 5 minutes and 5 retries)
+MINIO_CONNECT_TIMEOUT = float(os.getenv("MINIO_CONNECT_TIMEOUT", "2"))
+MINIO_READ_TIMEOUT = float(os.getenv("MINIO_READ_TIMEOUT", "10"))
+MINIO_RETRIES = int(os.getenv("MINIO_RETRIES", "1"))
+MINIO_POOL_SIZE = int(os.getenv("MINIO_POOL_SIZE", "10"))
+# Circuit breaker: open after this many consecutive failures, probe again after the timeout
+MINIO_BREAKER_THRESHOLD = int(os.getenv("MINIO_BREAKER_THRESHOLD", "5"))
+MINIO_BREAKER_RESET_SECONDS = float(os.getenv("MINIO_BREAKER_RESET_SECONDS", "30"))
+# Recently read small objects (thumbnails, report pages) kept to serve while MinIO is down
+MINIO_CACHE_BYTES = int(os.getenv("MINIO_CACHE_BYTES", str(32 * 1024 * 1024)))
+MINIO_CACHE_MAX_OBJECT_BYTES = 512 * 1024
+
+# Errors meaning MinIO did not answer; S3Error (NoSuchKey, ...) is an answer
+STORAGE_ERRORS = (urllib3.exceptions.HTTPError, OSError, MinioException)
+
+
+def _is_storage_failure(exc: BaseException) -> bool:
+    return isinstance(exc, STORAGE_ERRORS) and not isinstance(exc, S3Error)
+
+
+class RecentObjects:
+    """Byte-bounded LRU of object contents"""
+
+    def __init__(self, max_bytes: int, max_object_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(name)
+            if data is not None:
+                self._items.move_to_end(name)
+            return data
+
+    def put(self, name: str, data: bytes):
+        if len(data) > self.max_object_bytes or self.max_bytes <= 0:
+            return
+        with self._lock:
+            old = self._items.pop(name, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[name] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, name: str):
+        with self._lock:
+            old = self._items.pop(name, None)
+            if old is not None:
+                self.size -= len(old)
+
 class MinIOClient:
     def __init__(self):
         self.endpoint = os.getenv("MINIO_ENDPOINT", "minio:9000")
@@ -19,44 +87,73 @@ class MinIOClient:
             self.endpoint,
             access_key=self.access_key,
             secret_key=self.secret_key,
-            secure=False  # Set to True for HTTPS
+            secure=False,  # Set to True for HTTPS
+            http_client=urllib3.PoolManager(
+                timeout=urllib3.util.Timeout(connect=MINIO_CONNECT_TIMEOUT, read=MINIO_READ_TIMEOUT),
+                maxsize=MINIO_POOL_SIZE,
+                retries=urllib3.Retry(total=MINIO_RETRIES, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
+            )
+        )
+        self.breaker = CircuitBreaker(
+            "MinIO", MINIO_BREAKER_THRESHOLD, MINIO_BREAKER_RESET_SECONDS, is_failure=_is_storage_failure
         )
+        self.recent = RecentObjects(MINIO_CACHE_BYTES, MINIO_CACHE_MAX_OBJECT_BYTES)
         
         # Create bucket if it doesn't exist
         self._create_bucket_if_not_exists()
     
+    @contextmanager
+    def _storage(self):
+        """Run MinIO calls through the circuit breaker
+        
+        Connection errors and timeouts surface as ``ServiceUnavailable``;
+        S3 errors (missing key, ...) pass through unchanged.
+        """
+        try:
+            with self.breaker:
+                yield
+        except ServiceUnavailable:
+            raise
+        except Exception as e:
+            if not _is_storage_failure(e):
+                raise
+            logger.error("MinIO request failed: %s", e)
+            raise ServiceUnavailable("MinIO", self.breaker.retry_after()) from e
+    
     def _create_bucket_if_not_exists(self):
         """Create bucket if it doesn't exist"""
         try:
             if not self.client.bucket_exists(self.bucket_name):
                 self.client.make_bucket(self.bucket_name)
-                logger.info(f"Created bucket: {self.bucket_name}")
+                logger.info("Created bucket: %s", self.bucket_name)
             else:
-                logger.info(f"Bucket already exists: {self.bucket_name}")
+                logger.info("Bucket already exists: %s", self.bucket_name)
         except S3Error as e:
-            logger.error(f"Error creating bucket: {e}")
+            logger.error("Error creating bucket: %s", e)
             raise
     
-    def upload_image(self, file_data: bytes, file_extension: str) -> str:
+    def upload_image(self, file_data: bytes, file_extension: str, metadata: dict = None) -> str:
         """Upload image to MinIO and return filename"""
         try:
             # Generate unique filename
             filename = f"{uuid.uuid4()}.{file_extension.lower()}"
             
             # Upload file
-            self.client.put_object(
-                self.bucket_name,
-                filename,
-                BytesIO(file_data),
-                length=len(file_data),
-                content_type=f"image/{file_extension.lower()}"
-            )
+            with self._storage():
+                self.client.put_object(
+                    self.bucket_name,
+                    filename,
+                    BytesIO(file_data),
+                    length=len(file_data),
+                    content_type=f"image/{file_extension.lower()}",
+                    metadata=metadata
+                )
             
-            logger.info(f"Uploaded image: {filename}")
+            logger.info("Uploaded image: %s", filename)
             return filename
             
         except S3Error as e:
-            logger.error(f"Error uploading image: {e}")
+            logger.error("Error uploading image: %s", e)
             raise
     
     def get_image_url(self, filename: str) -> str:
@@ -65,33 +162,136 @@ class MinIOClient:
             # For development, return direct URL
             return f"http://localhost:9002/{self.bucket_name}/{filename}"
         except S3Error as e:
-            logger.error(f"Error getting image URL: {e}")
+            logger.error("Error getting image URL: %s", e)
+            raise
+    
+    def put_image(self, object_name: str, file_data: bytes, content_type: str, metadata: dict = None):
+        """Store image bytes under an explicit object name"""
+        try:
+            with self._storage():
+                self.client.put_object(
+                    self.bucket_name,
+                    object_name,
+                    BytesIO(file_data),
+                    length=len(file_data),
+                    content_type=content_type,
+                    metadata=metadata
+                )
+            self.recent.discard(object_name)
+        except S3Error as e:
+            logger.error("Error storing image: %s", e)
             raise
     
     def get_image(self, filename: str) -> bytes:
-        """Get image data from MinIO"""
+        """Get image data from MinIO
+        
+        While MinIO is unavailable a recently read copy is returned if there
+        is one.
+        """
         try:
             # Get object data
-            response = self.client.get_object(self.bucket_name, filename)
-            image_data = response.read()
-            response.close()
-            response.release_conn()
+            with self._storage():
+                response = self.client.get_object(self.bucket_name, filename)
+                try:
+                    image_data = response.read()
+                finally:
+                    response.close()
+                    response.release_conn()
             
-            logger.info(f"Retrieved image: {filename}")
+            logger.debug("Retrieved image: %s", filename)
+            self.recent.put(filename, image_data)
             return image_data
             
         except S3Error as e:
-            logger.error(f"Error getting image: {e}")
+            logger.error("Error getting image: %s", e)
+            raise
+        except ServiceUnavailable:
+            cached = self.recent.get(filename)
+            if cached is None:
+                raise
+            logger.warning("MinIO unavailable; serving cached copy of %s", filename)
+            return cached
+    
+    def is_pending(self, filename: str) -> bool:
+        """Whether the raw upload of ``filename`` is still waiting for the ingest job
+        
+        The raw upload itself is never served: it still carries EXIF/GPS.
+        """
+        try:
+            with self._storage():
+                self.client.stat_object(self.bucket_name, INCOMING_PREFIX + filename)
+            return True
+        except S3Error:
+            return False
+    
+    def get_image_dimensions(self, filename: str) -> Tuple[Optional[int], Optional[int]]:
+        """Width/height stored as object metadata at upload time"""
+        try:
+            with self._storage():
+                stat = self.client.stat_object(self.bucket_name, filename)
+        except (S3Error, ServiceUnavailable) as e:
+            # Not processed yet: the ingest job fills in the dimensions later
+            logger.debug("Image metadata not available: %s", e)
+            return None, None
+        metadata = {k.lower(): v for k, v in (stat.metadata or {}).items()}
+        try:
+            return int(metadata["x-amz-meta-width"]), int(metadata["x-amz-meta-height"])
+        except (KeyError, ValueError):
+            return None, None
+    
+    def get_thumbnail(self, filename: str, width: int) -> bytes:
+        """Get a JPEG thumbnail, generating and storing it on first use"""
+        thumbnail_name = f"thumbs/{width}/{filename}"
+        try:
+            return self.get_image(thumbnail_name)
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+        
+        thumbnail = make_thumbnail(self.get_image(filename), width)
+        with self._storage():
+            self.client.put_object(
+                self.bucket_name,
+                thumbnail_name,
+                BytesIO(thumbnail),
+                length=len(thumbnail),
+                content_type="image/jpeg"
+            )
+        self.recent.put(thumbnail_name, thumbnail)
+        logger.info("Created thumbnail: %s", thumbnail_name)
+        return thumbnail
+    
+    def object_exists(self, object_name: str) -> bool:
+        try:
+            with self._storage():
+                self.client.stat_object(self.bucket_name, object_name)
+            return True
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return False
+    
+    def list_object_names(self, prefix: str) -> List[str]:
+        """Names of the objects under ``prefix``"""
+        try:
+            with self._storage():
+                return [
+                    obj.object_name for obj in self.client.list_objects(self.bucket_name, prefix=prefix, recursive=True)
+                ]
+        except S3Error as e:
+            logger.error("Error listing objects: %s", e)
             raise
     
     def delete_image(self, filename: str) -> bool:
         """Delete image from MinIO"""
+        self.recent.discard(filename)
         try:
-            self.client.remove_object(self.bucket_name, filename)
-            logger.info(f"Deleted image: {filename}")
+            with self._storage():
+                self.client.remove_object(self.bucket_name, filename)
+            logger.info("Deleted image: %s", filename)
             return True
         except S3Error as e:
-            logger.error(f"Error deleting image: {e}")
+            logger.error("Error deleting image: %s", e)
             return False
 
 # Global MinIO client instance
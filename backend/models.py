@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, Boolean, ForeignKey, Enum, Index, Computed, JSON, UniqueConstraint
 from sqlalchemy.types import DECIMAL
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -19,6 +19,9 @@ class WeatherEnum(enum.Enum):
     rainy = "rainy"
     thunder = "thunder"
 
+# Diary used when a request does not name one (the original single diary)
+DEFAULT_DIARY_ID = 1
+
 class User(Base):
     __tablename__ = "users"
     
@@ -28,10 +31,21 @@ class User(Base):
     created_at = Column(DateTime, default=get_jst_now)
     updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
 
+class Diary(Base):
+    """One observation diary (a class or a child); records and plants belong to one"""
+    __tablename__ = "diaries"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=get_jst_now)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+
 class Plant(Base):
     __tablename__ = "plants"
     
     id = Column(Integer, primary_key=True, index=True)
+    diary_id = Column(Integer, ForeignKey("diaries.id"), nullable=False, default=DEFAULT_DIARY_ID, server_default="1")
     name = Column(String(50), nullable=False)
     display_order = Column(Integer, default=0)
     is_active = Column(Boolean, default=True)
@@ -40,31 +54,57 @@ class Plant(Base):
     
     # Relationship
     plant_records = relationship("PlantRecord", back_populates="plant")
+    
+    __table_args__ = (
+        Index("ix_plants_diary_id_display_order", "diary_id", "display_order"),
+    )
 
 class Record(Base):
     __tablename__ = "records"
     
     id = Column(Integer, primary_key=True, index=True)
-    record_date = Column(Date, nullable=False, unique=True, index=True)
+    diary_id = Column(Integer, ForeignKey("diaries.id"), nullable=False, default=DEFAULT_DIARY_ID, server_default="1")
+    record_date = Column(Date, nullable=False)
     weather = Column(Enum(WeatherEnum), nullable=False)
     temperature = Column(DECIMAL(4, 1), nullable=False)
     created_at = Column(DateTime, default=get_jst_now)
     updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+    # Optimistic locking: every UPDATE checks and increments this (ETag of the record)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Data version of the transaction that last wrote the row (delta sync cursor)
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     # Relationship
     plant_records = relationship("PlantRecord", back_populates="record", cascade="all, delete-orphan")
+    
+    # Every index leads with diary_id: a diary's queries only touch its own rows
+    __table_args__ = (
+        # One record per day per diary; also the date range index
+        UniqueConstraint("diary_id", "record_date", name="uq_records_diary_id_record_date"),
+        # Weather filter + date range
+        Index("ix_records_diary_id_weather_record_date", "diary_id", "weather", "record_date"),
+        Index("ix_records_diary_id_change_seq", "diary_id", "change_seq"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 class PlantRecord(Base):
     __tablename__ = "plant_records"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Copied from the record (see data_version.diary_of) so diary-wide scans use their own indexes
+    diary_id = Column(Integer, ForeignKey("diaries.id"), nullable=False, default=DEFAULT_DIARY_ID, server_default="1")
     record_id = Column(Integer, ForeignKey("records.id", ondelete="CASCADE"), nullable=False)
     plant_id = Column(Integer, ForeignKey("plants.id", ondelete="CASCADE"), nullable=False)
     height = Column(DECIMAL(5, 1))
     image_filename = Column(String(255))
+    image_width = Column(Integer)
+    image_height = Column(Integer)
+    # Generated column standing in for a partial index "WHERE image_filename IS NOT NULL"
+    has_image = Column(Boolean, Computed("image_filename IS NOT NULL"))
     comment = Column(Text)
     created_at = Column(DateTime, default=get_jst_now)
     updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     # Relationships
     record = relationship("Record", back_populates="plant_records")
@@ -72,5 +112,106 @@ class PlantRecord(Base):
     
     # Composite index for performance
     __table_args__ = (
+        # Per-plant history (the has-image filter is checked in the index, before the row lookup)
+        Index("ix_plant_records_plant_id_record_id", "plant_id", "record_id", "image_filename"),
+        # Plant records of a record / date range joined from records
+        Index("ix_plant_records_record_id_plant_id", "record_id", "plant_id"),
+        # Gallery keyset pagination (image-bearing rows only, per plant / whole diary)
+        Index("ix_plant_records_gallery", "plant_id", "has_image", "record_id"),
+        Index("ix_plant_records_gallery_diary", "diary_id", "has_image", "record_id"),
+        Index("ix_plant_records_diary_id_change_seq", "diary_id", "change_seq"),
+        # Full-text search over comments (ngram parser for Japanese)
+        Index("ft_plant_records_comment", "comment", mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
         {"mysql_engine": "InnoDB"},
-    )
\ No newline at end of file
+    )
+
+class DataVersion(Base):
+    """Per-diary counter bumped in every transaction that changes the diary's data"""
+    __tablename__ = "data_versions"
+    
+    id = Column(Integer, primary_key=True)  # = diaries.id
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+
+class Job(Base):
+    """Background job (image processing, media generation, reports)"""
+    __tablename__ = "jobs"
+    
+    id = Column(String(36), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued / running / done / failed
+    progress = Column(Integer, nullable=False, default=0)
+    params = Column(JSON)
+    # Identifies the job's output; a pending job with the same kind and key is reused
+    dedupe_key = Column(String(255))
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, default=get_jst_now)
+    updated_at = Column(DateTime, default=get_jst_now, onupdate=get_jst_now)
+    
+    __table_args__ = (
+        # Pending jobs to resume after a restart
+        Index("ix_jobs_status_updated_at", "status", "updated_at"),
+        Index("ix_jobs_kind_dedupe_key", "kind", "dedupe_key"),
+    )
+
+class IdempotencyKey(Base):
+    """Response of a write request, replayed when the client retries with the same key"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON)
+    created_at = Column(DateTime, default=get_jst_now, index=True)
+
+class ChangeEvent(Base):
+    """Outbox of change notifications, written in the same transaction as the change"""
+    __tablename__ = "change_events"
+    
+    # Integer on SQLite so the primary key autoincrements (rowid)
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    diary_id = Column(Integer, nullable=False, default=DEFAULT_DIARY_ID, server_default="1")
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON)
+    # Diary's data version of the emitting transaction (commit-ordered, see events.py)
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=get_jst_now, index=True)
+    
+    __table_args__ = (
+        Index("ix_change_events_diary_id_change_seq", "diary_id", "change_seq"),
+    )
+
+class Tombstone(Base):
+    """Deleted record / plant record, kept so delta sync clients can drop it"""
+    __tablename__ = "tombstones"
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    diary_id = Column(Integer, nullable=False, default=DEFAULT_DIARY_ID, server_default="1")
+    entity = Column(String(20), nullable=False)  # record / plant_record
+    entity_id = Column(Integer, nullable=False)
+    record_id = Column(Integer)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, default=get_jst_now)
+    
+    __table_args__ = (
+        Index("ix_tombstones_diary_id_change_seq", "diary_id", "change_seq"),
+    )
+
+class ArchivedSeason(Base):
+    """Closed season moved out of the hot tables into a Parquet file in object storage"""
+    __tablename__ = "archived_seasons"
+    
+    id = Column(Integer, primary_key=True)
+    diary_id = Column(Integer, ForeignKey("diaries.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    object_name = Column(String(255), nullable=False)
+    record_count = Column(Integer, nullable=False)
+    plant_record_count = Column(Integer, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    archived_at = Column(DateTime, default=get_jst_now)
+    
+    __table_args__ = (
+        UniqueConstraint("diary_id", "year", name="uq_archived_seasons_diary_id_year"),
+    )
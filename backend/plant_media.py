@@ -0,0 +1,134 @@
+"""Time-lapse and contact-sheet generation for one plant's photos.
+
+``POST /api/plants/{plant_id}/media`` resolves the ordered list of the
+plant's photos in a season and derives the output's object name from a hash
+of that list and the rendering options. If the object already exists the
+request is answered at once; otherwise a ``plant_media`` job fetches the
+originals concurrently, renders them in the process pool (see
+``images.make_timelapse`` / ``images.make_contact_sheet``) and stores the
+result under that name. Each original is shrunk to frame size as soon as it
+arrives, so the job holds (and pickles to the renderer) only small frames.
+Repeating the request while the job is pending returns the same job. A new
+or replaced photo changes the hash, so stale output is never served.
+"""
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from minio.error import S3Error
+from sqlalchemy.orm import Session
+
+from images import downscale_frame, make_contact_sheet, make_timelapse
+from jobs import job_runner
+from minio_client import minio_client
+from models import PlantRecord, Record
+
+logger = logging.getLogger(__name__)
+
+MEDIA_MAX_FRAMES = int(os.getenv("MEDIA_MAX_FRAMES", "120"))
+MEDIA_FETCH_CONCURRENCY = int(os.getenv("MEDIA_FETCH_CONCURRENCY", "8"))
+MEDIA_CONCURRENCY = int(os.getenv("MEDIA_CONCURRENCY", "1"))
+TIMELAPSE_EDGE = int(os.getenv("TIMELAPSE_EDGE", "480"))
+TIMELAPSE_FRAME_MS = int(os.getenv("TIMELAPSE_FRAME_MS", "400"))
+CONTACT_SHEET_COLUMNS = int(os.getenv("CONTACT_SHEET_COLUMNS", "6"))
+CONTACT_SHEET_CELL = int(os.getenv("CONTACT_SHEET_CELL", "320"))
+MEDIA_QUALITY = 80
+
+# kind -> output formats (first = default)
+MEDIA_FORMATS = {
+    "timelapse": ("webp", "gif"),
+    "contact_sheet": ("jpg",),
+}
+_PIL_FORMATS = {"webp": "WEBP", "gif": "GIF", "jpg": "JPEG"}
+
+
+def plant_photos(db: Session, diary_id: int, plant_id: int, year: Optional[int] = None) -> List[Tuple[date, str]]:
+    """(date, filename) of the plant's photos, oldest first, evenly thinned to ``MEDIA_MAX_FRAMES``"""
+    query = (
+        db.query(Record.record_date, PlantRecord.image_filename)
+        .join(Record, Record.id == PlantRecord.record_id)
+        .filter(PlantRecord.diary_id == diary_id, PlantRecord.plant_id == plant_id, PlantRecord.has_image == True)
+    )
+    if year:
+        query = query.filter(Record.record_date >= date(year, 1, 1), Record.record_date <= date(year, 12, 31))
+    photos = [(row.record_date, row.image_filename) for row in query.order_by(Record.record_date)]
+    if len(photos) > MEDIA_MAX_FRAMES:
+        step = len(photos) / MEDIA_MAX_FRAMES
+        photos = [photos[int(i * step)] for i in range(MEDIA_MAX_FRAMES)]
+    return photos
+
+
+def frame_edge(kind: str) -> int:
+    """Size each photo is shrunk to before rendering"""
+    return TIMELAPSE_EDGE if kind == "timelapse" else CONTACT_SHEET_CELL - 8
+
+
+def media_object_name(kind: str, fmt: str, photos: List[Tuple[date, str]]) -> str:
+    """Content-addressed name: same photos in the same order and options -> same object"""
+    options = (
+        {"edge": TIMELAPSE_EDGE, "frameMs": TIMELAPSE_FRAME_MS} if kind == "timelapse"
+        else {"columns": CONTACT_SHEET_COLUMNS, "cell": CONTACT_SHEET_CELL}
+    )
+    key = json.dumps(
+        {"kind": kind, "format": fmt, "options": options, "photos": [[d.isoformat(), f] for d, f in photos]},
+        sort_keys=True,
+    )
+    # Flat name so it is served by /api/images/{filename}
+    return f"media-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}.{fmt}"
+
+
+async def generate_media(job_id: str, params: Dict[str, Any], report_progress: Callable) -> Dict[str, Any]:
+    kind, fmt, object_name = params["kind"], params["format"], params["objectName"]
+    photos = [(date.fromisoformat(d), filename) for d, filename in params["photos"]]
+
+    semaphore = asyncio.Semaphore(MEDIA_FETCH_CONCURRENCY)
+    edge = frame_edge(kind)
+    fetched = 0
+
+    async def fetch(filename: str) -> Optional[bytes]:
+        nonlocal fetched
+        async with semaphore:
+            try:
+                original = await asyncio.to_thread(minio_client.get_image, filename)
+            except S3Error as e:
+                logger.warning("Photo %s unavailable for %s: %s", filename, object_name, e)
+                frame = None
+            else:
+                # Shrink now: only frame-sized copies are kept and pickled to the renderer
+                frame = await job_runner.run_in_process(downscale_frame, original, edge)
+        fetched += 1
+        if fetched % 10 == 0:
+            await report_progress(60 * fetched // len(photos))
+        return frame
+
+    scaled = await asyncio.gather(*(fetch(filename) for _, filename in photos))
+    frames = [(d, data) for (d, _), data in zip(photos, scaled) if data]
+    if not frames:
+        raise ValueError("写真がありません")
+    await report_progress(60)
+
+    if kind == "timelapse":
+        output = await job_runner.run_in_process(
+            make_timelapse, [data for _, data in frames], TIMELAPSE_EDGE, _PIL_FORMATS[fmt],
+            TIMELAPSE_FRAME_MS, MEDIA_QUALITY
+        )
+    else:
+        output = await job_runner.run_in_process(
+            make_contact_sheet, [data for _, data in frames], [d.strftime("%m/%d") for d, _ in frames],
+            CONTACT_SHEET_COLUMNS, CONTACT_SHEET_CELL, MEDIA_QUALITY
+        )
+    await report_progress(90)
+
+    await asyncio.to_thread(
+        minio_client.put_image, object_name, output, f"image/{'jpeg' if fmt == 'jpg' else fmt}",
+        {"frames": str(len(frames))}
+    )
+    logger.info("Generated %s %s from %d photos (%d bytes)", kind, object_name, len(frames), len(output))
+    return {"url": f"/api/images/{object_name}", "frames": len(frames), "bytes": len(output)}
+
+
+job_runner.register("plant_media", generate_media, concurrency=MEDIA_CONCURRENCY)
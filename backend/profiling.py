@@ -0,0 +1,203 @@
+"""Opt-in profiling of single requests in production.
+
+A request carrying ``X-Profile: 1`` (or ``?__profile=1``) from a browser
+logged in to the admin site (SQLAdmin session) is run under a pyinstrument
+sampling profiler, and every SQL statement it executes is timed. The result
+is written to ``PROFILE_DIR`` as ``<id>.speedscope.json`` (open it at
+https://www.speedscope.app) and ``<id>.sql.json`` (statements with their
+durations); the response carries the id in ``X-Profile-Id``. Only the
+newest ``PROFILE_RETENTION`` profiles are kept.
+
+Other requests pay one header scan in the middleware and one context
+variable lookup per SQL statement. At most one request per worker is
+profiled at a time; a second flagged request runs unprofiled.
+
+Samples cover the event loop thread. Work handed to threads (``to_thread``)
+shows up as time spent awaiting it; its SQL is still in the query list.
+"""
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pyinstrument is optional; profiling is unavailable without it
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/kansatsu-profiles")
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_FLAG = b"__profile=1"
+PROFILE_ID_HEADER = b"x-profile-id"
+
+_SUFFIXES = (".speedscope.json", ".sql.json")
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{12}-[a-z0-9_-]+-[0-9a-f]{8}$")
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+class ProfiledQueries:
+    """SQL statements of the profiled request"""
+
+    def __init__(self):
+        self.queries: List[Dict[str, Any]] = []
+        self._started: Dict[int, float] = {}
+
+    def start(self, cursor):
+        self._started[id(cursor)] = time.perf_counter()
+
+    def finish(self, cursor, statement: str, executemany: bool):
+        started = self._started.pop(id(cursor), None)
+        if started is None:
+            return
+        self.queries.append({
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+            "statement": statement,
+            "executemany": executemany,
+            "rowcount": cursor.rowcount,
+        })
+
+
+_current_queries: ContextVar[Optional[ProfiledQueries]] = ContextVar("profiled_queries", default=None)
+# One profiled request per worker at a time
+_busy = threading.Lock()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_statement(conn, cursor, statement, parameters, context, executemany):
+    queries = _current_queries.get()
+    if queries is not None:
+        queries.start(cursor)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_statement(conn, cursor, statement, parameters, context, executemany):
+    queries = _current_queries.get()
+    if queries is not None:
+        queries.finish(cursor, statement, executemany)
+
+
+def requested(scope) -> bool:
+    """Whether the request asks to be profiled (the cheap check done for every request)"""
+    if PROFILE_QUERY_FLAG in scope.get("query_string", b""):
+        return True
+    return any(name == PROFILE_HEADER and value in (b"1", b"true") for name, value in scope["headers"])
+
+
+def is_admin(scope) -> bool:
+    session = scope.get("session")
+    return bool(session and session.get("user"))
+
+
+def profile_id(method: str, path: str) -> str:
+    slug = _SLUG_RE.sub("-", f"{method}{path}".lower()).strip("-")[:60]
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{slug}-{uuid.uuid4().hex[:8]}"
+
+
+def profile_path(pid: str, suffix: str) -> Optional[str]:
+    """Path of a stored profile file, ``None`` for ids that are not ours"""
+    if not _PROFILE_ID_RE.match(pid) or suffix not in _SUFFIXES:
+        return None
+    return os.path.join(PROFILE_DIR, pid + suffix)
+
+
+def stored_profiles() -> List[str]:
+    """Profile ids on disk, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    ids = {name[:-len(".sql.json")] for name in os.listdir(PROFILE_DIR) if name.endswith(".sql.json")}
+    return sorted(ids, reverse=True)
+
+
+def _save(pid: str, speedscope: str, summary: Dict[str, Any]):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, pid + ".speedscope.json"), "w", encoding="utf-8") as f:
+        f.write(speedscope)
+    # Written last: lists a profile only once both files exist
+    with open(os.path.join(PROFILE_DIR, pid + ".sql.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=1)
+    for old in stored_profiles()[PROFILE_RETENTION:]:
+        for suffix in _SUFFIXES:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    """Profiles requests flagged by a logged-in admin (must run inside SessionMiddleware)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http" or not PROFILING_ENABLED or Profiler is None
+            or not requested(scope) or not is_admin(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not _busy.acquire(blocking=False):
+            logger.info("Profiling skipped for %s: another request is being profiled", scope["path"])
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            pid = profile_id(scope["method"], scope["path"])
+            status = None
+
+            async def send_with_id(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    message["headers"] = list(message.get("headers", [])) + [(PROFILE_ID_HEADER, pid.encode())]
+                await send(message)
+
+            queries = ProfiledQueries()
+            token = _current_queries.set(queries)
+            profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+            started = time.perf_counter()
+            profiler.start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.stop()
+                _current_queries.reset(token)
+                elapsed = (time.perf_counter() - started) * 1000
+
+                summary = {
+                    "id": pid,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "ms": round(elapsed, 1),
+                    "sqlCount": len(queries.queries),
+                    "sqlMs": round(sum(query["ms"] for query in queries.queries), 1),
+                    "queries": queries.queries,
+                }
+                try:
+                    speedscope = profiler.output(renderer=SpeedscopeRenderer())
+                    await asyncio.to_thread(_save, pid, speedscope, summary)
+                    logger.info("Profiled %s %s in %.0f ms (%d SQL): %s",
+                                scope["method"], scope["path"], elapsed, len(queries.queries), pid)
+                except Exception as e:
+                    logger.error("Saving profile %s failed: %s", pid, e)
+        finally:
+            _busy.release()
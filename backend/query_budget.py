@@ -0,0 +1,179 @@
+"""Per-request SQL statement counting and N+1 detection.
+
+Statements are counted through SQLAlchemy ``before_cursor_execute`` events
+and attributed to the current request through a context variable, so the
+counter works for every engine and session without touching the endpoints.
+Shared infrastructure lookups that most requests answer from memory (the
+diary check, the data version poll) run inside ``uncounted()`` and are not
+charged to whichever route happens to trigger them.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# "off": 計測しない / "log": 超過時に警告ログ / "raise": 超過時に例外
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log").lower()
+# Default budget for routes that do not declare one (0 = unlimited)
+DEFAULT_QUERY_BUDGET = int(os.getenv("DEFAULT_QUERY_BUDGET", "0"))
+# Same statement shape repeated this many times in one request is reported as N+1
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv("REPEATED_STATEMENT_THRESHOLD", "5"))
+
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PARAM_LIST_RE = re.compile(r"\((?:\s*(?:%s|\?|%\([^)]*\)s|:\w+)\s*,?)+\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request or block runs more statements than its budget"""
+
+    def __init__(self, label: str, stats: "QueryStats", budget: int):
+        self.label = label
+        self.stats = stats
+        self.budget = budget
+        super().__init__(
+            f"{label}: {stats.count} queries (budget {budget}); "
+            f"repeated: {stats.repeated_shapes() or 'none'}"
+        )
+
+
+class QueryStats:
+    """Statements executed within one request (or one counted block)"""
+
+    def __init__(self):
+        self.count = 0
+        self.shapes: Counter = Counter()
+
+    def add(self, statement: str):
+        self.count += 1
+        self.shapes[normalize_statement(statement)] += 1
+
+    def repeated_shapes(self, threshold: int = None) -> Dict[str, int]:
+        """Statement shapes executed at least ``threshold`` times (likely N+1)"""
+        threshold = threshold or REPEATED_STATEMENT_THRESHOLD
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_uncounted: ContextVar[bool] = ContextVar("query_stats_uncounted", default=False)
+# Process-wide collectors used by the test helpers (see count_queries)
+_collectors: List[QueryStats] = []
+
+
+def normalize_statement(statement: str) -> str:
+    """Reduce a SQL statement to its shape (literals and IN-lists collapsed)"""
+    shape = _STRING_RE.sub("?", statement)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _PARAM_LIST_RE.sub("(...)", shape)
+    return _WHITESPACE_RE.sub(" ", shape).strip()
+
+
+@contextmanager
+def uncounted():
+    """Leave the statements of the block out of every count (infrastructure lookups)"""
+    token = _uncounted.set(True)
+    try:
+        yield
+    finally:
+        _uncounted.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if _uncounted.get():
+        return
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(statement)
+    for collector in _collectors:
+        collector.add(statement)
+
+
+def query_budget(max_queries: int) -> Callable:
+    """Declare the maximum number of SQL statements a route may run"""
+    def decorator(func: Callable) -> Callable:
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+def check_budget(label: str, stats: QueryStats, budget: int, mode: str = None):
+    """Log or raise when ``stats`` exceed ``budget`` or contain N+1 shapes"""
+    mode = mode or QUERY_BUDGET_MODE
+    repeated = stats.repeated_shapes()
+    over_budget = budget > 0 and stats.count > budget
+
+    if repeated:
+        for shape, n in repeated.items():
+            logger.warning("Repeated statement in %s (%d times, possible N+1): %s", label, n, shape)
+    if over_budget:
+        if mode == "raise":
+            raise QueryBudgetExceeded(label, stats, budget)
+        logger.warning("Query budget exceeded in %s: %d queries (budget %d)", label, stats.count, budget)
+
+
+@contextmanager
+def count_queries():
+    """Count every statement executed while the block is active
+
+    The collector is process-wide rather than bound to the current context,
+    so requests made through ``TestClient`` (which runs the app on another
+    thread) are counted too. Intended for tests and benchmarks.
+    """
+    stats = QueryStats()
+    _collectors.append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors.remove(stats)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, label: str = "block", allow_repeated: bool = False):
+    """Test helper: fail if the block runs more than ``max_queries`` statements
+
+    Unless ``allow_repeated`` is set, repeated statement shapes also fail the
+    block, which catches N+1 patterns even when the total is within budget.
+    """
+    with count_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        raise QueryBudgetExceeded(label, stats, max_queries)
+    if not allow_repeated and stats.repeated_shapes():
+        raise QueryBudgetExceeded(label, stats, max_queries)
+
+
+class QueryBudgetMiddleware:
+    """ASGI middleware counting statements per request against the route budget"""
+
+    def __init__(self, app, mode: str = None, default_budget: int = None):
+        self.app = app
+        self.mode = (mode or QUERY_BUDGET_MODE).lower()
+        self.default_budget = DEFAULT_QUERY_BUDGET if default_budget is None else default_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.mode == "off":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_stats.reset(token)
+
+        # The router stores the matched endpoint in the shared scope
+        endpoint = scope.get("endpoint")
+        budget = getattr(endpoint, "__query_budget__", self.default_budget)
+        label = f"{scope.get('method')} {scope.get('path')}"
+        check_budget(label, stats, budget, self.mode)
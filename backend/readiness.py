@@ -0,0 +1,155 @@
+"""Readiness probes for ``GET /ready``.
+
+``/health`` only says the process is up. ``/ready`` says whether this worker
+can serve traffic: the database answers, its connection pool is not
+saturated, MinIO answers, and the schema is at the Alembic head revision.
+A background task runs the probes every ``READY_CHECK_INTERVAL`` seconds and
+keeps the result in memory, so a load balancer polling ``/ready`` often
+adds no load on MySQL or MinIO. A result older than a few intervals counts
+as not ready (the probe loop itself is stuck).
+"""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import contextvars
+import logging
+import os
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import engine, replica_engine, replica_monitor
+from minio_client import minio_client
+
+logger = logging.getLogger(__name__)
+
+READY_CHECK_INTERVAL = float(os.getenv("READY_CHECK_INTERVAL", "5"))
+# Pool usage (checked-out / pool size + overflow) from which the worker reports not ready
+READY_POOL_SATURATION = float(os.getenv("READY_POOL_SATURATION", "0.9"))
+# A result older than this many intervals is treated as a failed check
+READY_STALE_INTERVALS = 3
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+def _head_revisions() -> set:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+def check_database() -> Dict[str, Any]:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {"ok": True}
+
+
+def check_pool() -> Dict[str, Any]:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return {"ok": True}  # Not a queue pool (e.g. in-memory SQLite)
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    in_use = pool.checkedout()
+    saturation = in_use / capacity if capacity else 0.0
+    return {
+        "ok": saturation < READY_POOL_SATURATION,
+        "checkedOut": in_use,
+        "capacity": capacity,
+        "saturation": round(saturation, 2),
+    }
+
+
+def check_minio() -> Dict[str, Any]:
+    # Straight to the client: the probe is what notices that MinIO is back
+    exists = minio_client.client.bucket_exists(minio_client.bucket_name)
+    return {"ok": exists, "breaker": minio_client.breaker.state, **({} if exists else {"error": "bucket missing"})}
+
+
+def check_migrations(heads: set) -> Dict[str, Any]:
+    with engine.connect() as conn:
+        try:
+            current = {row[0] for row in conn.execute(text("SELECT version_num FROM alembic_version"))}
+        except SQLAlchemyError:
+            # Tables created by init_data without Alembic (development)
+            return {"ok": True, "current": None, "head": sorted(heads)}
+    return {"ok": current == heads, "current": sorted(current), "head": sorted(heads)}
+
+
+def check_replica() -> Dict[str, Any]:
+    # Informational: reads fall back to the primary when the replica is unhealthy
+    replica_monitor.check()
+    return {"ok": True, "healthy": replica_monitor.healthy, "lag": replica_monitor.lag}
+
+
+class ReadinessMonitor:
+    """Runs the probes in the background and keeps the latest result"""
+
+    def __init__(self, interval: float = READY_CHECK_INTERVAL):
+        self.interval = interval
+        self.checks: Dict[str, Callable[[], Dict[str, Any]]] = {
+            "database": check_database,
+            "pool": check_pool,
+            "minio": check_minio,
+        }
+        try:
+            heads = _head_revisions()
+            self.checks["migrations"] = lambda: check_migrations(heads)
+        except Exception as e:
+            logger.warning("Alembic scripts unavailable; migration check disabled: %s", e)
+        if replica_engine is not None:
+            self.checks["replica"] = check_replica
+        self.result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            # Empty context: probe queries are not counted against a request
+            self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        async def probe(name: str, check: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(check)
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__}
+            result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+        names = list(self.checks)
+        results = await asyncio.gather(*(probe(name, self.checks[name]) for name in names))
+        checks = dict(zip(names, results))
+        ready = all(result["ok"] for result in checks.values())
+        if self.result is not None and ready != self.result["ready"]:
+            failing = [name for name, result in checks.items() if not result["ok"]]
+            if ready:
+                logger.warning("Worker ready again")
+            else:
+                logger.error("Worker not ready: %s", ", ".join(failing))
+        self.result = {"ready": ready, "checks": checks, "checkedAt": time.time()}
+        self._checked_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        """The latest result; not ready before the first run or when it is stale"""
+        if self.result is None:
+            return {"ready": False, "checks": {}, "checkedAt": None, "reason": "starting"}
+        age = time.monotonic() - self._checked_at
+        if age > self.interval * READY_STALE_INTERVALS:
+            return {**self.result, "ready": False, "reason": f"checks stale ({age:.0f}s old)"}
+        return self.result
+
+
+readiness = ReadinessMonitor()
@@ -0,0 +1,201 @@
+"""Pillow rendering of the printable observation diary (観察日記) report.
+
+Pure functions with picklable arguments so they can run in the job process
+pool; only Pillow is imported. A report is a list of A4 pages (150 dpi):
+the first page has the title and a growth chart, followed by one row per
+entry with its photo, date, weather icon, height, temperature and comment.
+"""
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+import logging
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = 1240, 1754  # A4 at 150 dpi
+DPI = 150
+MARGIN = 80
+ENTRY_HEIGHT = 230
+THUMBNAIL_SIZE = 200
+CHART_HEIGHT = 520
+
+INK = (40, 40, 40)
+MUTED = (130, 130, 130)
+RULE = (210, 210, 210)
+ACCENT = (46, 139, 87)
+
+WEATHER_LABELS = {"sunny": "晴れ", "cloudy": "くもり", "rainy": "雨", "thunder": "雷"}
+
+
+def load_font(path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            logger.warning("Report font %s not found; Japanese text will not render", path)
+    return ImageFont.load_default(size)
+
+
+def draw_weather_icon(draw: ImageDraw.ImageDraw, weather: str, x: int, y: int, size: int = 44):
+    """Simple vector icon in the box (x, y)-(x + size, y + size)"""
+    s = size
+    if weather == "sunny":
+        draw.ellipse((x + s * 0.2, y + s * 0.2, x + s * 0.8, y + s * 0.8), fill=(255, 179, 0))
+        for dx, dy in ((0.5, 0), (0.5, 1), (0, 0.5), (1, 0.5), (0.15, 0.15), (0.85, 0.15), (0.15, 0.85), (0.85, 0.85)):
+            cx, cy = x + s * dx, y + s * dy
+            draw.ellipse((cx - s * 0.05, cy - s * 0.05, cx + s * 0.05, cy + s * 0.05), fill=(255, 179, 0))
+        return
+    cloud = (150, 150, 160) if weather != "cloudy" else (175, 180, 190)
+    draw.ellipse((x + s * 0.05, y + s * 0.3, x + s * 0.55, y + s * 0.7), fill=cloud)
+    draw.ellipse((x + s * 0.3, y + s * 0.15, x + s * 0.8, y + s * 0.65), fill=cloud)
+    draw.rectangle((x + s * 0.25, y + s * 0.45, x + s * 0.95, y + s * 0.7), fill=cloud)
+    if weather == "rainy":
+        for dx in (0.3, 0.55, 0.8):
+            draw.line((x + s * dx, y + s * 0.78, x + s * (dx - 0.08), y + s * 0.98), fill=(30, 110, 220), width=3)
+    elif weather == "thunder":
+        bolt = [(0.55, 0.6), (0.4, 0.85), (0.52, 0.85), (0.45, 1.0), (0.7, 0.75), (0.57, 0.75), (0.65, 0.6)]
+        draw.polygon([(x + s * px, y + s * py) for px, py in bolt], fill=(255, 200, 0))
+
+
+def wrap_text(draw: ImageDraw.ImageDraw, text: str, font, width: int, max_lines: int) -> List[str]:
+    """Character-wise wrapping (Japanese has no spaces to break at)"""
+    lines: List[str] = []
+    for paragraph in (text or "").splitlines() or [""]:
+        line = ""
+        for char in paragraph:
+            if draw.textlength(line + char, font=font) > width:
+                lines.append(line)
+                line = char
+            else:
+                line += char
+        lines.append(line)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1][:-1] + "…"
+    return lines
+
+
+def draw_growth_chart(draw: ImageDraw.ImageDraw, entries: List[Dict[str, Any]], box, font):
+    """Height over the season as a line chart; dots are colored by weather"""
+    left, top, right, bottom = box
+    draw.rectangle(box, outline=RULE, width=2)
+    points = [(i, e["height"]) for i, e in enumerate(entries) if e.get("height") is not None]
+    if not points:
+        draw.text((left + 20, top + 20), "記録された高さがありません", font=font, fill=MUTED)
+        return
+
+    plot_left, plot_top, plot_right, plot_bottom = left + 90, top + 30, right - 30, bottom - 60
+    max_height = max(height for _, height in points) or 1
+    # Round the axis up to a multiple of 10 cm
+    axis_max = int(max_height // 10 + 1) * 10
+    # About five grid lines, 10 cm apart at least
+    for step in range(0, axis_max + 1, 10 * max(1, axis_max // 50)):
+        y = plot_bottom - (plot_bottom - plot_top) * step / axis_max
+        draw.line((plot_left, y, plot_right, y), fill=RULE, width=1)
+        draw.text((left + 15, y - 12), f"{step}cm", font=font, fill=MUTED)
+
+    span = max(len(entries) - 1, 1)
+    xy = [
+        (plot_left + (plot_right - plot_left) * index / span, plot_bottom - (plot_bottom - plot_top) * height / axis_max)
+        for index, height in points
+    ]
+    if len(xy) > 1:
+        draw.line(xy, fill=ACCENT, width=4, joint="curve")
+    colors = {"sunny": (255, 179, 0), "cloudy": (160, 165, 175), "rainy": (30, 110, 220), "thunder": (120, 60, 200)}
+    for (index, _), (x, y) in zip(points, xy):
+        color = colors.get(entries[index]["weather"], ACCENT)
+        draw.ellipse((x - 7, y - 7, x + 7, y + 7), fill=color, outline="white", width=2)
+
+    first, last = entries[0]["date"], entries[-1]["date"]
+    draw.text((plot_left, plot_bottom + 15), first, font=font, fill=MUTED)
+    draw.text((plot_right - draw.textlength(last, font=font), plot_bottom + 15), last, font=font, fill=MUTED)
+
+
+def _thumbnail(data: Optional[bytes]) -> Optional[Image.Image]:
+    if not data:
+        return None
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+            return image
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning("Skipping undecodable report photo: %s", e)
+        return None
+
+
+def render_pages(report: Dict[str, Any], thumbnails: List[Optional[bytes]], font_path: Optional[str]) -> List[Image.Image]:
+    """Pages of ``report`` ({"title", "subtitle", "entries": [...]}); ``thumbnails`` align with the entries"""
+    title_font = load_font(font_path, 52)
+    heading_font = load_font(font_path, 30)
+    body_font = load_font(font_path, 26)
+    small_font = load_font(font_path, 22)
+    entries = report["entries"]
+
+    pages: List[Image.Image] = []
+
+    def new_page():
+        page = Image.new("RGB", (PAGE_WIDTH, PAGE_HEIGHT), "white")
+        pages.append(page)
+        return page, ImageDraw.Draw(page)
+
+    page, draw = new_page()
+    draw.text((MARGIN, MARGIN), report["title"], font=title_font, fill=INK)
+    draw.text((MARGIN, MARGIN + 75), report["subtitle"], font=body_font, fill=MUTED)
+    chart_top = MARGIN + 140
+    draw.text((MARGIN, chart_top), "せいちょうグラフ", font=heading_font, fill=INK)
+    draw_growth_chart(draw, entries, (MARGIN, chart_top + 50, PAGE_WIDTH - MARGIN, chart_top + 50 + CHART_HEIGHT), small_font)
+    y = chart_top + 50 + CHART_HEIGHT + 40
+
+    text_left = MARGIN + THUMBNAIL_SIZE + 30
+    for entry, data in zip(entries, thumbnails):
+        if y + ENTRY_HEIGHT > PAGE_HEIGHT - MARGIN:
+            page, draw = new_page()
+            y = MARGIN
+        draw.line((MARGIN, y, PAGE_WIDTH - MARGIN, y), fill=RULE, width=2)
+        thumbnail = _thumbnail(data)
+        if thumbnail:
+            page.paste(thumbnail, (MARGIN + (THUMBNAIL_SIZE - thumbnail.width) // 2, y + 15))
+        else:
+            draw.rectangle((MARGIN, y + 15, MARGIN + THUMBNAIL_SIZE, y + 15 + THUMBNAIL_SIZE), outline=RULE, width=2)
+
+        draw.text((text_left, y + 18), entry["date"], font=heading_font, fill=INK)
+        icon_x = text_left + int(draw.textlength(entry["date"], font=heading_font)) + 25
+        draw_weather_icon(draw, entry["weather"], icon_x, y + 14)
+        facts = [WEATHER_LABELS.get(entry["weather"], entry["weather"]), f"{entry['temperature']:.1f}℃"]
+        if entry.get("height") is not None:
+            facts.append(f"たかさ {entry['height']:.1f}cm")
+        draw.text((icon_x + 60, y + 22), "  /  ".join(facts), font=body_font, fill=INK)
+        for line_no, line in enumerate(wrap_text(draw, entry.get("comment") or "", body_font,
+                                                 PAGE_WIDTH - MARGIN - text_left, 4)):
+            draw.text((text_left, y + 75 + line_no * 36), line, font=body_font, fill=INK)
+        y += ENTRY_HEIGHT
+
+    for number, page in enumerate(pages, 1):
+        footer = f"{number} / {len(pages)}"
+        footer_draw = ImageDraw.Draw(page)
+        footer_draw.text(
+            ((PAGE_WIDTH - footer_draw.textlength(footer, font=small_font)) / 2, PAGE_HEIGHT - MARGIN / 2 - 10),
+            footer, font=small_font, fill=MUTED
+        )
+    return pages
+
+
+def render_pdf(report: Dict[str, Any], thumbnails: List[Optional[bytes]], font_path: Optional[str]) -> bytes:
+    """The report as one PDF. Runs in a worker process."""
+    pages = render_pages(report, thumbnails, font_path)
+    output = BytesIO()
+    pages[0].save(output, "PDF", save_all=True, append_images=pages[1:], resolution=DPI, title=report["title"])
+    return output.getvalue()
+
+
+def render_png_pages(report: Dict[str, Any], thumbnails: List[Optional[bytes]], font_path: Optional[str]) -> List[bytes]:
+    """The report as one PNG per page. Runs in a worker process."""
+    pages = []
+    for page in render_pages(report, thumbnails, font_path):
+        output = BytesIO()
+        page.save(output, "PNG", optimize=True, dpi=(DPI, DPI))
+        pages.append(output.getvalue())
+    return pages
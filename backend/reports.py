@@ -0,0 +1,175 @@
+"""Printable observation diary (観察日記) reports.
+
+``POST /api/plants/{plant_id}/report`` collects one plant's entries for a
+season and names the output after a hash of everything it shows: every
+included record and plant record contributes its id and ``change_seq``,
+which changes on any edit (see ``delta_sync``). An existing report for that
+hash is returned at once; otherwise a ``plant_report`` job fetches the
+thumbnails, renders the pages in the process pool (``report_render``) and
+stores a PDF or one PNG per page; repeating the request while that job is
+pending returns the same job. Once stored, a report that still matches the
+current data removes the other reports of the same plant and season; one
+that was overtaken by an edit while rendering leaves them alone, so it
+cannot delete a newer report stored in the meantime.
+"""
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from minio.error import S3Error
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from jobs import job_runner
+from minio_client import minio_client
+from models import Diary, Plant, PlantRecord, Record
+from report_render import render_pdf, render_png_pages
+
+logger = logging.getLogger(__name__)
+
+REPORT_FONT_PATH = os.getenv("REPORT_FONT_PATH", "/usr/share/fonts/opentype/ipafont-gothic/ipagp.ttf")
+REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "1"))
+REPORT_FETCH_CONCURRENCY = int(os.getenv("REPORT_FETCH_CONCURRENCY", "8"))
+REPORT_THUMBNAIL_WIDTH = 320
+# Bump when the layout changes so existing reports are rendered again
+REPORT_LAYOUT_VERSION = 1
+
+REPORT_FORMATS = ("pdf", "png")
+REPORT_PREFIX = "report-"
+
+
+def report_data(db: Session, diary_id: int, plant: Plant, year: int) -> Dict[str, Any]:
+    """Title and entries of the plant's season, oldest first"""
+    rows = (
+        db.query(
+            Record.id, Record.change_seq.label("record_seq"), Record.record_date, Record.weather, Record.temperature,
+            PlantRecord.id.label("plant_record_id"), PlantRecord.change_seq.label("plant_record_seq"),
+            PlantRecord.height, PlantRecord.comment, PlantRecord.image_filename,
+        )
+        .join(PlantRecord, PlantRecord.record_id == Record.id)
+        .filter(
+            PlantRecord.diary_id == diary_id,
+            PlantRecord.plant_id == plant.id,
+            Record.record_date >= date(year, 1, 1),
+            Record.record_date <= date(year, 12, 31),
+        )
+        .order_by(Record.record_date)
+        .all()
+    )
+    diary_name = db.query(Diary.name).filter(Diary.id == diary_id).scalar() or ""
+    return {
+        "title": f"{plant.name}のかんさつ日記",
+        "subtitle": f"{diary_name}  {year}年",
+        "entries": [
+            {
+                "date": row.record_date.isoformat(),
+                "weather": row.weather.value,
+                "temperature": float(row.temperature),
+                "height": float(row.height) if row.height is not None else None,
+                "comment": row.comment or "",
+                "image": row.image_filename,
+                "versions": [row.id, row.record_seq, row.plant_record_id, row.plant_record_seq],
+            }
+            for row in rows
+        ],
+    }
+
+
+def report_stem(diary_id: int, plant_id: int, year: int) -> str:
+    return f"{REPORT_PREFIX}d{diary_id}-p{plant_id}-{year}-"
+
+
+def report_key(diary_id: int, plant_id: int, year: int, fmt: str, report: Dict[str, Any]) -> str:
+    """Object name prefix of the report; changes whenever an included row does"""
+    digest = hashlib.sha256(json.dumps(
+        {"layout": REPORT_LAYOUT_VERSION, "format": fmt, "title": report["title"], "subtitle": report["subtitle"],
+         "entries": [entry["versions"] for entry in report["entries"]]},
+        sort_keys=True,
+    ).encode("utf-8")).hexdigest()[:24]
+    return f"{report_stem(diary_id, plant_id, year)}{digest}"
+
+
+def report_urls(key: str, fmt: str, pages: Optional[int] = None) -> List[str]:
+    if fmt == "pdf":
+        return [f"/api/reports/{key}.pdf"]
+    return [f"/api/reports/{key}-{number}.png" for number in range(1, (pages or 0) + 1)]
+
+
+def stored_report(key: str, fmt: str) -> Optional[List[str]]:
+    """URLs of an already rendered report, ``None`` if there is none"""
+    if fmt == "pdf":
+        return report_urls(key, fmt) if minio_client.object_exists(f"{key}.pdf") else None
+    # Page 1 is stored last, so the set is complete once it exists
+    if not minio_client.object_exists(f"{key}-1.png"):
+        return None
+    names = [name for name in minio_client.list_object_names(f"{key}-") if name.endswith(".png")]
+    return report_urls(key, fmt, len(names))
+
+
+def current_report_key(diary_id: int, plant_id: int, year: int, fmt: str) -> Optional[str]:
+    """Key of the report for the data as it is now, ``None`` if the plant is gone"""
+    db = SessionLocal()
+    try:
+        plant = db.query(Plant).filter(Plant.id == plant_id, Plant.diary_id == diary_id).first()
+        if plant is None:
+            return None
+        return report_key(diary_id, plant_id, year, fmt, report_data(db, diary_id, plant, year))
+    finally:
+        db.close()
+
+
+async def render_report(job_id: str, params: Dict[str, Any], report_progress: Callable) -> Dict[str, Any]:
+    report, key, fmt = params["report"], params["key"], params["format"]
+    entries = report["entries"]
+
+    semaphore = asyncio.Semaphore(REPORT_FETCH_CONCURRENCY)
+    fetched = 0
+
+    async def fetch(filename: Optional[str]) -> Optional[bytes]:
+        nonlocal fetched
+        if not filename:
+            return None
+        async with semaphore:
+            try:
+                data = await asyncio.to_thread(minio_client.get_thumbnail, filename, REPORT_THUMBNAIL_WIDTH)
+            except S3Error as e:
+                logger.warning("Photo %s unavailable for report %s: %s", filename, key, e)
+                data = None
+        fetched += 1
+        if fetched % 5 == 0:
+            await report_progress(10 + 50 * fetched // len(entries))
+        return data
+
+    thumbnails = await asyncio.gather(*(fetch(entry["image"]) for entry in entries))
+    await report_progress(60)
+
+    if fmt == "pdf":
+        pdf = await job_runner.run_in_process(render_pdf, report, thumbnails, REPORT_FONT_PATH)
+        await asyncio.to_thread(minio_client.put_image, f"{key}.pdf", pdf, "application/pdf")
+        pages, size = None, len(pdf)
+    else:
+        images = await job_runner.run_in_process(render_png_pages, report, thumbnails, REPORT_FONT_PATH)
+        for number, image in reversed(list(enumerate(images, 1))):
+            await asyncio.to_thread(minio_client.put_image, f"{key}-{number}.png", image, "image/png")
+        pages, size = len(images), sum(map(len, images))
+    await report_progress(90)
+
+    # Same-format reports of older data for the same plant and season, only
+    # if this one is still current (otherwise a newer one may already exist)
+    diary_id, plant_id, year = params["diaryId"], params["plantId"], params["year"]
+    if await asyncio.to_thread(current_report_key, diary_id, plant_id, year, fmt) == key:
+        for name in await asyncio.to_thread(minio_client.list_object_names, report_stem(diary_id, plant_id, year)):
+            if name.endswith(f".{fmt}") and not name.startswith(key):
+                await asyncio.to_thread(minio_client.delete_image, name)
+    else:
+        logger.info("Report %s was overtaken by newer data; keeping other reports", key)
+
+    logger.info("Rendered report %s (%s, %d entries, %d bytes)", key, fmt, len(entries), size)
+    return {"urls": report_urls(key, fmt, pages), "entries": len(entries), "bytes": size}
+
+
+job_runner.register("plant_report", render_report, concurrency=REPORT_CONCURRENCY)
@@ -0,0 +1,192 @@
+"""Fail-fast behaviour when MySQL or MinIO is slow or down.
+
+- ``CircuitBreaker`` wraps calls to a dependency. After
+  ``failure_threshold`` consecutive connection failures or timeouts it opens
+  and rejects calls at once with ``ServiceUnavailable`` for
+  ``reset_timeout`` seconds; then a single trial call is let through
+  (half-open) and its outcome closes or re-opens the breaker.
+- ``DeadlineMiddleware`` answers 503 with ``Retry-After`` when a request has
+  not started its response within ``REQUEST_DEADLINE_SECONDS``. Only awaited
+  work can be cut short, so blocking calls are expected to carry their own
+  connect / read timeouts (see ``database`` and ``minio_client``).
+
+``ServiceUnavailable`` and database pool / connection errors (``is_transient``)
+are turned into 503 responses by the handlers in ``main``.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+# Retry-After sent when the database pool or connection gave out
+DB_RETRY_AFTER_SECONDS = int(os.getenv("DB_RETRY_AFTER_SECONDS", "5"))
+
+# pymysql client errors meaning the server is unreachable or stopped answering
+_CONNECTION_ERROR_CODES = {2003, 2006, 2013}
+
+
+class ServiceUnavailable(Exception):
+    """A dependency is failing; retry after ``retry_after`` seconds"""
+
+    def __init__(self, service: str, retry_after: int):
+        self.service = service
+        self.retry_after = retry_after
+        super().__init__(f"{service} unavailable; retry after {retry_after}s")
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker, usable as a context manager from any thread
+
+    Exceptions for which ``is_failure`` returns False (e.g. "no such key")
+    count as successful calls: the service answered.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0, is_failure=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure or (lambda exc: True)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> int:
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def allow(self) -> bool:
+        """True if a call may go through now (it must then be recorded)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.warning("%s recovered; circuit closed", self.name)
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(
+                        "%s failing (%d consecutive errors, last: %s); circuit open for %.0fs",
+                        self.name, self.failures, error, self.reset_timeout
+                    )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def __enter__(self):
+        if not self.allow():
+            raise ServiceUnavailable(self.name, self.retry_after())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None or not self.is_failure(exc):
+            self.record_success()
+        elif isinstance(exc, Exception):
+            self.record_failure(exc)
+        else:
+            # Cancelled or interrupted: no verdict on the service
+            with self._lock:
+                self._trial_running = False
+        return False
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors that mean "try again shortly" rather than a bug"""
+    if isinstance(exc, (ServiceUnavailable, PoolTimeoutError)):
+        return True
+    if isinstance(exc, OperationalError):
+        args = getattr(exc.orig, "args", ())
+        return exc.connection_invalidated or bool(args and args[0] in _CONNECTION_ERROR_CODES)
+    return False
+
+
+def retry_after_for(exc: BaseException) -> int:
+    return exc.retry_after if isinstance(exc, ServiceUnavailable) else DB_RETRY_AFTER_SECONDS
+
+
+def unavailable_body(message: str, code: str) -> bytes:
+    """Error body in the API's usual format (see ``main.create_error_response``)"""
+    return json.dumps(
+        {"success": False, "error": {"code": code, "message": message, "status_code": 503}},
+        ensure_ascii=False
+    ).encode("utf-8")
+
+
+class DeadlineMiddleware:
+    """503 + Retry-After for requests that have not responded within the deadline
+
+    Once the response has started it is left to finish, so event streams
+    and large downloads are not cut off.
+    """
+
+    def __init__(self, app, deadline: float = REQUEST_DEADLINE_SECONDS, retry_after: int = DB_RETRY_AFTER_SECONDS):
+        self.app = app
+        self.deadline = deadline
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.deadline <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        started = asyncio.Event()
+
+        async def send_tracking(message):
+            if message["type"] == "http.response.start":
+                started.set()
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, receive, send_tracking))
+        waiter = asyncio.ensure_future(started.wait())
+        try:
+            await asyncio.wait({task, waiter}, timeout=self.deadline, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            waiter.cancel()
+
+        if not task.done() and not started.is_set():
+            task.cancel()
+            # Retrieve the outcome so a late error is not reported as unhandled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            logger.warning("Request %s %s exceeded the %.0fs deadline", scope["method"], scope["path"], self.deadline)
+            body = unavailable_body("サーバーが混み合っています。しばらくしてから再度お試しください", "DEADLINE_EXCEEDED")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        await task
@@ -0,0 +1,86 @@
+"""Full-text search over observation comments.
+
+On MySQL the query uses the ``ft_plant_records_comment`` FULLTEXT index
+(ngram parser) and returns ranked hits plus the total hit count from a
+single statement; only a page past the end needs a second one to count the
+hits. Other databases (e.g. SQLite in the benchmarks) fall back to a
+``LIKE`` scan.
+"""
+from html import escape
+from typing import List, Tuple
+import re
+
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+
+from models import DEFAULT_DIARY_ID, Plant, PlantRecord, Record
+
+SNIPPET_RADIUS = 40
+
+
+def search_comments(db: Session, q: str, skip: int = 0, limit: int = 20,
+                    diary_id: int = DEFAULT_DIARY_ID) -> Tuple[List, int]:
+    """Return ``(rows, total)`` for the diary's comments matching ``q``, best match first"""
+    if db.get_bind().dialect.name == "mysql":
+        score = match(PlantRecord.comment, against=q).in_natural_language_mode()
+        condition = score
+    else:
+        score = literal(1.0)
+        condition = PlantRecord.comment.contains(q, autoescape=True)
+
+    base = (
+        db.query(PlantRecord)
+        .join(Record, Record.id == PlantRecord.record_id)
+        .join(Plant, Plant.id == PlantRecord.plant_id)
+        .filter(condition, PlantRecord.diary_id == diary_id)
+    )
+    rows = (
+        base.with_entities(
+            PlantRecord.id,
+            PlantRecord.record_id,
+            PlantRecord.comment,
+            PlantRecord.image_filename,
+            Record.record_date,
+            Plant.id.label("plant_id"),
+            Plant.name.label("plant_name"),
+            score.label("score"),
+            # Total hits in the same statement (window over the filtered set)
+            func.count().over().label("total"),
+        )
+        .order_by(score.desc(), Record.record_date.desc(), PlantRecord.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    if rows:
+        total = rows[0].total
+    elif skip > 0:
+        # Page past the end: the window has no row to report the total on
+        total = base.with_entities(func.count(PlantRecord.id)).scalar()
+    else:
+        total = 0
+    return rows, total
+
+
+def highlight_snippet(text: str, q: str, radius: int = SNIPPET_RADIUS) -> str:
+    """HTML-escaped excerpt around the first match with terms wrapped in <mark>"""
+    text = text or ""
+    terms = [t for t in q.split() if t]
+    if not terms:
+        return escape(text[: radius * 2])
+
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - radius) if first else 0
+    end = min(len(text), (first.end() if first else 0) + radius)
+    excerpt = text[start:end]
+
+    parts = []
+    last = 0
+    for m in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[last:m.start()]))
+        parts.append(f"<mark>{escape(m.group(0))}</mark>")
+        last = m.end()
+    parts.append(escape(excerpt[last:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(text) else "")
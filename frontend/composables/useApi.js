@@ -5,6 +5,8 @@ export const useApi = () => {
   let base = (config.public.apiBase || '').replace(/\/+$/, '')
   // collapse trailing repeated /api segments (e.g. "/api/api" -> "/api")
   base = base.replace(/(?:\/api)+$/, '/api')
+  // 対象の日記（未設定ならサーバー側の既定の日記）
+  const diaryHeaders = config.public.diaryId ? { 'X-Diary-Id': String(config.public.diaryId) } : {}
   
   // 統一されたエラーハンドリング
   const handleApiError = (error) => {
@@ -29,6 +31,10 @@ export const useApi = () => {
       return 'データが見つかりません'
     }
     
+    if (error.status === 412) {
+      return 'ほかの人が先にこの記録を更新しました。再読み込みしてください'
+    }
+    
     if (error.status === 400) {
       return '入力データに問題があります'
     }
@@ -55,6 +61,7 @@ export const useApi = () => {
           ...options,
           headers: {
             'Content-Type': 'application/json',
+            ...diaryHeaders,
             ...options.headers
           }
         })
@@ -94,6 +101,7 @@ export const useApi = () => {
         ...options,
         headers: {
           'Content-Type': 'application/json',
+          ...diaryHeaders,
           ...options.headers
         }
       })
@@ -111,6 +119,7 @@ export const useApi = () => {
       
       const response = await $fetch(`${base}/upload/image`, {
         method: 'POST',
+        headers: diaryHeaders,
         body: formData
       })
       return { data: response, error: null }
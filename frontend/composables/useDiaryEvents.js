@@ -0,0 +1,54 @@
+// 他の端末での変更をサーバー送信イベント（/api/events）で受け取る
+export const useDiaryEvents = (onChange, { debounceMs = 300 } = {}) => {
+  const config = useRuntimeConfig()
+  let base = (config.public.apiBase || '/api').replace(/\/+$/, '')
+  base = base.replace(/(?:\/api)+$/, '') + '/api'
+
+  let source = null
+  let timer = null
+  let pending = []
+
+  // 連続した変更はまとめて1回だけ通知する
+  const flush = () => {
+    const changes = pending
+    pending = []
+    timer = null
+    onChange(changes)
+  }
+
+  const connect = () => {
+    if (typeof window === 'undefined' || !window.EventSource || source) return
+    // 切断時は EventSource が Last-Event-ID 付きで自動再接続する
+    // EventSource はヘッダーを付けられないため日記はクエリで指定する
+    const diary = config.public.diaryId ? `?diary=${encodeURIComponent(config.public.diaryId)}` : ''
+    source = new EventSource(`${base}/events${diary}`)
+    source.onmessage = (event) => {
+      let change
+      try {
+        change = JSON.parse(event.data)
+      } catch {
+        return
+      }
+      pending.push(change)
+      if (!timer) {
+        timer = setTimeout(flush, debounceMs)
+      }
+    }
+  }
+
+  const disconnect = () => {
+    if (source) {
+      source.close()
+      source = null
+    }
+    if (timer) {
+      clearTimeout(timer)
+      timer = null
+    }
+  }
+
+  onMounted(connect)
+  onUnmounted(disconnect)
+
+  return { connect, disconnect }
+}
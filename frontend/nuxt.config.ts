@@ -7,6 +7,7 @@ export default defineNuxtConfig({
   runtimeConfig: {
     public: {
       apiBase: process.env.NUXT_PUBLIC_API_BASE || '/api',
+      diaryId: process.env.NUXT_PUBLIC_DIARY_ID || '',
       basicAuthUsername: process.env.NUXT_PUBLIC_BASIC_AUTH_USERNAME || 'plant_user',
       basicAuthPassword: process.env.NUXT_PUBLIC_BASIC_AUTH_PASSWORD || 'plant_pass123'
     }